@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""Measure the CPU time the RTP drainer burns against a local synthetic RTP sender.
+
+Run from the repository root with `uv run python scripts/bench_drainer.py`.
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import resource
+import socket
+import struct
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from dexonlinux.drainer import DRAIN_MODES, RtpDrainer  # noqa: E402
+
+# 7 MPEG-TS packets behind a 12-byte RTP header, as sent by WFD sources.
+PAYLOAD_SIZE = 7 * 188
+
+
+def send_rtp(port, rate, duration, ready, sent):
+    payload = bytes(PAYLOAD_SIZE)
+    sequence = 0
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        ready.wait()
+        start = time.monotonic()
+        deadline = start + duration
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                break
+            due = int((now - start) * rate)
+            timestamp = int((now - start) * 90000) & 0xFFFFFFFF
+            while sequence < due:
+                header = struct.pack("!BBHII", 0x80, 33, sequence & 0xFFFF, timestamp, 0x12345678)
+                try:
+                    sock.sendto(header + payload, ("127.0.0.1", port))
+                except OSError:
+                    pass
+                sequence += 1
+            time.sleep(0.001)
+    sent.value = sequence
+
+
+def cpu_seconds():
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_utime + usage.ru_stime
+
+
+def free_udp_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def bench(mode, rate, duration):
+    # The drainer reads on the event loop exactly as a session does; this process does nothing else meanwhile.
+    port = free_udp_port()
+    ready = multiprocessing.Event()
+    sent = multiprocessing.Value("q", 0)
+    sender = multiprocessing.Process(target=send_rtp, args=(port, rate, duration, ready, sent))
+    sender.start()
+
+    drainer = RtpDrainer(port, mode=mode, loop=asyncio.get_running_loop())
+    drainer.start()
+    cpu_before = cpu_seconds()
+    wall_before = time.monotonic()
+    ready.set()
+    await drainer.stream_started(duration)
+    while sender.is_alive():
+        await asyncio.sleep(0.1)
+    sender.join()
+    wall = time.monotonic() - wall_before
+    cpu = cpu_seconds() - cpu_before
+    drainer.stop()
+    return sent.value, wall, cpu, drainer.received_packets
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rates", type=int, nargs="+", default=[1000, 5000, 20000], help="Packets per second.")
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds per run.")
+    parser.add_argument("--modes", nargs="+", choices=DRAIN_MODES, default=list(DRAIN_MODES))
+    args = parser.parse_args(argv)
+
+    print(f"{'mode':<10}{'rate/s':>10}{'sent':>12}{'read':>12}{'cpu ms':>12}{'cpu %':>10}")
+    for rate in args.rates:
+        for mode in args.modes:
+            sent, wall, cpu, read = asyncio.run(bench(mode, rate, args.duration))
+            print(f"{mode:<10}{rate:>10}{sent:>12}{read:>12}{cpu * 1000:>12.1f}{cpu / wall * 100:>10.2f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
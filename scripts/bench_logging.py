@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""Compare DexOnLinux's logging setups by records per second and by the time a log call costs the caller.
+
+Setups:
+  per-record formatter  the former CustomFormatter, building a logging.Formatter for every record, written synchronously
+  precompiled           today's CustomFormatter with one Formatter per level, written synchronously
+  queue                 the bounded queue and writer thread configure_logger installs (console formatter as above)
+  queue + json          the same with the JSON-lines sink added
+
+The caller-side numbers are what a sinkctl PTY read or a scrcpy line pays before its events go out;
+end-to-end throughput includes the writer thread finishing. Use --slow-sink to make each write cost
+some microseconds, like a busy terminal, and see queue drops instead of a stalled caller.
+
+Run from the repository root with `uv run python scripts/bench_logging.py`.
+"""
+import argparse
+import logging
+import logging.handlers
+import os
+import queue
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from dexonlinux.utils import (  # noqa: E402
+    LOG_QUEUE_SIZE,
+    USER_LOG_FORMAT,
+    CustomFormatter,
+    DroppingQueueHandler,
+    JsonFormatter,
+    LogWriter,
+)
+
+# A typical sinkctl chunk after sanitizing.
+MESSAGE = "[CONNECT] Peer: 4e:66:41:aa:bb:cc@3\r\nNOTICE: SINK connected\r\n" * 3
+
+
+class PerRecordFormatter(CustomFormatter):
+    # The formatter as it was: a new logging.Formatter for every record.
+    def format(self, record):
+        return logging.Formatter(self.FORMATS.get(record.levelno, USER_LOG_FORMAT)).format(record)
+
+
+class Sink:
+    def __init__(self, delay_us):
+        self.delay = delay_us / 1e6
+        self.writes = 0
+        self._null = open(os.devnull, "w")
+
+    def write(self, text):
+        self.writes += 1
+        if self.delay:
+            deadline = time.perf_counter() + self.delay
+            while time.perf_counter() < deadline:
+                pass
+        return self._null.write(text)
+
+    def flush(self):
+        self._null.flush()
+
+
+def build(setup, sink, queue_size):
+    log = logging.getLogger(f"bench.{setup}")
+    log.handlers.clear()
+    log.propagate = False
+    log.setLevel(logging.INFO)
+    console = logging.StreamHandler(sink)
+    if setup == "per-record formatter":
+        console.setFormatter(PerRecordFormatter())
+        log.addHandler(console)
+        return log, None, None
+    console.setFormatter(CustomFormatter())
+    if setup == "precompiled":
+        log.addHandler(console)
+        return log, None, None
+    handlers = [console]
+    if setup == "queue + json":
+        json_handler = logging.StreamHandler(sink)
+        json_handler.setFormatter(JsonFormatter())
+        handlers.append(json_handler)
+    handler = DroppingQueueHandler(queue.Queue(queue_size))
+    listener = LogWriter(handler.queue, *handlers, respect_handler_level=True)
+    listener.start()
+    log.addHandler(handler)
+    return log, handler, listener
+
+
+def run(setup, records, delay_us, queue_size):
+    sink = Sink(delay_us)
+    log, handler, listener = build(setup, sink, queue_size)
+    costs = []
+    clock = time.perf_counter_ns
+    started = time.perf_counter()
+    for index in range(records):
+        before = clock()
+        log.info("miracle-sinkctl: %s (%d)", MESSAGE, index, extra={"source": "sinkctl"})
+        costs.append(clock() - before)
+    produced = time.perf_counter() - started
+    if listener is not None:
+        listener.stop()
+    total = time.perf_counter() - started
+    costs.sort()
+    return {
+        "caller_rate": records / produced,
+        "end_to_end_rate": records / total,
+        "p50_us": costs[len(costs) // 2] / 1e3,
+        "p99_us": costs[int(len(costs) * 0.99)] / 1e3,
+        "max_us": costs[-1] / 1e3,
+        "dropped": handler.dropped if handler else 0,
+        "written": sink.writes,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--records", type=int, default=100_000, help="Records per setup (default: 100000).")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per setup; the median is shown (default: 3).")
+    parser.add_argument("--slow-sink", type=float, default=0.0, metavar="US", help="Busy-wait this many microseconds per write.")
+    parser.add_argument("--queue-size", type=int, default=LOG_QUEUE_SIZE, help=f"Queue bound (default: {LOG_QUEUE_SIZE}).")
+    args = parser.parse_args()
+
+    print(f"{'setup':<22} {'caller rec/s':>13} {'e2e rec/s':>11} {'p50 us':>8} {'p99 us':>8} {'max us':>9} {'dropped':>8}")
+    for setup in ("per-record formatter", "precompiled", "queue", "queue + json"):
+        results = [run(setup, args.records, args.slow_sink, args.queue_size) for _ in range(args.repeat)]
+
+        def median(key):
+            return statistics.median(result[key] for result in results)
+
+        print(
+            f"{setup:<22} {median('caller_rate'):>13,.0f} {median('end_to_end_rate'):>11,.0f} {median('p50_us'):>8.2f} "
+            f"{median('p99_us'):>8.2f} {median('max_us'):>9.1f} {median('dropped'):>8,.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""Measure TsAnalyzer throughput over recorded WFD .ts captures.
+
+Record a capture from the sink port, for example with
+`ffmpeg -i rtp://0.0.0.0:<port> -c copy -f mpegts capture.ts`, and pass it as an argument.
+Without arguments a synthetic 30 fps H.264 + LPCM stream is generated instead.
+
+Run from the repository root with `uv run python scripts/bench_mpegts.py [capture.ts ...]`.
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from dexonlinux.mpegts import TS_PACKET_SIZE, TsAnalyzer  # noqa: E402
+
+# 7 TS packets per RTP datagram, as sent by WFD sources.
+DATAGRAM_SIZE = 7 * TS_PACKET_SIZE
+PMT_PID = 0x100
+VIDEO_PID = 0x1011
+AUDIO_PID = 0x1100
+
+
+def ts_packet(pid, counter, payload, unit_start=False, random_access=False):
+    header = bytearray([0x47, (0x40 if unit_start else 0) | pid >> 8, pid & 0xFF, 0x10 | counter & 0x0F])
+    stuffing = TS_PACKET_SIZE - 4 - len(payload)
+    if random_access or stuffing:
+        header[3] |= 0x20
+        adaptation = bytearray([max(stuffing - 1, 1) if random_access else stuffing - 1])
+        if adaptation[0]:
+            adaptation.append(0x40 if random_access else 0x00)
+            adaptation.extend(b"\xff" * (adaptation[0] - 1))
+        header += adaptation
+        payload = payload[: TS_PACKET_SIZE - len(header)]
+    return bytes(header + payload)
+
+
+def psi_section(table_id, body):
+    # Pointer field, section header, body and a CRC the analyzer does not check.
+    length = 5 + len(body) + 4
+    return bytes([0, table_id, 0xB0 | length >> 8, length & 0xFF, 0, 1, 0xC1, 0, 0]) + body + b"\0\0\0\0"
+
+
+def pes(stream_id, pts, data):
+    encoded = bytes([
+        0x21 | (pts >> 29) & 0x0E,
+        (pts >> 22) & 0xFF,
+        0x01 | (pts >> 14) & 0xFE,
+        (pts >> 7) & 0xFF,
+        0x01 | (pts << 1) & 0xFE,
+    ])
+    return b"\0\0\x01" + bytes([stream_id, 0, 0, 0x80, 0x80, 5]) + encoded + data
+
+
+def synthetic_stream(seconds=60, fps=30, gop=30, frame_size=12000):
+    counters = {}
+
+    def packets(pid, data, random_access=False):
+        chunk = TS_PACKET_SIZE - 4
+        first = True
+        while data:
+            counter = counters.get(pid, 0)
+            counters[pid] = (counter + 1) & 0x0F
+            yield ts_packet(pid, counter, data[:chunk], unit_start=first, random_access=random_access and first)
+            data = data[chunk:]
+            first = False
+
+    pat = psi_section(0x00, bytes([0, 1, 0xE0 | PMT_PID >> 8, PMT_PID & 0xFF]))
+    pmt = psi_section(0x02, bytes([
+        0xE0 | VIDEO_PID >> 8, VIDEO_PID & 0xFF, 0xF0, 0,
+        0x1B, 0xE0 | VIDEO_PID >> 8, VIDEO_PID & 0xFF, 0xF0, 0,
+        0x83, 0xE0 | AUDIO_PID >> 8, AUDIO_PID & 0xFF, 0xF0, 0,
+    ]))
+    out = bytearray()
+    for frame in range(seconds * fps):
+        if frame % fps == 0:
+            out += b"".join(packets(0, pat))
+            out += b"".join(packets(PMT_PID, pmt))
+        keyframe = frame % gop == 0
+        nal = b"\0\0\0\x01\x09\xf0\0\0\0\x01" + (b"\x65" if keyframe else b"\x41")
+        pts = frame * 90000 // fps
+        out += b"".join(packets(VIDEO_PID, pes(0xE0, pts, nal + bytes(frame_size)), random_access=keyframe))
+        out += b"".join(packets(AUDIO_PID, pes(0xBD, pts, bytes(960))))
+    return bytes(out)
+
+
+def bench(name, data, duration):
+    analyzer = TsAnalyzer()
+    buffer = bytearray(data)
+    end = len(buffer) - len(buffer) % TS_PACKET_SIZE
+    # Spread the datagrams over the capture length so the bitrate windows are meaningful.
+    step_ns = int(duration * 1e9) * DATAGRAM_SIZE // max(end, 1)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    arrival = 0
+    for offset in range(0, end, DATAGRAM_SIZE):
+        analyzer.feed(buffer, offset, min(offset + DATAGRAM_SIZE, end), arrival)
+        arrival += step_ns
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"{name}: {end / elapsed / 1e6:.1f} MB/s, {analyzer.packets / elapsed:.0f} TS packets/s, peak alloc {peak} B")
+    print(f"  {analyzer.summary()}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("captures", nargs="*", help="Recorded .ts files.")
+    parser.add_argument("--duration", type=float, default=60.0, help="Length of each capture in seconds.")
+    args = parser.parse_args(argv)
+
+    if not args.captures:
+        bench("synthetic", synthetic_stream(seconds=int(args.duration)), args.duration)
+    for path in args.captures:
+        with open(path, "rb") as capture:
+            bench(os.path.basename(path), capture.read(), args.duration)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""Replay DeX disconnect/reconnect sequences through ConnectionHandler and measure reconnect latency.
+
+Each scenario first brings a session up, then replays a sequence of sinkctl events with the
+given gaps while a local sender streams RTP to the handler's port, as the phone would.
+scrcpy is replaced by a `sleep` child started after a simulated cold start, so the numbers
+isolate DexOnLinux's own reconnect path.
+
+Reported per scenario and grace window: the time from the final `connected` event until
+scrcpy shows DeX again, and how many times scrcpy was (re)started.
+
+Run from the repository root with `uv run python scripts/bench_reconnect.py`.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from dexonlinux.commands import ScrcpyDisplay  # noqa: E402
+from dexonlinux.connection_handler import ConnectionHandler  # noqa: E402
+from dexonlinux.sinkctl import SinkctlEvent  # noqa: E402
+from dexonlinux.utils import get_logger  # noqa: E402
+
+CONNECT_SEQUENCE = ("peer_connected", "resolution", "connected")
+# Gaps in seconds between a disconnect and the following connect sequence.
+SCENARIOS = {
+    "link blip": [0.3],
+    "flapping link": [0.05, 0.05, 0.1, 0.05],
+    "slow reconnect": [2.0],
+    "phone left": [6.0],
+}
+
+
+class FakeCommands:
+    def __init__(self, cold_start):
+        self.cold_start = cold_start
+        self.spawned = 0
+        self.window_at = None
+
+    def list_adb_displays(self, device):
+        return [ScrcpyDisplay(0, "Built-in Screen", 1080, 2340), ScrcpyDisplay(2, "Dex Display", 1920, 1080)]
+
+    def list_scrcpy_displays(self, device):
+        return self.list_adb_displays(device)
+
+    def prepare_scrcpy_standby(self, device):
+        return True
+
+    async def run_scrcpy(self, device, *, display_id=None, fullscreen=False, profile=None, telemetry=None):
+        await asyncio.sleep(self.cold_start)
+        self.spawned += 1
+        self.window_at = time.perf_counter()
+        return subprocess.Popen(["sleep", "1000"])
+
+    def terminate_process(self, process, name, timeout=2.0):
+        if process is not None and process.poll() is None:
+            process.kill()
+            process.wait()
+
+
+def event(name):
+    if name == "resolution":
+        return SinkctlEvent(name, width=1920, height=1080, resolution="1920x1080")
+    return SinkctlEvent(name)
+
+
+async def stream_rtp(port, stop):
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sequence = 0
+        while not stop.is_set():
+            sock.sendto(bytes([0x80, 33]) + (sequence & 0xFFFF).to_bytes(2, "big") + bytes(1328), ("127.0.0.1", port))
+            sequence += 1
+            await asyncio.sleep(0.002)
+
+
+async def connect(handler):
+    for name in CONNECT_SEQUENCE:
+        handler.handle_sinkctl_event(event(name))
+        await asyncio.sleep(0.01)
+
+
+async def wait_streaming(handler, fake, since, timeout=10.0):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if handler.scrcpy_process is not None and handler.status()["state"] == "streaming":
+            return max(fake.window_at, since) - since
+        await asyncio.sleep(0.001)
+    return None
+
+
+async def replay(gaps, grace, cold_start):
+    fake = FakeCommands(cold_start)
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as probe:
+        probe.bind(("127.0.0.1", 0))
+        port = probe.getsockname()[1]
+    handler = ConnectionHandler(fake, "bench", port, standby=False, reconnect_grace=grace)
+    handler.prepare()
+    stop = asyncio.Event()
+    sender = asyncio.get_running_loop().create_task(stream_rtp(port, stop))
+    try:
+        await connect(handler)
+        await wait_streaming(handler, fake, time.perf_counter())
+        for gap in gaps:
+            handler.handle_sinkctl_event(event("disconnected"))
+            await asyncio.sleep(gap)
+            reconnect_at = time.perf_counter()
+            await connect(handler)
+        latency = await wait_streaming(handler, fake, reconnect_at)
+    finally:
+        stop.set()
+        await sender
+        await handler.close()
+    return latency, fake.spawned
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--grace", type=float, nargs="+", default=[0.0, ConnectionHandler.RECONNECT_GRACE], help="Grace windows to compare, in seconds.")
+    parser.add_argument("--cold-start", type=float, default=0.8, help="Simulated scrcpy cold start in seconds (default: 0.8).")
+    args = parser.parse_args()
+    get_logger().setLevel(logging.WARNING)
+
+    print(f"{'scenario':<16} {'grace':>6} {'reconnect ms':>13} {'scrcpy starts':>14}")
+    for scenario, gaps in SCENARIOS.items():
+        for grace in args.grace:
+            latency, spawned = asyncio.run(replay(gaps, grace, args.cold_start))
+            shown = f"{latency * 1e3:.1f}" if latency is not None else "timeout"
+            print(f"{scenario:<16} {grace:>5.1f}s {shown:>13} {spawned:>14}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+"""Drive whole DexOnLinux sessions against fake Miraclecast, adb, iw and scrcpy and time each phase.
+
+Stand-ins for sudo, systemctl, miracle-wifid, miracle-sinkctl, adb, iw and scrcpy
+(scripts/fake_tools.py) go first on PATH, the adb server is scripts/fake_adb_server.py, and
+/sys/class/net is replaced by a fake tree holding one P2P-capable interface, so this runs on any
+Linux box without a phone, a Wi-Fi adapter or root. Each run calls main.run non-interactively:
+the sudo password is supplied, the confirmation is skipped with --yes, and the fake
+miracle-sinkctl replays a sinkctl transcript with its recorded gaps while streaming synthetic RTP
+to DexOnLinux's port. Once the scenario is complete the scrcpy window is "closed", which ends
+the session the way a user would.
+
+Reported per phase, over all runs: p50, p90, p99 and max in milliseconds. Phases are taken from
+the session timeline (see --trace), except teardown, which runs from closing scrcpy until
+main.run returns.
+
+Built-in scenarios: connect (DeX connects once), reconnect (the link drops and comes back inside
+the reconnect grace window) and restart (it comes back after the window, so scrcpy restarts).
+--transcript replays another sinkctl transcript instead: either lines of "<gap seconds> <sinkctl
+line>", or a flight record saved by DexOnLinux (flight-*.log), which keeps the sinkctl output of a
+real session with its timing.
+
+With --check, the exit status is nonzero when a run fails, starts scrcpy an unexpected number of
+times or leaves the network services stopped, so it can gate CI.
+
+Run from the repository root with `uv run python scripts/bench_session.py`.
+"""
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import re
+import signal
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from fake_adb_server import FakeAdbServer  # noqa: E402
+
+from dexonlinux import commands as commands_module  # noqa: E402
+from dexonlinux import main as dexonlinux_main  # noqa: E402
+from dexonlinux.commands import CommandError, Commands  # noqa: E402
+from dexonlinux.recorder import get_recorder  # noqa: E402
+from dexonlinux.timeline import enable_tracing  # noqa: E402
+from dexonlinux.utils import configure_logger, get_logger  # noqa: E402
+
+FAKE_TOOLS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake_tools.py")
+TOOL_NAMES = ("sudo", "systemctl", "miracle-wifid", "miracle-sinkctl", "adb", "iw", "scrcpy")
+PASSWORD = "bench"
+INTERFACE = "wlp2s0"
+INTERFACE_INDEX = 3
+DEVICE = "R5CN1234567"
+PEER = "3@d2:6b:1a:44:90:31"
+SCRCPY_SERVER_SIZE = 90000
+
+# Seconds each stand-in takes, in the range seen on a laptop with a USB Wi-Fi adapter and a Galaxy phone.
+DELAYS = {
+    "systemctl": 0.12,
+    "wifid": 0.0,
+    "sinkctl_link": 0.04,
+    "iw": 0.003,
+    "adb": 0.02,
+    "sudo_check": 0.03,
+    "sudo_reject": 2.0,
+    "scrcpy_window": 0.35,
+    "scrcpy_frame": 0.12,
+}
+# A Galaxy phone's WFD stream: about 7.4 Mbit/s in 1328-byte datagrams.
+RTP_RATE = 700
+
+CONNECT = [
+    (1.0, f"[ADD]  Peer: {PEER}"),
+    (0.05, f"[PROV] Peer: {PEER} Type: pbc PIN: "),
+    (0.6, f"[CONNECT] Peer: {PEER}"),
+    (0.25, "SINK set resolution 1920x1080"),
+    (0.12, "NOTICE: SINK connected"),
+]
+DROP = [(1.0, f"[DISCONNECT] Peer: {PEER}"), (0.01, "SINK disconnected")]
+RECONNECT = [(0.05, f"[CONNECT] Peer: {PEER}"), (0.2, "SINK set resolution 1920x1080"), (0.1, "NOTICE: SINK connected")]
+
+# Transcript, then the timeline mark and how many of it mean the scenario is complete, and scrcpy launches expected.
+SCENARIOS = {
+    "connect": (CONNECT, ("scrcpy.first_frame", 1), 1),
+    "reconnect": (CONNECT + DROP + [(0.8, RECONNECT[0][1])] + RECONNECT[1:], ("dex.resumed", 1), 1),
+    "restart": (CONNECT + DROP + [(4.0, RECONNECT[0][1])] + RECONNECT[1:], ("scrcpy.first_frame", 2), 2),
+}
+FLIGHT_RECORD = re.compile(r"^(\d\d):(\d\d):(\d\d\.\d{3}) (\S+)\s+(.*)$")
+# With --transcript, how long the session must stay quiet before it counts as complete.
+QUIET_PERIOD = 1.0
+PHASES = ("startup", "network.disable", "sinkctl.start", "scrcpy.standby", "connect", "first_frame", "reconnect", "teardown", "total")
+
+
+def load_transcript(path):
+    lines = Path(path).read_text().splitlines()
+    if lines and lines[0].startswith("# DexOnLinux flight recorder"):
+        return flight_transcript(lines)
+    transcript = []
+    for line in lines:
+        if not line.strip() or line.startswith("#"):
+            continue
+        gap, _, text = line.partition(" ")
+        transcript.append((float(gap), text))
+    return transcript
+
+
+def flight_transcript(lines):
+    # Keeps the sinkctl output that followed the "run" command, with the gaps it arrived at.
+    records = []
+    for line in lines:
+        match = FLIGHT_RECORD.match(line)
+        if match:
+            hours, minutes, seconds, kind, text = match.groups()
+            records.append([int(hours) * 3600 + int(minutes) * 60 + float(seconds), kind, [text]])
+        elif line.startswith(" ") and records:
+            records[-1][2].append(line.strip())
+    transcript = []
+    sent = set()
+    previous = None
+    for at, kind, texts in records:
+        if kind != "sinkctl":
+            continue
+        if texts[0].startswith("> "):
+            sent.add(texts[0][2:])
+            if texts[0].startswith("> run "):
+                previous = at
+            continue
+        if previous is None:
+            continue
+        for text in texts:
+            # The PTY echoes the commands back; the fake sinkctl's own terminal does that again.
+            if text and text not in sent:
+                transcript.append((max(0.0, at - previous), text))
+                previous = at
+    return transcript
+
+
+def install_fakes(root, transcript, scale, adb_port):
+    bin_dir = root / "bin"
+    bin_dir.mkdir()
+    for name in TOOL_NAMES:
+        wrapper = bin_dir / name
+        wrapper.write_text(f'#!/bin/sh\nexec "{sys.executable}" "{FAKE_TOOLS}" {name} "$@"\n')
+        wrapper.chmod(0o755)
+
+    interface_dir = root / "sys" / "class" / "net" / INTERFACE
+    (interface_dir / "wireless").mkdir(parents=True)
+    (interface_dir / "phy80211").mkdir()
+    (interface_dir / "phy80211" / "name").write_text("phy0\n")
+    (interface_dir / "ifindex").write_text(f"{INTERFACE_INDEX}\n")
+    (interface_dir / "address").write_text("9c:b6:d0:11:22:33\n")
+    (root / "sys" / "class" / "net" / "lo").mkdir()
+
+    server_path = root / "scrcpy-server"
+    server_path.write_bytes(bytes(SCRCPY_SERVER_SIZE))
+
+    config = {
+        "call_log": str(root / "calls.log"),
+        "scale": scale,
+        "delays": DELAYS,
+        "password": PASSWORD,
+        "interfaces": {INTERFACE: {"ifindex": INTERFACE_INDEX, "phy": 0}},
+        "links": [str(INTERFACE_INDEX)],
+        "device": DEVICE,
+        "rtp_rate": RTP_RATE,
+        "transcript": transcript,
+    }
+    config_path = root / "fake_tools.json"
+    config_path.write_text(json.dumps(config))
+
+    os.environ["PATH"] = f"{bin_dir}{os.pathsep}{os.environ.get('PATH', '')}"
+    os.environ["FAKE_TOOLS_CONFIG"] = str(config_path)
+    os.environ["ANDROID_ADB_SERVER_PORT"] = str(adb_port)
+    os.environ["SCRCPY_SERVER_PATH"] = str(server_path)
+    for variable in ("XDG_CONFIG_HOME", "XDG_CACHE_HOME", "XDG_STATE_HOME"):
+        os.environ[variable] = str(root / variable.lower())
+
+    Commands.SYSFS_NET = root / "sys" / "class" / "net"
+    get_recorder().dump_dir = root / "flight"
+    return Path(config["call_log"])
+
+
+def no_nl80211():
+    raise OSError("nl80211 is not used by the session benchmark")
+
+
+def read_calls(call_log):
+    try:
+        return [(line.split(" ", 2) + [""])[1:3] for line in call_log.read_text().splitlines()]
+    except OSError:
+        return []
+
+
+def scrcpy_pids(calls):
+    return [int(details.split(" ", 1)[0][4:]) for tool, details in calls if tool == "scrcpy" and "--list-displays" not in details]
+
+
+class SessionDriver:
+    # Watches one run from a thread: waits for the scenario to complete, then closes scrcpy like a user would.
+    def __init__(self, timeline, call_log, done, hold, timeout):
+        self.timeline = timeline
+        self.call_log = call_log
+        self.done = done
+        self.hold = hold
+        self.timeout = timeout
+        self.closed_at = None
+        self.timed_out = False
+        self.finished = threading.Event()
+        self._thread = threading.Thread(target=self._drive, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def _complete(self):
+        if not any(details == "transcript-done" for tool, details in read_calls(self.call_log) if tool == "miracle-sinkctl"):
+            return False
+        if self.done is None:
+            # An arbitrary transcript is complete once nothing has happened for a while and no scrcpy is starting.
+            spawns = len(self.timeline.occurrences("scrcpy.spawn"))
+            latest = max((event[1] for event in self.timeline.events), default=0)
+            return spawns == len(self.timeline.occurrences("scrcpy.window")) and time.monotonic_ns() - latest > QUIET_PERIOD * 1e9
+        name, count = self.done
+        return len(self.timeline.occurrences(name)) >= count
+
+    def _drive(self):
+        deadline = time.monotonic() + self.timeout
+        while not self._complete():
+            if self.finished.wait(0.005):
+                return
+            if time.monotonic() > deadline:
+                self.timed_out = True
+                break
+        if self.finished.wait(self.hold):
+            return
+        self.closed_at = time.monotonic()
+        pids = scrcpy_pids(read_calls(self.call_log))
+        try:
+            os.kill(pids[-1], signal.SIGTERM)
+        except (IndexError, ProcessLookupError):
+            # Nothing to close; stop the session as CTRL+C would.
+            if not self.finished.is_set():
+                os.kill(os.getpid(), signal.SIGINT)
+
+
+def first_after(timeline, names, after):
+    starts = [start for name in names for start in timeline.occurrences(name) if start >= after]
+    return min(starts) if starts else None
+
+
+def span_ms(timeline, name):
+    spans = [(end - start) / 1e6 for event_name, start, end, _, _ in timeline.events if event_name == name and end is not None]
+    return spans[0] if spans else None
+
+
+def phase_times(timeline, launched_ns, closed_ns, returned_ns):
+    phases = {name: span_ms(timeline, name) for name in ("network.disable", "sinkctl.start", "scrcpy.standby")}
+    ready = first_after(timeline, ("startup.ready",), 0)
+    phases["startup"] = (ready - launched_ns) / 1e6 if ready else None
+    peer = first_after(timeline, ("dex.peer_connected",), 0)
+    window = first_after(timeline, ("scrcpy.window",), peer) if peer else None
+    phases["connect"] = (window - peer) / 1e6 if window else None
+    connected = first_after(timeline, ("dex.connected",), 0)
+    frame = first_after(timeline, ("scrcpy.first_frame",), connected) if connected else None
+    phases["first_frame"] = (frame - connected) / 1e6 if frame else None
+    dropped = first_after(timeline, ("dex.disconnected",), 0)
+    back = first_after(timeline, ("dex.peer_connected",), dropped) if dropped else None
+    shown = first_after(timeline, ("dex.resumed", "scrcpy.window"), back) if back else None
+    phases["reconnect"] = (shown - back) / 1e6 if shown else None
+    phases["teardown"] = (returned_ns - closed_ns) / 1e6 if closed_ns else None
+    phases["total"] = (returned_ns - launched_ns) / 1e6
+    return phases
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(fraction * len(ordered) + 0.5) - 1))]
+
+
+def run_session(args, call_log, done):
+    call_log.write_text("")
+    argv = ["--interface", INTERFACE, "--device", DEVICE, "--yes", "--no-banner", "--no-cache", "--reconnect-grace", str(args.grace)]
+    if args.no_standby:
+        argv.append("--no-standby")
+    session_args = dexonlinux_main.build_parser().parse_args(argv)
+    session_args.daemon = False
+    timeline = enable_tracing()
+    driver = SessionDriver(timeline, call_log, done, args.hold, args.timeout)
+    session_args.launched = time.monotonic()
+    launched_ns = time.monotonic_ns()
+    driver.start()
+    error = None
+    output = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output if not args.verbose else sys.stdout):
+            returncode = dexonlinux_main.run(session_args)
+    except CommandError as exc:
+        returncode, error = 1, str(exc)
+    finally:
+        returned_ns = time.monotonic_ns()
+        driver.finished.set()
+    if driver.timed_out:
+        error = error or f"scenario did not complete within {args.timeout:.0f} s"
+    elif returncode != 0 and error is None:
+        error = f"main.run returned {returncode}"
+    closed_ns = int(driver.closed_at * 1e9) if driver.closed_at else None
+    return timeline, phase_times(timeline, launched_ns, closed_ns, returned_ns), read_calls(call_log), error
+
+
+def check_session(timeline, calls, expected_launches):
+    problems = []
+    if len(timeline.occurrences("scrcpy.spawn")) != len(timeline.occurrences("scrcpy.window")):
+        problems.append("scrcpy never showed its window")
+    systemctl = [details for tool, details in calls if tool == "systemctl"]
+    stops = [index for index, details in enumerate(systemctl) if details.startswith("stop ")]
+    starts = [index for index, details in enumerate(systemctl) if details.startswith("start ")]
+    if not stops or not starts or starts[-1] < stops[-1]:
+        problems.append("network services were not restarted")
+    launches = len(scrcpy_pids(calls))
+    if expected_launches is not None and launches != expected_launches:
+        problems.append(f"scrcpy started {launches} times, expected {expected_launches}")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="connect", help="Built-in sinkctl transcript to replay (default: connect).")
+    parser.add_argument("--transcript", help="Replay this sinkctl transcript or flight record instead of a built-in scenario.")
+    parser.add_argument("--runs", type=int, default=20, help="Sessions to run (default: 20).")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply every recorded gap, tool delay and the reconnect grace by this (default: 1.0; 0 replays as fast as possible).")
+    parser.add_argument("--hold", type=float, default=0.2, help="Seconds to keep the session up once the scenario is complete (default: 0.2).")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Give up on a run after this many seconds (default: 30).")
+    parser.add_argument("--reconnect-grace", type=float, default=dexonlinux_main.ConnectionHandler.RECONNECT_GRACE, help="Passed to DexOnLinux.")
+    parser.add_argument("--no-standby", action="store_true", help="Passed to DexOnLinux.")
+    parser.add_argument("--check", action="store_true", help="Exit nonzero if any run fails or leaves the fake network stopped.")
+    parser.add_argument("--verbose", action="store_true", help="Show DexOnLinux's own output.")
+    args = parser.parse_args()
+
+    # The grace window shrinks with the transcript, so a gap keeps its meaning relative to it.
+    args.grace = args.reconnect_grace * args.scale if args.scale > 0 else args.reconnect_grace
+    if args.scale == 0 and not args.transcript and args.scenario != "connect":
+        parser.error(f"the {args.scenario} scenario depends on gaps against the grace window; use a --scale above 0")
+    if args.transcript:
+        transcript, done, expected_launches = load_transcript(args.transcript), None, None
+    else:
+        transcript, done, expected_launches = SCENARIOS[args.scenario]
+
+    configure_logger()
+    if not args.verbose:
+        get_logger().setLevel(logging.ERROR)
+
+    adb_server = FakeAdbServer()
+    adb_server.set_device(DEVICE, "device")
+    threading.Thread(target=adb_server.serve_forever, daemon=True).start()
+    dexonlinux_main.getpass.getpass = lambda prompt="": PASSWORD
+    commands_module.query_p2p_interfaces = no_nl80211
+
+    results = {phase: [] for phase in PHASES}
+    failures = 0
+    with tempfile.TemporaryDirectory(prefix="dexonlinux-bench-") as root:
+        call_log = install_fakes(Path(root), transcript, args.scale, adb_server.port)
+        for run in range(1, args.runs + 1):
+            timeline, phases, calls, error = run_session(args, call_log, done)
+            problems = ([error] if error else []) + (check_session(timeline, calls, expected_launches) if args.check else [])
+            if problems:
+                failures += 1
+                print(f"run {run}: {'; '.join(problems)}", file=sys.stderr)
+            for phase, value in phases.items():
+                if value is not None:
+                    results[phase].append(value)
+    adb_server.close()
+
+    name = Path(args.transcript).name if args.transcript else args.scenario
+    print(f"{name}: {args.runs} runs, time scale {args.scale:g}, {failures} failed")
+    print(f"{'phase':<16} {'runs':>5} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for phase in PHASES:
+        values = results[phase]
+        if not values:
+            continue
+        shown = " ".join(f"{percentile(values, fraction):>9.1f}" for fraction in (0.5, 0.9, 0.99))
+        print(f"{phase:<16} {len(values):>5} {shown} {max(values):>9.1f}")
+    return 1 if args.check and failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
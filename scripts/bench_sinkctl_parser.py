@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+"""Check and benchmark the streaming miracle-sinkctl output parser.
+
+Record a transcript by running miracle-sinkctl under `script -q -c ... session.raw`
+and pass the raw output files as arguments.
+Without arguments a synthetic transcript built from the lines DexOnLinux reacts to is used.
+
+Every transcript is first fed split at each possible byte boundary to prove that no event
+is lost or duplicated, then replayed in 4096-byte reads to measure throughput and latency.
+
+Run from the repository root with `uv run python scripts/bench_sinkctl_parser.py [transcript ...]`.
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from dexonlinux.sinkctl import SinkctlParser  # noqa: E402
+
+SYNTHETIC_TRANSCRIPT = (
+    "[ADD]  Link: 3\r\n"
+    "[sinkctl] # set-managed 3 yes\r\n"
+    "[sinkctl] # run 3\r\n"
+    "now running on link 3\r\n"
+    "[ADD]  Peer: 4e:66:41:aa:bb:cc@3\r\n"
+    "[PROV] Peer: 4e:66:41:aa:bb:cc@3 Type: pbc PIN: \r\n"
+    "[CONNECT] Peer: 4e:66:41:aa:bb:cc@3\r\n"
+    "now running on peer 4e:66:41:aa:bb:cc@3\r\n"
+    "NOTICE: SINK connected\r\n"
+    "SINK set resolution 1920x1080\r\n"
+    "[sinkctl] # \r"
+    "no longer running on peer 4e:66:41:aa:bb:cc@3\r\n"
+    "[DISCONNECT] Peer: 4e:66:41:aa:bb:cc@3\r\n"
+    "SINK disconnected\r\n"
+)
+
+
+def parse(chunks):
+    parser = SinkctlParser()
+    events = []
+    for chunk in chunks:
+        events.extend(parser.feed(chunk))
+    events.extend(parser.flush())
+    return [(event.name, sorted(event.data.items())) for event in events]
+
+
+def check_boundaries(text):
+    expected = parse([text])
+    for split in range(1, len(text)):
+        got = parse([text[:split], text[split:]])
+        if got != expected:
+            raise SystemExit(f"Split at byte {split} changed the events: {got} != {expected}")
+    return expected
+
+
+def bench(name, text, repeat, chunk_size=4096):
+    events = check_boundaries(text)
+    data = text * repeat
+    chunks = [data[i : i + chunk_size] for i in range(0, len(data), chunk_size)]
+
+    parser = SinkctlParser()
+    clock = time.perf_counter_ns
+    latencies = []
+    start = clock()
+    for chunk in chunks:
+        before = clock()
+        parser.feed(chunk)
+        latencies.append(clock() - before)
+    elapsed = (clock() - start) / 1e9
+    parser.flush()
+
+    latencies.sort()
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(
+        f"{name}: {len(events)} events, {len(data) / elapsed / 1e6:.1f} MB/s, "
+        f"per-read p50 {statistics.median(latencies) / 1e3:.1f} us, p99 {p99 / 1e3:.1f} us"
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("transcripts", nargs="*", help="Raw miracle-sinkctl output files.")
+    parser.add_argument("--repeat", type=int, default=2000, help="Times each transcript is replayed.")
+    args = parser.parse_args(argv)
+
+    if not args.transcripts:
+        bench("synthetic", SYNTHETIC_TRANSCRIPT, args.repeat)
+    for path in args.transcripts:
+        with open(path, encoding="utf-8", errors="replace", newline="") as transcript:
+            bench(os.path.basename(path), transcript.read(), args.repeat)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
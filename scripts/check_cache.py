@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""Check the profile cache against the cases that have broken warm starts before.
+
+Each check works on a fresh cache file in a temporary directory and fails with an
+AssertionError naming what went wrong.
+
+Run from the repository root with `uv run python scripts/check_cache.py`.
+"""
+import json
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from dexonlinux.cache import CACHE_TTL, ProfileCache  # noqa: E402
+
+
+def check_display_pairing(directory):
+    # A display chosen before DeX reported a resolution must not carry over to whatever resolution was cached before.
+    cache = ProfileCache(directory / "profiles.json")
+    cache.remember_device("S", display_id=2, sink_resolution="1920x1080")
+    assert cache.cached_display_id("S", "1920x1080") == 2, "display not remembered with its resolution"
+    cache.remember_device("S", display_id=5, sink_resolution=None)
+    assert cache.cached_display_id("S", "1920x1080") is None, "display 5 inherited the resolution display 2 was chosen at"
+    cache.remember_device("S", display_id=3, sink_resolution="2560x1440")
+    cache.remember_device("S")
+    assert ProfileCache(directory / "profiles.json").cached_display_id("S", "2560x1440") == 3, "a device-only update dropped the display"
+
+
+def check_malformed_entries(directory):
+    # One bad entry must not break lookups for the good ones, or raise in the middle of startup.
+    path = directory / "profiles.json"
+    path.write_text(
+        json.dumps(
+            {
+                "version": 1,
+                "interfaces": {"aa": "junk", "bb": {"phy": "phy0"}, "cc": {"name": "wlan0", "updated": "yesterday"}},
+                "devices": {"X": ["junk"], "S": {"display_id": 2, "sink_resolution": "1920x1080", "updated": time.time()}},
+                "last": {"interface": "aa", "device": ["junk"]},
+            }
+        )
+    )
+    cache = ProfileCache(path)
+    assert cache.cached_interface(lambda name: {"mac": "aa", "phy": "phy0"}) is None, "junk interface entry was used"
+    assert cache.cached_interface(lambda name: None, "wlan0") is None, "entry with a bad timestamp was used"
+    assert cache.last_device() is None, "junk last device was used"
+    assert cache.cached_display_id("X", "1920x1080") is None, "junk device entry was used"
+    assert cache.cached_display_id("S", "1920x1080") == 2, "a valid entry next to junk was dropped"
+    path.write_text(json.dumps({"version": 1, "interfaces": [], "devices": "junk", "last": None}))
+    assert ProfileCache(path).last_device() is None, "malformed sections were not replaced"
+
+
+def check_hit_refreshes(directory):
+    # An adapter found in the cache every day must not expire CACHE_TTL after it was last probed.
+    path = directory / "profiles.json"
+    cache = ProfileCache(path)
+    fingerprint = {"mac": "aa", "phy": "phy0", "ifindex": 3}
+    cache.remember_interface("wlan0", fingerprint)
+    cache._data["interfaces"]["aa"]["updated"] -= CACHE_TTL - 60
+    cache.save()
+    assert ProfileCache(path).cached_interface(lambda name: fingerprint) == "wlan0", "entry expired early"
+    assert time.time() - ProfileCache(path)._data["interfaces"]["aa"]["updated"] < 60, "a verified hit did not refresh the entry"
+
+
+CHECKS = (check_display_pairing, check_malformed_entries, check_hit_refreshes)
+
+
+def main():
+    for check in CHECKS:
+        with tempfile.TemporaryDirectory() as directory:
+            check(Path(directory))
+        print(f"{check.__name__}: ok")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""A fake adb server for exercising DexOnLinux's adb host-protocol client without a phone.
+
+It answers host:devices-l, host:track-devices(-l), host-serial:<serial>:get-state and
+host:transport:<serial> followed by shell:<command>, from a device table that can be
+changed while clients are tracking it.
+
+Run from the repository root with `uv run python scripts/fake_adb_server.py --check` to
+run the client against it, or without --check to serve on --port until interrupted
+(point DexOnLinux at it with ANDROID_ADB_SERVER_PORT).
+"""
+import argparse
+import os
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from dexonlinux.adb import AdbClient, AdbError  # noqa: E402
+from dexonlinux.commands import Commands  # noqa: E402
+
+DUMPSYS_DISPLAY = (
+    'mOverrideDisplayInfo=DisplayInfo{"Built-in Screen", displayId 0, real 1080 x 2340, largest app 2340 x 2340}\n'
+    'mOverrideDisplayInfo=DisplayInfo{"Dex Display", displayId 2, real 1920 x 1080, largest app 1920 x 1080}\n'
+)
+
+
+def _frame(text):
+    payload = text.encode()
+    return f"{len(payload):04x}".encode() + payload
+
+
+def _read_request(conn):
+    header = conn.recv(4, socket.MSG_WAITALL)
+    if len(header) < 4:
+        return None
+    return conn.recv(int(header, 16), socket.MSG_WAITALL).decode()
+
+
+class FakeAdbServer:
+    def __init__(self, port=0):
+        self.devices = {"R5CN1234567": ("unauthorized", "usb:1-2 transport_id:1")}
+        self.shell_output = {"dumpsys display": DUMPSYS_DISPLAY, "stat -c %s /data/local/tmp/scrcpy-server.jar": "90000\n"}
+        self._trackers = []
+        self._lock = threading.Lock()
+        self._server = socket.create_server(("127.0.0.1", port))
+        self.port = self._server.getsockname()[1]
+
+    def serve_forever(self):
+        while True:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def close(self):
+        self._server.close()
+
+    def device_list(self, long_format=True):
+        with self._lock:
+            lines = [f"{serial}\t{state} {description}" if long_format else f"{serial}\t{state}" for serial, (state, description) in self.devices.items()]
+        return "".join(line + "\n" for line in lines)
+
+    def set_device(self, serial, state, description="usb:1-2 transport_id:1"):
+        with self._lock:
+            self.devices[serial] = (state, description)
+            trackers = list(self._trackers)
+        for conn, long_format in trackers:
+            try:
+                conn.sendall(_frame(self.device_list(long_format)))
+            except OSError:
+                pass
+
+    def _handle(self, conn):
+        transport = None
+        try:
+            while True:
+                request = _read_request(conn)
+                if request is None:
+                    return
+                if request in ("host:devices", "host:devices-l"):
+                    conn.sendall(b"OKAY" + _frame(self.device_list(request.endswith("-l"))))
+                    return
+                if request in ("host:track-devices", "host:track-devices-l"):
+                    long_format = request.endswith("-l")
+                    conn.sendall(b"OKAY" + _frame(self.device_list(long_format)))
+                    with self._lock:
+                        self._trackers.append((conn, long_format))
+                    conn.recv(1)
+                    return
+                if request.startswith("host-serial:") and request.endswith(":get-state"):
+                    serial = request[len("host-serial:") : -len(":get-state")]
+                    if serial not in self.devices:
+                        conn.sendall(b"FAIL" + _frame(f"device '{serial}' not found"))
+                    else:
+                        conn.sendall(b"OKAY" + _frame(self.devices[serial][0]))
+                    return
+                if request.startswith("host:transport:"):
+                    transport = request[len("host:transport:") :]
+                    if transport not in self.devices:
+                        conn.sendall(b"FAIL" + _frame(f"device '{transport}' not found"))
+                        return
+                    conn.sendall(b"OKAY")
+                    continue
+                if request.startswith("shell:") and transport:
+                    conn.sendall(b"OKAY" + self.shell_output.get(request[len("shell:") :], "").encode())
+                    return
+                conn.sendall(b"FAIL" + _frame(f"unknown host service {request}"))
+                return
+        finally:
+            with self._lock:
+                self._trackers = [(tracker, long_format) for tracker, long_format in self._trackers if tracker is not conn]
+            conn.close()
+
+
+def check(server):
+    commands = Commands("", validate=False)
+    commands.adb = AdbClient(port=server.port)
+
+    devices = commands.list_adb_devices()
+    assert [(device.serial, device.state) for device in devices] == [("R5CN1234567", "unauthorized")], devices
+    print("host:devices-l          ok")
+
+    updates = []
+    authorized = threading.Event()
+
+    def on_change(updated):
+        updates.append(updated)
+        if any(device.is_authorized for device in updated):
+            authorized.set()
+
+    tracker = commands.watch_adb_devices(on_change)
+    started = time.perf_counter()
+    server.set_device("R5CN1234567", "device")
+    assert authorized.wait(2.0), "authorization change was not pushed"
+    latency_ms = (time.perf_counter() - started) * 1e3
+    assert commands.list_adb_devices()[0].is_authorized
+    print(f"host:track-devices-l    ok ({len(updates)} updates, authorization pushed in {latency_ms:.2f} ms)")
+
+    assert commands.adb.get_state("R5CN1234567") == "device"
+    try:
+        commands.adb.get_state("missing")
+    except AdbError as exc:
+        assert "not found" in str(exc)
+    else:
+        raise AssertionError("get-state on a missing device did not fail")
+    print("host-serial:get-state   ok")
+
+    displays = commands.list_adb_displays("R5CN1234567")
+    assert [display.display_id for display in displays] == [0, 2], displays
+    print("host:transport + shell  ok")
+
+    tracker.stop()
+    iterations = 200
+    started = time.perf_counter()
+    for _ in range(iterations):
+        commands.list_adb_devices()
+    print(f"list_adb_devices        {(time.perf_counter() - started) / iterations * 1e6:.0f} us per call over the socket")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=0, help="Port to serve on (default: any free port).")
+    parser.add_argument("--check", action="store_true", help="Run the DexOnLinux adb client against the fake server and exit.")
+    args = parser.parse_args()
+
+    server = FakeAdbServer(args.port)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    if args.check:
+        check(server)
+        server.close()
+        return
+    print(f"Fake adb server listening on 127.0.0.1:{server.port}")
+    try:
+        while True:
+            time.sleep(1.0)
+    except KeyboardInterrupt:
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
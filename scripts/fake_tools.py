@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""Scriptable stand-ins for sudo, systemctl, miracle-wifid, miracle-sinkctl, adb, iw and scrcpy.
+
+scripts/bench_session.py writes a small wrapper for each tool into a temporary directory that it
+puts first on PATH; each wrapper runs this file with the tool's name as first argument. The rest
+comes from the JSON file named by FAKE_TOOLS_CONFIG: per-tool delays, the fake interfaces and phone, and the sinkctl
+transcript to replay. While the transcript has DeX connected, miracle-sinkctl also streams
+synthetic RTP (MPEG-TS over RTP, as the phone sends it) to its --port. Every invocation is
+appended to the config's call log, which the harness reads back.
+
+Not meant to be run by hand.
+"""
+import json
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from dexonlinux.sinkctl import SinkctlParser  # noqa: E402
+
+TS_PACKETS_PER_DATAGRAM = 7
+VIDEO_PID = 0x1011
+RTP_CLOCK = 90000
+
+
+def load_config():
+    with open(os.environ["FAKE_TOOLS_CONFIG"]) as config_file:
+        return json.load(config_file)
+
+
+CONFIG = load_config()
+
+
+def delay(name):
+    time.sleep(CONFIG["delays"].get(name, 0.0) * CONFIG["scale"])
+
+
+def log_call(tool, *details):
+    # One short write per line with O_APPEND, so lines from concurrent tools never interleave.
+    with open(CONFIG["call_log"], "a") as call_log:
+        call_log.write(" ".join((f"{time.monotonic():.6f}", tool, *details)) + "\n")
+
+
+def sleep_until_terminated():
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    while True:
+        time.sleep(3600)
+
+
+def fake_sudo(args):
+    password = None
+    while args and args[0].startswith("-"):
+        option = args.pop(0)
+        if option == "-p":
+            args.pop(0)
+        elif option == "-S":
+            password = sys.stdin.readline().rstrip("\n")
+    if password is not None:
+        if password != CONFIG["password"]:
+            delay("sudo_reject")
+            print("Sorry, try again.", file=sys.stderr)
+            return 1
+        delay("sudo_check")
+    log_call("sudo", *args)
+    os.execvp(args[0], args)
+
+
+def fake_systemctl(args):
+    log_call("systemctl", *args)
+    delay("systemctl")
+    if args[:1] == ["is-active"]:
+        print("inactive")
+        return 3
+    return 0
+
+
+def fake_wifid(args):
+    log_call("miracle-wifid", *args)
+    delay("wifid")
+    sleep_until_terminated()
+
+
+def fake_iw(args):
+    log_call("iw", *args)
+    delay("iw")
+    if args[:1] == ["dev"] and args[1] in CONFIG["interfaces"]:
+        interface = CONFIG["interfaces"][args[1]]
+        print(f"Interface {args[1]}\n\tifindex {interface['ifindex']}\n\twiphy {interface['phy']}\n\ttype managed")
+        return 0
+    if args[:1] == ["phy"]:
+        print(f"Wiphy {args[1]}\n\tSupported interface modes:\n\t\t * managed\n\t\t * P2P-client\n\t\t * P2P-GO")
+        return 0
+    print("command failed: No such device (-19)", file=sys.stderr)
+    return 237
+
+
+def fake_adb(args):
+    # The adb server itself is the harness's FakeAdbServer; this covers the commands that are run as processes.
+    log_call("adb", *args)
+    delay("adb")
+    if args[:1] == ["devices"]:
+        print("List of devices attached")
+        print(f"{CONFIG['device']}\tdevice usb:1-2 product:dm1q model:SM_S911B transport_id:1")
+    return 0
+
+
+class RtpSender:
+    # Sends datagrams shaped like a WFD source's: an RTP header and seven 188-byte TS packets.
+    def __init__(self, port, rate):
+        self.port = port
+        self.rate = rate
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._send, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _send(self):
+        sequence = 0
+        continuity = 0
+        started = time.monotonic()
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            while not self._stop.is_set():
+                elapsed = time.monotonic() - started
+                # Sent in 10 ms bursts, as a Wi-Fi link delivers them.
+                while sequence < elapsed * self.rate:
+                    payload = bytearray()
+                    for _ in range(TS_PACKETS_PER_DATAGRAM):
+                        payload += bytes((0x47, VIDEO_PID >> 8, VIDEO_PID & 0xFF, 0x10 | continuity)) + bytes(184)
+                        continuity = (continuity + 1) & 0x0F
+                    timestamp = int(elapsed * RTP_CLOCK) & 0xFFFFFFFF
+                    header = bytes((0x80, 33)) + (sequence & 0xFFFF).to_bytes(2, "big") + timestamp.to_bytes(4, "big") + b"\x00\x00\xde\x5c"
+                    try:
+                        sock.sendto(header + payload, ("127.0.0.1", self.port))
+                    except OSError:
+                        pass
+                    sequence += 1
+                self._stop.wait(0.01)
+
+
+def fake_sinkctl(args):
+    port = int(args[args.index("--port") + 1])
+    log_call("miracle-sinkctl", *args)
+    delay("sinkctl_link")
+    for link in CONFIG["links"]:
+        print(f"[ADD]  Link: {link}", flush=True)
+    # The PTY is in canonical mode, so each command arrives as one line.
+    for line in sys.stdin:
+        if line.startswith("run "):
+            break
+
+    sender = RtpSender(port, CONFIG["rtp_rate"])
+    parser = SinkctlParser()
+    for gap, line in CONFIG["transcript"]:
+        time.sleep(gap * CONFIG["scale"])
+        print(line, flush=True)
+        for event in parser.feed(line + "\n"):
+            # The phone streams from the moment the peer is up until the link goes away.
+            if event.name == "peer_connected":
+                sender.start()
+            elif event.name == "disconnected":
+                sender.stop()
+    log_call("miracle-sinkctl", "transcript-done")
+    sleep_until_terminated()
+
+
+def fake_scrcpy(args):
+    log_call("scrcpy", f"pid={os.getpid()}", *args)
+    if "--list-displays" in args:
+        print("[server] INFO: List of displays:\n    --display-id=0    (1080x2340)\n    --display-id=2    (1920x1080)")
+        return 0
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print("scrcpy 2.4 <https://github.com/Genymobile/scrcpy>", flush=True)
+    delay("scrcpy_window")
+    print("INFO: Renderer: opengl", flush=True)
+    print("[server] INFO: Device: [samsung] samsung SM-S911B (Android 14)", flush=True)
+    delay("scrcpy_frame")
+    print("INFO: Texture: 1920x1080", flush=True)
+    while True:
+        time.sleep(1.0)
+        if "--print-fps" in args:
+            print("INFO: 60 fps", flush=True)
+
+
+TOOLS = {
+    "sudo": fake_sudo,
+    "systemctl": fake_systemctl,
+    "miracle-wifid": fake_wifid,
+    "miracle-sinkctl": fake_sinkctl,
+    "iw": fake_iw,
+    "adb": fake_adb,
+    "scrcpy": fake_scrcpy,
+}
+
+
+def main():
+    return TOOLS[sys.argv[1]](sys.argv[2:])
+
+
+if __name__ == "__main__":
+    sys.exit(main())
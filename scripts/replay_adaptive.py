@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""Replay scrcpy fps reports through the adaptive controller and show its decisions.
+
+Record a trace with `scrcpy --print-fps 2>&1 | tee scrcpy.log` and pass the log files as
+arguments; every "N fps (+M frames skipped)" line counts as one second. A recorded trace
+was captured at fixed settings, so the replay shows when the controller would have stepped,
+not how scrcpy would have behaved afterwards. No recorded traces ship with the repository;
+bring your own.
+
+Without arguments, synthetic hosts whose frame drops depend on the current level are
+simulated and checked: a weak decoder must settle on the first level it keeps up at, a short
+congestion must be undone, recurring congestion must stop costing relaunches, a static desktop
+must not look like headroom, and a host that only just copes must not flap. The check fails
+when a scenario ends on the wrong level or changes level more often than allowed.
+
+Run from the repository root with `uv run python scripts/replay_adaptive.py [trace ...]`.
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from dexonlinux.adaptive import LEVELS, AdaptiveController  # noqa: E402
+from dexonlinux.scrcpy_profiles import ScrcpyTuning  # noqa: E402
+from dexonlinux.telemetry import parse_fps_line  # noqa: E402
+
+
+def weak_decoder(level, second):
+    # Decodes about 32 frames per second: 60 fps drops frames until level 2 caps scrcpy at 30.
+    demand = 30 if level >= 2 else 60
+    return min(demand, 32), max(0, demand - 32)
+
+
+def congestion(level, second):
+    if 60 <= second < 80:
+        return 35, 25
+    return 60, 0
+
+
+def recurring_congestion(level, second):
+    # A crowded channel every few minutes: each burst costs a step down and the quiet after it a step up,
+    # until the session's change budget runs out.
+    if second % 400 < 20:
+        return 35, 25
+    return 60, 0
+
+
+def static_desktop(level, second):
+    if second < 30 and level == 0:
+        return 40, 20
+    return 2, 0
+
+
+def borderline(level, second):
+    # Keeps up only from level 1; level 0 drops a little more than the step-down threshold.
+    return (52, 8) if level == 0 else (60, 0)
+
+
+# name: (simulator, seconds, expected final level, most level changes allowed). Every change relaunches
+# scrcpy and so reopens its window; the limits are what a user would put up with.
+SCENARIOS = {
+    "weak decoder": (weak_decoder, 600, 2, 4),
+    "congestion": (congestion, 600, 0, 4),
+    "recurring": (recurring_congestion, 3600, 2, AdaptiveController.MAX_CHANGES),
+    "static desktop": (static_desktop, 300, 1, 1),
+    "borderline": (borderline, 1800, 1, 3),
+}
+
+
+def simulate(sample, seconds):
+    controller = AdaptiveController()
+    changes = []
+    for second in range(seconds):
+        level = controller.observe(*sample(controller.level, second))
+        if level is not None:
+            changes.append((second, level))
+    return controller, changes
+
+
+def replay(path):
+    controller = AdaptiveController()
+    samples = 0
+    changes = []
+    with open(path, errors="replace") as trace:
+        for line in trace:
+            sample = parse_fps_line(line)
+            if sample is None:
+                continue
+            samples += 1
+            level = controller.observe(*sample)
+            if level is not None:
+                changes.append((samples, level, sample))
+    return controller, samples, changes
+
+
+def describe_levels():
+    profile = ScrcpyTuning("balanced").select()
+    for level in range(len(LEVELS)):
+        controller = AdaptiveController()
+        controller.level = level
+        print(f"level {level}: {' '.join(controller.apply(profile).args())}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("traces", nargs="*", help="scrcpy --print-fps logs; synthetic hosts when omitted.")
+    args = parser.parse_args()
+
+    describe_levels()
+    print()
+    if args.traces:
+        for path in args.traces:
+            controller, samples, changes = replay(path)
+            print(f"{path}: {samples} fps reports, final level {controller.level}")
+            for second, level, (rendered, skipped) in changes:
+                print(f"  {second:>5} s  -> level {level}  ({rendered} fps, {skipped} skipped)")
+        return
+
+    print(f"{'scenario':<16} {'final':>5} {'changes':>8}  decisions (second -> level)")
+    for name, (sample, seconds, expected_level, max_changes) in SCENARIOS.items():
+        controller, changes = simulate(sample, seconds)
+        print(f"{name:<16} {controller.level:>5} {len(changes):>8}  {', '.join(f'{second}->{level}' for second, level in changes)}")
+        assert controller.level == expected_level, f"{name}: ended at level {controller.level}, expected {expected_level}"
+        assert len(changes) <= max_changes, f"{name}: {len(changes)} level changes, at most {max_changes} expected"
+
+
+if __name__ == "__main__":
+    main()
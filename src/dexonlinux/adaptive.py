@@ -0,0 +1,119 @@
+from collections import deque
+
+from dexonlinux.scrcpy_profiles import ScrcpyProfile, format_bit_rate, parse_bit_rate
+
+# scrcpy's own default when a profile leaves the bit rate unset.
+DEFAULT_BIT_RATE = 8_000_000
+
+# Each level is applied on top of the profile and only ever lowers what it asks for. Bit rate goes first
+# because it costs the least sharpness; frame rate and size follow once the decoder itself is the limit.
+LEVELS = (
+    {},
+    {"bit_rate_scale": 0.6},
+    {"bit_rate_scale": 0.6, "max_fps": 30},
+    {"bit_rate_scale": 0.4, "max_fps": 30, "max_size": 1280},
+    {"bit_rate_scale": 0.25, "max_fps": 24, "max_size": 960},
+)
+
+
+class AdaptiveController:
+    # Decides from scrcpy's per-second fps reports when to relaunch it with lighter or heavier settings.
+    # Every change closes and reopens the scrcpy window, so the hysteresis errs towards staying put: stepping
+    # down needs a few bad seconds, and longer after each step down in a row; stepping up needs a long clean
+    # and busy stretch; a step up that is quickly undone is not tried again; and after MAX_CHANGES changes
+    # in a session it only steps down, and only for a sustained shortfall.
+
+    # Seconds of output ignored after each launch; scrcpy skips frames while the decoder warms up.
+    SETTLE_SAMPLES = 5
+    # Step down when this share of frames was skipped over this many consecutive seconds. Each step down
+    # doubles the window for the next one, so a short burst of congestion costs one level, not all of them;
+    # a level that holds for UP_SAMPLES resets it.
+    DOWN_SAMPLES = 5
+    MAX_DOWN_SAMPLES = 20
+    DOWN_SKIP_RATIO = 0.10
+    # Step up after this many seconds with at most this share skipped. Each step costs a relaunch, and a capped
+    # scrcpy that keeps up proves little about the level above, so probing upwards is deliberately rare.
+    UP_SAMPLES = 120
+    UP_SKIP_RATIO = 0.01
+    # ...while the phone actually sent this many frames per second; a static desktop proves nothing.
+    UP_MIN_FPS = 15
+    # Level changes per session after which steps up stop and a step down needs a full minute in which every
+    # second skipped frames, so recurring bursts of congestion stop costing relaunches.
+    MAX_CHANGES = 6
+    SPENT_DOWN_SAMPLES = 60
+
+    def __init__(self, levels=LEVELS):
+        self.levels = levels
+        self.level = 0
+        # The lightest level a step up may return to; raised when a step up is quickly undone.
+        self.floor = 0
+        self.changes = 0
+        self.down_samples = self.DOWN_SAMPLES
+        self._samples = deque(maxlen=self.UP_SAMPLES)
+        self._settle = self.SETTLE_SAMPLES
+        self._bad_run = 0
+        self._last_step = None
+
+    def restart(self):
+        # Called for every scrcpy launch: samples from the previous process describe other settings.
+        self._samples.clear()
+        self._settle = self.SETTLE_SAMPLES
+        self._bad_run = 0
+
+    def observe(self, rendered, skipped):
+        # Returns the new level when scrcpy should be relaunched, otherwise None.
+        if self._settle > 0:
+            self._settle -= 1
+            return None
+        self._samples.append((rendered, skipped))
+        total = rendered + skipped
+        self._bad_run = self._bad_run + 1 if total and skipped / total >= self.DOWN_SKIP_RATIO else 0
+        held = len(self._samples) >= self.UP_SAMPLES
+        if held:
+            self.down_samples = self.DOWN_SAMPLES
+
+        if self.changes >= self.MAX_CHANGES:
+            if self.level < len(self.levels) - 1 and self._bad_run >= self.SPENT_DOWN_SAMPLES:
+                return self._step(+1)
+            return None
+
+        if self.level < len(self.levels) - 1 and len(self._samples) >= self.down_samples:
+            if self._skip_ratio(self.down_samples) >= self.DOWN_SKIP_RATIO:
+                if self._last_step == "up" and not held:
+                    self.floor = self.level + 1
+                self.down_samples = min(self.down_samples * 2, self.MAX_DOWN_SAMPLES)
+                return self._step(+1)
+
+        if self.level > self.floor and held:
+            frames = sum(rendered + skipped for rendered, skipped in self._samples)
+            if self._skip_ratio(self.UP_SAMPLES) <= self.UP_SKIP_RATIO and frames >= self.UP_MIN_FPS * len(self._samples):
+                return self._step(-1)
+        return None
+
+    def _skip_ratio(self, count):
+        recent = list(self._samples)[-count:]
+        skipped = sum(sample[1] for sample in recent)
+        total = sum(rendered + skipped for rendered, skipped in recent)
+        return skipped / total if total else 0.0
+
+    def _step(self, direction):
+        self.level += direction
+        self.changes += 1
+        self._last_step = "down" if direction > 0 else "up"
+        self.restart()
+        return self.level
+
+    def apply(self, profile):
+        if self.level == 0 or profile is None:
+            return profile
+        step = self.levels[self.level]
+        options = dict(profile.options)
+        if "bit_rate_scale" in step:
+            options["video_bit_rate"] = format_bit_rate(int(parse_bit_rate(options.get("video_bit_rate") or DEFAULT_BIT_RATE) * step["bit_rate_scale"]))
+        for key in ("max_fps", "max_size"):
+            if key in step:
+                options[key] = min(options.get(key) or step[key], step[key])
+        return ScrcpyProfile(profile.name, options, f"{profile.reason}, adaptive level {self.level}")
+
+    def status(self):
+        return {"level": self.level, "max_level": len(self.levels) - 1, "floor": self.floor, "changes": self.changes}
@@ -0,0 +1,174 @@
+import os
+import socket
+import threading
+
+from dexonlinux.utils import get_logger
+
+logger = get_logger()
+
+ADB_HOST = "127.0.0.1"
+ADB_DEFAULT_PORT = 5037
+CONNECT_TIMEOUT = 2.0
+READ_CHUNK_SIZE = 65536
+
+
+class AdbError(OSError):
+    pass
+
+
+def adb_server_port():
+    try:
+        return int(os.environ.get("ANDROID_ADB_SERVER_PORT", ADB_DEFAULT_PORT))
+    except ValueError:
+        return ADB_DEFAULT_PORT
+
+
+def encode_request(service):
+    payload = service.encode()
+    return f"{len(payload):04x}".encode() + payload
+
+
+def _read_exact(sock, size):
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            raise AdbError("adb server closed the connection.")
+        data.extend(chunk)
+    return bytes(data)
+
+
+def read_length_prefixed(sock):
+    prefix = _read_exact(sock, 4)
+    try:
+        length = int(prefix, 16)
+    except ValueError:
+        length = -1
+    if length < 0:
+        # Not an adb server on the other end, or a reply out of step; callers fall back to the adb CLI.
+        raise AdbError(f"Malformed adb length prefix {prefix!r}.")
+    return _read_exact(sock, length).decode(errors="replace")
+
+
+def read_status(sock):
+    status = _read_exact(sock, 4)
+    if status == b"OKAY":
+        return
+    if status == b"FAIL":
+        raise AdbError(read_length_prefixed(sock))
+    raise AdbError(f"Unexpected adb server reply {status!r}.")
+
+
+class AdbClient:
+    # Talks the adb host protocol directly, so listing devices or running a shell command spawns no adb process.
+    # The server closes one-shot host services after replying, so only the device tracker keeps a connection open;
+    # while it runs, device lists are served from its latest snapshot.
+    def __init__(self, host=ADB_HOST, port=None):
+        self.host = host
+        self.port = port or adb_server_port()
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    def connect(self):
+        sock = socket.create_connection((self.host, self.port), timeout=CONNECT_TIMEOUT)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    def _open_service(self, service, serial=None):
+        sock = self.connect()
+        try:
+            if serial is not None:
+                sock.sendall(encode_request(f"host:transport:{serial}"))
+                read_status(sock)
+            sock.sendall(encode_request(service))
+            read_status(sock)
+        except BaseException:
+            sock.close()
+            raise
+        return sock
+
+    def query(self, service, serial=None):
+        with self._open_service(service, serial) as sock:
+            return read_length_prefixed(sock)
+
+    def devices(self):
+        with self._lock:
+            snapshot = self._snapshot
+        if snapshot is not None:
+            return snapshot
+        return self.query("host:devices-l")
+
+    def get_state(self, serial):
+        return self.query(f"host-serial:{serial}:get-state")
+
+    def shell(self, serial, command, timeout=30.0):
+        with self._open_service(f"shell:{command}", serial) as sock:
+            sock.settimeout(timeout)
+            chunks = []
+            while True:
+                chunk = sock.recv(READ_CHUNK_SIZE)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+        return b"".join(chunks).decode(errors="replace")
+
+    def track_devices(self, on_change):
+        tracker = DeviceTracker(self, on_change)
+        tracker.start()
+        return tracker
+
+    def _set_snapshot(self, snapshot):
+        with self._lock:
+            self._snapshot = snapshot
+
+
+class DeviceTracker:
+    # The server pushes the whole device list on connect and again on every arrival, removal or state change.
+    def __init__(self, client, on_change):
+        self.client = client
+        self.on_change = on_change
+        self._socket = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        try:
+            self._socket = self.client._open_service("host:track-devices-l")
+        except AdbError:
+            # Servers older than the -l variant only report serial and state.
+            self._socket = self.client._open_service("host:track-devices")
+        self._socket.settimeout(None)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def stop(self):
+        self._stop.set()
+        self.client._set_snapshot(None)
+        if self._socket:
+            try:
+                self._socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._socket.close()
+            self._socket = None
+        if self._thread and self._thread.is_alive() and self._thread is not threading.current_thread():
+            self._thread.join(timeout=2.0)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                snapshot = read_length_prefixed(self._socket)
+            except (OSError, ValueError, AttributeError) as exc:
+                if not self._stop.is_set():
+                    logger.debug("adb device tracking stopped: %s", exc)
+                break
+            self.client._set_snapshot(snapshot)
+            try:
+                self.on_change(snapshot)
+            except Exception as exc:
+                logger.debug("ADB device change handler failed: %s", exc)
+        self.client._set_snapshot(None)
@@ -0,0 +1,146 @@
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+from dexonlinux.utils import get_logger
+
+logger = get_logger()
+
+CACHE_VERSION = 1
+# Entries not confirmed for this long are probed again.
+CACHE_TTL = 30 * 24 * 3600
+
+
+def default_cache_path():
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return Path(base) / "dexonlinux" / "profiles.json"
+
+
+class ProfileCache:
+    # Remembers what the last sessions learned about this host's adapters (keyed by MAC address)
+    # and about each phone (keyed by ADB serial), so warm starts can skip probing and prompts.
+    def __init__(self, path=None):
+        self.path = Path(path) if path else default_cache_path()
+        self._lock = threading.Lock()
+        self._data = self._empty()
+        self.load()
+
+    @staticmethod
+    def _empty():
+        return {"version": CACHE_VERSION, "interfaces": {}, "devices": {}, "last": {}}
+
+    def load(self):
+        try:
+            data = json.loads(self.path.read_text())
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as exc:
+            logger.debug("Ignoring unreadable profile cache %s: %s", self.path, exc)
+            return
+        if isinstance(data, dict) and data.get("version") == CACHE_VERSION:
+            self._data = self._valid(data)
+
+    @classmethod
+    def _valid(cls, data):
+        # A hand-edited or half-written file must cost a probe, not a crash: entries that are not what this
+        # module writes are dropped, and the rest is kept.
+        valid = cls._empty()
+        for section, required in (("interfaces", ("name", "updated")), ("devices", ("updated",))):
+            entries = data.get(section)
+            if not isinstance(entries, dict):
+                continue
+            for key, entry in entries.items():
+                if isinstance(entry, dict) and all(field in entry for field in required) and isinstance(entry["updated"], (int, float)):
+                    valid[section][key] = entry
+        if isinstance(data.get("last"), dict):
+            valid["last"] = {key: value for key, value in data["last"].items() if isinstance(value, str)}
+        return valid
+
+    def save(self):
+        with self._lock:
+            payload = json.dumps(self._data, indent=2, sort_keys=True)
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            temporary = self.path.with_suffix(".tmp")
+            fd = os.open(temporary, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w") as cache_file:
+                cache_file.write(payload)
+            os.replace(temporary, self.path)
+        except OSError as exc:
+            logger.debug("Could not write profile cache %s: %s", self.path, exc)
+
+    @staticmethod
+    def _fresh(entry):
+        return bool(entry) and time.time() - entry.get("updated", 0) < CACHE_TTL
+
+    def remember_interface(self, name, fingerprint, p2p=True):
+        if not fingerprint or not fingerprint.get("mac"):
+            return
+        with self._lock:
+            self._data["interfaces"][fingerprint["mac"]] = {
+                "name": name,
+                "phy": fingerprint.get("phy"),
+                "ifindex": fingerprint.get("ifindex"),
+                "p2p": p2p,
+                "updated": time.time(),
+            }
+            self._data["last"]["interface"] = fingerprint["mac"]
+        self.save()
+
+    def cached_interface(self, fingerprint_for, requested=None):
+        # fingerprint_for(name) reads the adapter's current MAC and phy; a mismatch means the hardware changed.
+        with self._lock:
+            interfaces = self._data["interfaces"]
+            if requested:
+                candidates = [(mac, entry) for mac, entry in interfaces.items() if entry.get("name") == requested]
+            else:
+                mac = self._data["last"].get("interface")
+                candidates = [(mac, interfaces[mac])] if mac in interfaces else []
+        for mac, entry in candidates:
+            if not self._fresh(entry) or not entry.get("p2p"):
+                continue
+            fingerprint = fingerprint_for(entry["name"])
+            if fingerprint and fingerprint.get("mac") == mac and fingerprint.get("phy") == entry.get("phy"):
+                # A verified hit confirms the entry, so an adapter in daily use never ages out.
+                self.remember_interface(entry["name"], fingerprint, p2p=True)
+                return entry["name"]
+        return None
+
+    def last_device(self):
+        with self._lock:
+            serial = self._data["last"].get("device")
+            entry = self._data["devices"].get(serial)
+        return serial if self._fresh(entry) else None
+
+    def remember_device(self, serial, **profile):
+        with self._lock:
+            entry = self._data["devices"].setdefault(serial, {})
+            entry.update({key: value for key, value in profile.items() if value is not None})
+            if profile.get("display_id") is not None:
+                # A display is only valid for the resolution it was chosen at, even an unknown one.
+                entry["sink_resolution"] = profile.get("sink_resolution")
+            entry["updated"] = time.time()
+            self._data["last"]["device"] = serial
+        self.save()
+
+    def cached_display_id(self, serial, sink_resolution):
+        # The chosen display only carries over while the phone reports the same DeX resolution; without a
+        # resolution there is nothing to compare, so the display is chosen afresh.
+        with self._lock:
+            entry = self._data["devices"].get(serial)
+        if not self._fresh(entry) or entry.get("display_id") is None:
+            return None
+        if not sink_resolution or entry.get("sink_resolution") != sink_resolution:
+            return None
+        return entry["display_id"]
+
+    def forget_display(self, serial):
+        with self._lock:
+            entry = self._data["devices"].get(serial)
+            if not entry:
+                return
+            entry.pop("display_id", None)
+            entry.pop("sink_resolution", None)
+        self.save()
@@ -1,16 +1,27 @@
+import asyncio
+import codecs
+import logging
 import os
 import re
 import shutil
 import socket
 import subprocess
-import threading
-import time
 from pathlib import Path
 
+from dexonlinux.adb import AdbClient
+from dexonlinux.eventloop import process_exited
+from dexonlinux.netlink import LinkMonitor, query_p2p_interfaces
+from dexonlinux.privileged import HelperError, PrivilegedHelper
+from dexonlinux.recorder import record
+from dexonlinux.sinkctl import SinkctlEvent, SinkctlParser
+from dexonlinux.timeline import mark, span
 from dexonlinux.utils import get_asset_path, get_logger
 
 logger = get_logger()
 
+SINKCTL_LOG_SOURCE = {"source": "sinkctl"}
+SCRCPY_LOG_SOURCE = {"source": "scrcpy"}
+
 
 class CommandError(RuntimeError):
     pass
@@ -50,6 +61,24 @@ class ScrcpyDisplay:
         suffix = f" - {' | '.join(details)}" if details else ""
         return f"display {self.display_id}{suffix}"
 
+    def score(self, sink_width=None, sink_height=None):
+        # Higher means more likely to be the DeX display streamed at sink_width x sink_height.
+        if not self.width or not self.height:
+            return 0
+        score = 0
+        if self.width > self.height:
+            score += 2
+        if sink_width and sink_height:
+            if sorted((self.width, self.height)) == sorted((sink_width, sink_height)):
+                score += 4
+            elif abs(max(self.width, self.height) / min(self.width, self.height) - max(sink_width, sink_height) / min(sink_width, sink_height)) < 0.02:
+                score += 2
+        if "dex" in self.description.lower():
+            score += 3
+        if self.display_id == 0:
+            score -= 3
+        return score
+
     def hint(self):
         if not self.width or not self.height:
             return ""
@@ -60,21 +89,29 @@ class ScrcpyDisplay:
         return ""
 
 
-class SinkctlEvent:
-    def __init__(self, name, **data):
-        self.name = name
-        self.data = data
-
-
 class Commands:
     REQUIRED_COMMANDS = ["sudo", "systemctl", "miracle-wifid", "miracle-sinkctl", "scrcpy", "adb", "iw"]
     NETWORK_SERVICES = ["NetworkManager", "wpa_supplicant"]
+    NETWORK_MODES = ("services", "interface")
+    INTERFACE_MODE_COMMANDS = ["nmcli", "busctl"]
     SUDO_PREFIX = ["sudo", "-S", "-p", ""]
-    SUDO_NON_INTERACTIVE_PREFIX = ["sudo", "-n"]
+    SINKCTL_LINK_TIMEOUT = 10.0
+    SCRCPY_WINDOW_TIMEOUT = 10.0
+    # scrcpy logs the renderer once its window exists and the texture size once the first frame is decoded.
+    SCRCPY_WINDOW_MARKER = "Renderer:"
+    SCRCPY_FIRST_FRAME_MARKER = "Texture:"
+    # Where scrcpy looks for its server when SCRCPY_SERVER_PATH is unset, and where it pushes it on the phone.
+    SCRCPY_SERVER_PATHS = ["/usr/local/share/scrcpy/scrcpy-server", "/usr/share/scrcpy/scrcpy-server"]
+    SCRCPY_SERVER_DEVICE_PATH = "/data/local/tmp/scrcpy-server.jar"
+    # Where network interfaces are listed; scripts/bench_session.py points it at a fake tree.
+    SYSFS_NET = Path("/sys/class/net")
 
     def __init__(self, sudo_password, validate=True):
-        self.sudo_password = sudo_password + "\n" if sudo_password else ""
-        self._sinkctl_master_fd = None
+        self.set_sudo_password(sudo_password)
+        # One PTY master per running miracle-sinkctl, keyed by its pid; sessions on other interfaces have their own.
+        self._sinkctl_master_fds = {}
+        self.adb = AdbClient()
+        self.helper = PrivilegedHelper()
         if validate:
             self.validate_environment()
 
@@ -82,118 +119,231 @@ class Commands:
         missing = self.missing_dependencies()
         if missing:
             raise CommandError("Missing dependencies: " + ", ".join(missing))
-        if not self.check_sudo_password():
+        if not self.start_privileged_helper():
             raise CommandError("Incorrect sudo password.")
 
+    def set_sudo_password(self, sudo_password):
+        self.sudo_password = sudo_password + "\n" if sudo_password else ""
+
     def missing_dependencies(self):
         return [cmd for cmd in self.REQUIRED_COMMANDS if shutil.which(cmd) is None]
 
-    def _build_command(self, command, sudo=False):
-        return [*self.SUDO_PREFIX, *command] if sudo else list(command)
-
-    def _build_non_interactive_sudo_command(self, command):
-        return [*self.SUDO_NON_INTERACTIVE_PREFIX, *command]
+    def _run_command(self, command, *, env=None):
+        return subprocess.run(list(command), capture_output=True, text=True, check=False, env=env)
 
-    def _run_command(self, command, *, sudo=False, env=None):
-        return subprocess.run(
-            self._build_command(command, sudo=sudo),
-            input=self.sudo_password if sudo else None,
-            capture_output=True,
-            text=True,
-            check=False,
-            env=env,
-        )
-
-    def _run_checked(self, command, *, sudo=False, env=None):
-        result = self._run_command(command, sudo=sudo, env=env)
+    def _run_checked(self, command, *, env=None):
+        result = self._run_command(command, env=env)
         if result.returncode != 0:
             output = self._combine_output(result).strip()
             raise CommandError(output or f"Command failed: {' '.join(command)}")
         return result
 
-    def _start_sudo_background_process(self, command, *, stdout, stderr, env=None):
-        process = subprocess.Popen(
-            self._build_command(command, sudo=True),
-            stdin=subprocess.PIPE,
-            stdout=stdout,
-            stderr=stderr,
-            text=True,
-            env=env,
-        )
-        if process.stdin:
-            process.stdin.write(self.sudo_password)
-            process.stdin.flush()
-        return process
+    def _privileged(self, operation, fds=(), **params):
+        try:
+            return self.helper.request(operation, fds, **params)
+        except HelperError as exc:
+            raise CommandError(str(exc)) from exc
+
+    def _privileged_checked(self, operation, **params):
+        result = self._privileged(operation, **params)
+        if result["returncode"] != 0:
+            raise CommandError(result["output"].strip() or f"Privileged {operation} request failed.")
+        return result
+
+    def _spawn_privileged(self, program, fds=(), **params):
+        try:
+            return self.helper.spawn(program, fds, **params)
+        except HelperError as exc:
+            raise CommandError(f"Could not start {program}: {exc}") from exc
 
     def _combine_output(self, result):
         return (result.stdout or "") + (result.stderr or "")
 
-    def _close_sinkctl_fd(self):
-        if self._sinkctl_master_fd is None:
+    def _close_sinkctl_fd(self, pid):
+        master_fd = self._sinkctl_master_fds.pop(pid, None)
+        if master_fd is None:
             return
         try:
-            os.close(self._sinkctl_master_fd)
+            asyncio.get_running_loop().remove_reader(master_fd)
+        except RuntimeError:
+            pass
+        try:
+            os.close(master_fd)
         except OSError:
             pass
-        self._sinkctl_master_fd = None
 
-    def _write_sinkctl_commands(self, master_fd, commands, delay=0.1):
+    def _write_sinkctl_commands(self, master_fd, commands):
+        # sinkctl reads the PTY line by line and runs each command synchronously, so they can be queued at once.
         for command in commands:
             os.write(master_fd, f"{command}\n".encode())
-            time.sleep(delay)
+            record("sinkctl", f"> {command}")
             logger.debug("Sent command to miracle-sinkctl: %s", command)
 
-    def check_sudo_password(self):
+    async def _wait_for_sinkctl_link(self, link_ready, interface_index, process, wifi_process=None):
+        sinkctl_exited = process_exited(process)
+        waiters = {link_ready, sinkctl_exited}
+        wifi_exited = None
+        if wifi_process is not None:
+            wifi_exited = process_exited(wifi_process)
+            waiters.add(wifi_exited)
+        try:
+            with span("sinkctl.wait_link", link=interface_index):
+                done, _ = await asyncio.wait(waiters, timeout=self.SINKCTL_LINK_TIMEOUT, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            for waiter in (sinkctl_exited, wifi_exited):
+                if waiter is not None and not waiter.done():
+                    waiter.cancel()
+        if wifi_exited in done:
+            raise CommandError("miracle-wifid exited immediately after startup.")
+        if not done:
+            logger.warning(
+                "miracle-sinkctl did not report link %s within %.0f s; sending commands anyway.",
+                interface_index,
+                self.SINKCTL_LINK_TIMEOUT,
+            )
+
+    def start_privileged_helper(self):
+        # sudo runs once, to start root_helper.py; every privileged step after that is a request on its socket,
+        # so the password is dropped here and an expiring sudo timestamp no longer matters.
         try:
-            result = self._run_command(["-k", "true"], sudo=True)
-            return result.returncode == 0
-        except FileNotFoundError:
+            with span("sudo.validate"):
+                return self.helper.start(self.SUDO_PREFIX, self.sudo_password)
+        except OSError:
             return False
+        finally:
+            self.sudo_password = ""
+
+    def close_privileged_helper(self):
+        self.helper.close()
 
     def disable_network_services(self):
-        self._run_checked(["systemctl", "stop", *self.NETWORK_SERVICES], sudo=True)
+        with span("network.disable"):
+            self._privileged_checked("services", action="stop", units=self.NETWORK_SERVICES)
         logger.info("Network services disabled.")
 
     def enable_network_services(self):
-        self._run_checked(["systemctl", "start", *self.NETWORK_SERVICES], sudo=True)
+        with span("network.enable"):
+            self._privileged_checked("services", action="start", units=self.NETWORK_SERVICES)
         logger.info("Network services restored.")
 
+    def release_interface(self, interface):
+        # Hands only this interface to Miraclecast: NetworkManager stops managing it and wpa_supplicant lets go
+        # of it, while every other connection stays up. The returned state is what restore_interface undoes.
+        missing = [cmd for cmd in self.INTERFACE_MODE_COMMANDS if shutil.which(cmd) is None]
+        if missing:
+            raise CommandError("Interface network mode needs: " + ", ".join(missing))
+        state = {"interface": interface, "nm_managed": False, "supplicant_removed": False, "supplicant_unit": None}
+        with span("network.release", interface=interface):
+            try:
+                if self._nm_manages(interface):
+                    self._privileged_checked("nm_managed", interface=interface, managed=False)
+                    state["nm_managed"] = True
+                unit = f"wpa_supplicant@{interface}.service"
+                if self._run_command(["systemctl", "is-active", "--quiet", unit]).returncode == 0:
+                    self._privileged_checked("services", action="stop", units=[unit])
+                    state["supplicant_unit"] = unit
+                # Unmanaging normally makes NetworkManager remove the interface from wpa_supplicant; check anyway.
+                path = self._wpa_supplicant_interface_path(interface)
+                if path:
+                    self._privileged_checked("supplicant", method="RemoveInterface", path=path)
+                    state["supplicant_removed"] = True
+            except CommandError:
+                try:
+                    self.restore_interface(state)
+                except CommandError as exc:
+                    logger.error("Could not undo the partial release of %s: %s", interface, exc)
+                raise
+        logger.info("Released %s from NetworkManager and wpa_supplicant; other connections stay up.", interface)
+        return state
+
+    def restore_interface(self, state):
+        interface = state["interface"]
+        with span("network.restore", interface=interface):
+            if state.get("supplicant_unit"):
+                self._privileged_checked("services", action="start", units=[state["supplicant_unit"]])
+            elif state.get("supplicant_removed") and not state.get("nm_managed"):
+                # Re-managing below makes NetworkManager add the interface back itself.
+                self._privileged_checked("supplicant", method="CreateInterface", interface=interface)
+            if state.get("nm_managed"):
+                self._privileged_checked("nm_managed", interface=interface, managed=True)
+        logger.info("Returned %s to its previous network management.", interface)
+
+    def _nm_manages(self, interface):
+        result = self._run_command(["nmcli", "-t", "-f", "DEVICE,STATE", "device", "status"])
+        if result.returncode != 0:
+            return False
+        for line in result.stdout.splitlines():
+            device, _, device_state = line.rpartition(":")
+            if device.replace("\\:", ":") == interface:
+                return device_state != "unmanaged"
+        return False
+
+    def _wpa_supplicant_interface_path(self, interface):
+        # wpa_supplicant's D-Bus policy only answers root.
+        result = self._privileged("supplicant", method="GetInterface", interface=interface)
+        if result["returncode"] != 0:
+            return None
+        # busctl prints: o "/fi/w1/wpa_supplicant1/Interfaces/3"
+        match = re.search(r'"([^"]+)"', result["output"])
+        return match.group(1) if match else None
+
     def start_miracle_wifi(self, interface):
-        command = ["miracle-wifid", "--interface", interface]
-        process = self._start_sudo_background_process(command, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
-        time.sleep(0.2)
+        # miracle-wifid owns a single D-Bus name, so one instance serves every session. With several
+        # interfaces it is started without --interface and manages the links Miraclecast's udev rule tags.
+        interfaces = [interface] if isinstance(interface, str) else list(interface)
+        interface = ", ".join(interfaces)
+        # Readiness is confirmed later, when miracle-sinkctl sees the link that wifid exposes.
+        with span("wifid.start", interface=interface):
+            process = self._spawn_privileged("miracle-wifid", interface=interfaces[0] if len(interfaces) == 1 else None)
         if process.poll() is not None:
             raise CommandError("miracle-wifid exited immediately after startup.")
+        record("process", f"miracle-wifid started, pid {process.pid}")
         logger.info("miracle-wifid started on %s.", interface)
         return process
 
-    def start_miracle_sinkctl(self, interface_index, port, event_callback=None):
+    async def start_miracle_sinkctl(self, interface_index, port, event_callback=None, wifi_process=None):
         if interface_index is None:
             raise CommandError("No Miraclecast interface index available.")
 
         sinkctl_commands = [f"set-managed {interface_index} yes", f"run {interface_index}"]
-        command = ["miracle-sinkctl", "--external-player", "true", "--port", str(port), "--audio", "1"]
-
-        master_fd, slave_fd = os.openpty()
-        try:
-            process = subprocess.Popen(
-                self._build_non_interactive_sudo_command(command),
-                stdin=slave_fd,
-                stdout=slave_fd,
-                stderr=slave_fd,
-                close_fds=True,
-            )
-        finally:
-            os.close(slave_fd)
+        loop = asyncio.get_running_loop()
 
-        self._sinkctl_master_fd = master_fd
-        threading.Thread(target=self._drain_sinkctl_output, args=(master_fd, event_callback), daemon=True).start()
+        with span("sinkctl.start", port=port):
+            master_fd, slave_fd = os.openpty()
+            try:
+                # The helper gets the PTY slave over the socket and runs miracle-sinkctl as root on it.
+                process = self._spawn_privileged("miracle-sinkctl", fds=[slave_fd], port=port)
+            except CommandError:
+                os.close(master_fd)
+                raise
+            finally:
+                os.close(slave_fd)
+            record("process", f"miracle-sinkctl started on port {port}, pid {process.pid}")
+
+            link = str(interface_index)
+            link_ready = loop.create_future()
+
+            def on_event(event):
+                if event.name == "link_added" and event.data.get("link") == link and not link_ready.done():
+                    link_ready.set_result(True)
+                if event_callback:
+                    event_callback(event)
+
+            self._sinkctl_master_fds[process.pid] = master_fd
+            os.set_blocking(master_fd, False)
+            decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+            loop.add_reader(master_fd, self._read_sinkctl_output, loop, master_fd, decoder, SinkctlParser(), on_event)
 
-        time.sleep(0.2)
-        self._write_sinkctl_commands(master_fd, sinkctl_commands)
+            try:
+                await self._wait_for_sinkctl_link(link_ready, interface_index, process, wifi_process)
+            except CommandError:
+                self.terminate_process(process, "miracle-sinkctl")
+                self._close_sinkctl_fd(process.pid)
+                raise
+            self._write_sinkctl_commands(master_fd, sinkctl_commands)
 
         if process.poll() is not None:
-            self._close_sinkctl_fd()
+            self._close_sinkctl_fd(process.pid)
             raise CommandError("miracle-sinkctl exited immediately after startup.")
 
         logger.info("miracle-sinkctl started on UDP port %s.", port)
@@ -208,8 +358,28 @@ class Commands:
             raise CommandError(f"Could not find an available UDP port: {exc}") from exc
 
     def get_p2p_interfaces(self):
+        with span("interfaces.probe"):
+            try:
+                return [interface.name for interface in query_p2p_interfaces()]
+            except OSError as exc:
+                logger.debug("nl80211 query failed (%s); probing interfaces with iw.", exc)
+            return self._probe_p2p_interfaces_with_iw()
+
+    def watch_p2p_interfaces(self, on_change):
+        def refresh(events):
+            on_change(self.get_p2p_interfaces())
+
+        monitor = LinkMonitor(refresh)
+        try:
+            monitor.start()
+        except OSError as exc:
+            logger.debug("Cannot watch network interfaces: %s", exc)
+            return None
+        return monitor
+
+    def _probe_p2p_interfaces_with_iw(self):
         p2pwifi = []
-        base_dir = Path("/sys/class/net")
+        base_dir = self.SYSFS_NET
 
         for iface_path in base_dir.iterdir():
             if not (iface_path / "wireless").exists():
@@ -236,16 +406,51 @@ class Commands:
                 logger.debug("Unable to inspect interface %s: %s", iface, exc)
         return p2pwifi
 
+    def interface_fingerprint(self, interface):
+        base = self.SYSFS_NET / interface
+        try:
+            return {
+                "mac": (base / "address").read_text().strip(),
+                "phy": (base / "phy80211" / "name").read_text().strip(),
+                "ifindex": int((base / "ifindex").read_text().strip()),
+            }
+        except (OSError, ValueError):
+            return None
+
     def get_interface_index(self, interface):
         try:
-            return int((Path("/sys/class/net") / interface / "ifindex").read_text().strip())
+            return int((self.SYSFS_NET / interface / "ifindex").read_text().strip())
         except OSError as exc:
             raise CommandError(f"Could not read interface index for {interface}: {exc}") from exc
 
     def list_adb_devices(self):
-        result = self._run_checked(["adb", "devices", "-l"])
+        with span("adb.devices"):
+            try:
+                return self.parse_adb_devices(self.adb.devices())
+            except OSError as exc:
+                # Also the path that starts the adb server when it is not running yet.
+                logger.debug("adb server query failed (%s); running adb devices.", exc)
+                result = self._run_checked(["adb", "devices", "-l"])
         return self.parse_adb_devices(self._combine_output(result))
 
+    def watch_adb_devices(self, on_change):
+        def refresh(snapshot):
+            on_change(self.parse_adb_devices(snapshot))
+
+        try:
+            return self.adb.track_devices(refresh)
+        except OSError as exc:
+            logger.debug("Cannot track adb devices: %s", exc)
+            return None
+
+    def adb_shell(self, selected_device, command):
+        try:
+            return self.adb.shell(selected_device, " ".join(command))
+        except OSError as exc:
+            logger.debug("adb server shell failed (%s); running adb shell.", exc)
+            result = self._run_checked(["adb", "-s", selected_device, "shell", *command])
+        return self._combine_output(result)
+
     @staticmethod
     def parse_adb_devices(output):
         devices = []
@@ -263,9 +468,62 @@ class Commands:
         return devices
 
     def list_scrcpy_displays(self, selected_device):
-        result = self._run_checked(["scrcpy", "-s", selected_device, "--list-displays"])
+        with span("scrcpy.list_displays"):
+            result = self._run_checked(["scrcpy", "-s", selected_device, "--list-displays"])
         return self.parse_scrcpy_displays(self._combine_output(result))
 
+    def find_scrcpy_server(self):
+        override = os.environ.get("SCRCPY_SERVER_PATH")
+        candidates = [override] if override else list(self.SCRCPY_SERVER_PATHS)
+        scrcpy_path = shutil.which("scrcpy")
+        if scrcpy_path and not override:
+            # Portable release archives ship the server next to the binary.
+            candidates.insert(0, os.path.join(os.path.dirname(os.path.realpath(scrcpy_path)), "scrcpy-server"))
+        for candidate in candidates:
+            if os.path.isfile(candidate) and os.access(candidate, os.R_OK):
+                return candidate
+        return None
+
+    def prepare_scrcpy_standby(self, selected_device):
+        # Warms everything scrcpy needs that outlives a single launch: the adb server, the device transport
+        # and a writable copy of the server on the phone, so a broken setup fails before DeX connects.
+        with span("scrcpy.standby", device=selected_device):
+            self._run_checked(["adb", "start-server"])
+            try:
+                state = self.adb.get_state(selected_device).strip()
+            except OSError as exc:
+                state = str(exc)
+            if state != "device":
+                raise CommandError(f"ADB device {selected_device} is {state or 'unavailable'}.")
+            server_path = self.find_scrcpy_server()
+            if server_path is None:
+                logger.debug("scrcpy server not found locally; leaving the push to scrcpy.")
+                return False
+            self._run_checked(["adb", "-s", selected_device, "push", server_path, self.SCRCPY_SERVER_DEVICE_PATH])
+            pushed_size = self.adb_shell(selected_device, ["stat", "-c", "%s", self.SCRCPY_SERVER_DEVICE_PATH]).strip()
+            if pushed_size != str(os.path.getsize(server_path)):
+                raise CommandError(f"scrcpy server copy on {selected_device} is incomplete ({pushed_size} bytes).")
+        return True
+
+    def list_adb_displays(self, selected_device):
+        # dumpsys does not start the scrcpy server on the phone, so it is cheap enough to run ahead of time.
+        with span("adb.list_displays"):
+            output = self.adb_shell(selected_device, ["dumpsys", "display"])
+        return self.parse_dumpsys_displays(output)
+
+    @staticmethod
+    def parse_dumpsys_displays(output):
+        displays = {}
+        pattern = re.compile(r'DisplayInfo\{"(?P<name>[^"]*)", displayId (?P<id>\d+).*?\breal (?P<width>\d+) x (?P<height>\d+)')
+        for match in pattern.finditer(output):
+            display_id = int(match.group("id"))
+            width = int(match.group("width"))
+            height = int(match.group("height"))
+            description = f"{match.group('name')} {width}x{height}"
+            # Override info comes after the base info and reflects the current rotation and mode.
+            displays[display_id] = ScrcpyDisplay(display_id, description, width, height)
+        return [displays[display_id] for display_id in sorted(displays)]
+
     @staticmethod
     def parse_scrcpy_displays(output):
         displays = []
@@ -284,38 +542,14 @@ class Commands:
 
     @staticmethod
     def parse_sinkctl_events(text):
-        events = []
-        clean_text = text.replace("\r", "\n")
-        resolution = re.search(r"SINK set resolution\s+(\d{3,5})x(\d{3,5})", clean_text)
-        if resolution:
-            width = int(resolution.group(1))
-            height = int(resolution.group(2))
-            events.append(SinkctlEvent("resolution", width=width, height=height, resolution=f"{width}x{height}"))
-
-        peer_connected_patterns = (
-            "[CONNECT] Peer:",
-            "now running on peer",
-        )
-        connected_patterns = ("NOTICE: SINK connected",)
-        disconnected_patterns = (
-            "no longer running on peer",
-            "no longer running on link",
-            "Transport endpoint is not connected",
-            "SINK disconnected",
-        )
-
-        if any(pattern in clean_text for pattern in peer_connected_patterns):
-            events.append(SinkctlEvent("peer_connected"))
-        if any(pattern in clean_text for pattern in connected_patterns):
-            events.append(SinkctlEvent("connected"))
-        if any(pattern in clean_text for pattern in disconnected_patterns):
-            events.append(SinkctlEvent("disconnected"))
-        return events
+        parser = SinkctlParser()
+        return parser.feed(text) + parser.flush()
 
     def terminate_process(self, process, name, timeout=2.0):
         if process is None or process.poll() is not None:
             return
         logger.debug("Stopping %s.", name)
+        record("process", f"stopping {name}, pid {process.pid}")
         process.terminate()
         try:
             process.wait(timeout=timeout)
@@ -324,10 +558,12 @@ class Commands:
             process.kill()
             process.wait(timeout=timeout)
 
-    def close_sinkctl(self):
-        self._close_sinkctl_fd()
+    def close_sinkctl(self, process=None):
+        pids = [process.pid] if process is not None else list(self._sinkctl_master_fds)
+        for pid in pids:
+            self._close_sinkctl_fd(pid)
 
-    def run_scrcpy(self, selected_device, *, display_id=None, fullscreen=False):
+    async def run_scrcpy(self, selected_device, *, display_id=None, fullscreen=False, profile=None, telemetry=None):
         icon_path = get_asset_path("icon.png")
         scrcpy_env = os.environ.copy()
         if os.path.isfile(icon_path):
@@ -338,51 +574,112 @@ class Commands:
             args.append("--fullscreen")
         if display_id is not None:
             args.extend(["--display-id", str(display_id)])
-
+        if profile is not None:
+            args.extend(profile.args())
+            logger.debug("scrcpy profile %s: %s", profile.describe(), " ".join(profile.args()))
+        if telemetry is not None:
+            args.append("--print-fps")
+
+        loop = asyncio.get_running_loop()
+        mark("scrcpy.spawn", display_id=display_id, profile=profile.name if profile else None)
         process = subprocess.Popen(
             ["scrcpy", *args],
             stdout=subprocess.PIPE,
             stderr=subprocess.STDOUT,
-            text=True,
             env=scrcpy_env,
         )
+        record("process", f"scrcpy started, pid {process.pid}: {' '.join(args)}")
 
-        if process.stdout:
-            threading.Thread(target=self._stream_scrcpy_output, args=(process,), daemon=True).start()
+        window_ready = loop.create_future()
+        output = ScrcpyOutput(self, window_ready, telemetry)
+        stdout_fd = process.stdout.fileno()
+        os.set_blocking(stdout_fd, False)
+        loop.add_reader(stdout_fd, output.read, loop, process.stdout)
 
-        time.sleep(0.2)
+        exited = process_exited(process)
+        try:
+            with span("scrcpy.wait_window"):
+                done, _ = await asyncio.wait({window_ready, exited}, timeout=self.SCRCPY_WINDOW_TIMEOUT, return_when=asyncio.FIRST_COMPLETED)
+        except asyncio.CancelledError:
+            # The session ended while scrcpy was starting; nobody else holds this process.
+            process.terminate()
+            raise
+        finally:
+            if not exited.done():
+                exited.cancel()
+        if not done:
+            logger.debug("scrcpy did not report its window within %.0f s.", self.SCRCPY_WINDOW_TIMEOUT)
         if process.poll() is not None:
             raise CommandError("scrcpy exited immediately after startup.")
         return process
 
-    def _stream_scrcpy_output(self, process):
-        if not process.stdout:
+    def _read_sinkctl_output(self, loop, master_fd, decoder, parser, event_callback=None):
+        try:
+            chunk = os.read(master_fd, 4096)
+        except BlockingIOError:
             return
-
-        for line in iter(process.stdout.readline, ""):
-            text = line.rstrip("\n")
-            if text:
-                logger.debug("scrcpy: %s", text)
-
-        process.stdout.close()
-
-    def _sanitize_sinkctl_output(self, text):
-        password = self.sudo_password.strip()
-        if password:
-            text = text.replace(password, "[sudo password hidden]")
-        return text
-
-    def _drain_sinkctl_output(self, master_fd, event_callback=None):
-        while True:
-            try:
-                chunk = os.read(master_fd, 4096)
-                if not chunk:
-                    break
-                text = self._sanitize_sinkctl_output(chunk.decode(errors="replace")).strip()
-                if text:
-                    logger.debug("miracle-sinkctl: %s", text)
-                    if event_callback:
-                        for event in self.parse_sinkctl_events(text):
-                            event_callback(event)
-            except OSError:
-                break
+        except OSError:
+            # EIO on the PTY master means miracle-sinkctl and every process holding the slave are gone.
+            chunk = b""
+        if not chunk:
+            loop.remove_reader(master_fd)
+            if event_callback:
+                for event in parser.flush():
+                    event_callback(event)
+            return
+        text = decoder.decode(chunk)
+        record("sinkctl", text)
+        # Events go out before the chunk is logged, so a debug log never delays them.
+        if event_callback:
+            for event in parser.feed(text):
+                event_callback(event)
+        if logger.isEnabledFor(logging.DEBUG) and text.strip():
+            logger.debug("miracle-sinkctl: %s", text.strip(), extra=SINKCTL_LOG_SOURCE)
+
+
+class ScrcpyOutput:
+    # Loop reader for scrcpy's stdout: logs it line by line, records when the window and first frame appear
+    # and feeds every line to the launch's ScrcpyTelemetry.
+    def __init__(self, commands, window_ready=None, telemetry=None):
+        self.commands = commands
+        self.window_ready = window_ready
+        self.telemetry = telemetry
+        self._decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._pending = ""
+        self._first_output = True
+        self._first_frame = True
+
+    def read(self, loop, stdout):
+        try:
+            chunk = os.read(stdout.fileno(), 4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            chunk = b""
+        if not chunk:
+            loop.remove_reader(stdout.fileno())
+            if self._pending:
+                self._line(self._pending)
+                self._pending = ""
+            stdout.close()
+            return
+        if self._first_output:
+            mark("scrcpy.first_output")
+            self._first_output = False
+        lines = (self._pending + self._decoder.decode(chunk)).split("\n")
+        self._pending = lines.pop()
+        for line in lines:
+            self._line(line.rstrip("\r"))
+
+    def _line(self, text):
+        record("scrcpy", text)
+        if self.window_ready is not None and not self.window_ready.done() and self.commands.SCRCPY_WINDOW_MARKER in text:
+            mark("scrcpy.window")
+            self.window_ready.set_result(True)
+        if self._first_frame and self.commands.SCRCPY_FIRST_FRAME_MARKER in text:
+            mark("scrcpy.first_frame")
+            self._first_frame = False
+        if self.telemetry is not None and self.telemetry.feed_line(text):
+            return
+        if text:
+            logger.debug("scrcpy: %s", text, extra=SCRCPY_LOG_SOURCE)
@@ -0,0 +1,30 @@
+import json
+import os
+from pathlib import Path
+
+from dexonlinux.utils import get_logger
+
+logger = get_logger()
+
+
+def default_config_path():
+    base = os.environ.get("XDG_CONFIG_HOME") or os.path.join(os.path.expanduser("~"), ".config")
+    return Path(base) / "dexonlinux" / "config.json"
+
+
+def load_config(path=None):
+    # Settings the user edits by hand, unlike the profile cache; a missing file means defaults.
+    explicit = path is not None
+    path = Path(path) if explicit else default_config_path()
+    try:
+        data = json.loads(path.read_text())
+    except FileNotFoundError:
+        if explicit:
+            raise ValueError(f"Config file {path} does not exist.")
+        return {}
+    except (OSError, ValueError) as exc:
+        raise ValueError(f"Could not read config file {path}: {exc}") from exc
+    if not isinstance(data, dict):
+        raise ValueError(f"Config file {path} must contain a JSON object.")
+    logger.debug("Loaded settings from %s.", path)
+    return data
@@ -1,14 +1,45 @@
-import socket
-import threading
-import time
+import asyncio
+import functools
+import logging
 
+from dexonlinux.adaptive import AdaptiveController
 from dexonlinux.commands import CommandError, Commands
-from dexonlinux.utils import get_logger, select_from_list
+from dexonlinux.drainer import RtpDrainer
+from dexonlinux.eventloop import process_exited, run_blocking, terminate_process
+from dexonlinux.recorder import get_recorder, record
+from dexonlinux.telemetry import ScrcpyTelemetry
+from dexonlinux.timeline import mark, span
+from dexonlinux.utils import flush_logs, get_logger, select_from_list
 
 logger = get_logger()
 
 
+class SessionLogAdapter(logging.LoggerAdapter):
+    # Prefixes messages with the session label when several sessions share one terminal.
+    def process(self, msg, kwargs):
+        kwargs["extra"] = {"session": self.extra["label"], **kwargs.get("extra", {})}
+        return f"[{self.extra['label']}] {msg}", kwargs
+
+
 class ConnectionHandler:
+    # Lives on the session's event loop: sinkctl events, RTP readiness and scrcpy's exit all arrive as loop
+    # callbacks, so state is only touched from the loop thread. Blocking adb calls and prompts use run_blocking.
+
+    # Miraclecast reports the negotiated resolution right after the sink connects.
+    RESOLUTION_TIMEOUT = 2.0
+    # The phone only streams once its DeX display exists, so the first RTP packet means scrcpy can open it.
+    STREAM_TIMEOUT = 3.0
+    # How long the starter waits for an in-flight display refresh before using what it already has.
+    DISPLAY_REFRESH_TIMEOUT = 2.0
+    # A display is picked without asking only if it scores at least this and beats every other display.
+    DISPLAY_MATCH_MIN_SCORE = 4
+    # Upper bound on how long a launch waits for the standby push so it does not race scrcpy's own push.
+    STANDBY_TIMEOUT = 5.0
+    # Default for how long scrcpy outlives a disconnect; sinkctl also reports short link blips as disconnects.
+    RECONNECT_GRACE = 3.0
+    # Default seconds between scrcpy status lines in the log.
+    STATS_INTERVAL = 30.0
+
     def __init__(
         self,
         commands,
@@ -17,112 +48,388 @@ class ConnectionHandler:
         *,
         display_id=None,
         fullscreen=False,
+        drain_mode="discard",
+        cache=None,
+        standby=True,
         on_scrcpy_closed=None,
+        on_event=None,
+        reconnect_grace=RECONNECT_GRACE,
+        label=None,
+        prompt_lock=None,
+        tuning=None,
+        adaptive=False,
+        stats_interval=0,
     ):
+        self.loop = asyncio.get_running_loop()
         self.commands = commands
         self.device = device
         self.port = port
         self.display_id = display_id
         self.fullscreen = fullscreen
+        self.tuning = tuning
+        self.scrcpy_profile = None
+        # Only profiles can be stepped down, so without tuning scrcpy keeps its own defaults.
+        self.adaptive = AdaptiveController() if adaptive and tuning is not None else None
+        # Rolling fps windows and stream details of the current scrcpy launch.
+        self.telemetry = None
+        self.stats_interval = stats_interval
+        self._stats_timer = None
         self.on_scrcpy_closed = on_scrcpy_closed
+        self.on_event = on_event
+        self.paused = False
+        self.reconnect_grace = reconnect_grace
+        self.label = label
+        self.log = SessionLogAdapter(logger, {"label": label}) if label else logger
+        # Shared by the sessions of one process so only one display prompt owns the terminal at a time.
+        self.prompt_lock = prompt_lock
+        self._grace_timer = None
+        self.sessions = 0
+        self.cache = cache
+        self._display_from_cache = False
         self.scrcpy_process = None
         self.device_name = "unknown"
         self.sink_resolution = None
-        self._stop_drain = threading.Event()
-        self._drain_thread = None
-        self._monitor_thread = None
-        self._delayed_start_timer = None
-        self._lock = threading.Lock()
+        self.sink_size = None
+        self._displays = None
+        self._displays_future = None
+        self.standby = standby
+        self._standby_future = None
+        self._sink_ready = asyncio.Event()
+        self._drainer = RtpDrainer(port, mode=drain_mode, loop=self.loop)
+        self._start_task = None
+        self._scrcpy_exit = None
+        self._terminations = set()
+
+    @property
+    def rtp_stats(self):
+        return self._drainer.stats
+
+    @property
+    def stream_analysis(self):
+        return self._drainer.analyzer
+
+    def rtp_counters(self):
+        drainer = self._drainer
+        return {"packets": drainer.received_packets, "bytes": drainer.received_bytes, "kernel_dropped": drainer.kernel_dropped()}
 
     def stop(self):
         self._stop_scrcpy()
 
-    def _start_scrcpy(self):
-        with self._lock:
-            if self.scrcpy_process and self.scrcpy_process.poll() is None:
-                logger.debug("scrcpy is already running; ignoring duplicate connection event.")
-                return
+    def pause(self):
+        # Closes scrcpy but keeps the RTP port bound, so the phone keeps its DeX connection.
+        self.paused = True
+        self._stop_scrcpy(keep_stream=True)
+        self._emit("paused")
 
-            self._stop_drain.clear()
-            self._drain_thread = threading.Thread(target=self._drain_stream, daemon=True)
-            self._drain_thread.start()
-
-            logger.info("Starting scrcpy for %s.", self.device)
-            display_id = self._resolve_display_id()
-            self.scrcpy_process = self.commands.run_scrcpy(
-                self.device,
-                display_id=display_id,
-                fullscreen=self.fullscreen,
-            )
-            self._monitor_thread = threading.Thread(target=self._monitor_scrcpy, daemon=True)
-            self._monitor_thread.start()
-
-    def _stop_scrcpy(self):
-        self._stop_drain.set()
-        if self._delayed_start_timer:
-            self._delayed_start_timer.cancel()
-            self._delayed_start_timer = None
-        if self._drain_thread and self._drain_thread.is_alive():
-            self._drain_thread.join(timeout=1.0)
-
-        with self._lock:
-            process = self.scrcpy_process
-            self.scrcpy_process = None
+    def resume(self):
+        self.paused = False
+        self._emit("resumed")
+        if self._sink_ready.is_set():
+            self._schedule_start()
+
+    def status(self):
+        process = self.scrcpy_process
+        if self._grace_timer is not None:
+            state = "reconnecting"
+        elif self._scrcpy_running():
+            state = "streaming"
+        elif self.paused:
+            state = "paused"
+        elif self._start_task is not None and not self._start_task.done():
+            state = "starting"
+        elif self._sink_ready.is_set():
+            state = "connected"
+        else:
+            state = "waiting"
+        status = {
+            "state": state,
+            "device": self.device,
+            "port": self.port,
+            "sink_resolution": self.sink_resolution,
+            "scrcpy_profile": self.scrcpy_profile.name if self.scrcpy_profile else None,
+            "adaptive_level": self.adaptive.level if self.adaptive else None,
+            "scrcpy_pid": process.pid if process is not None and state == "streaming" else None,
+            "sessions": self.sessions,
+        }
+        if self.rtp_stats is not None:
+            status["rtp"] = self.rtp_stats.snapshot()
+        return status
+
+    def _emit(self, name, **data):
+        record("event", f"[{self.label}] {name} {data}" if self.label else f"{name} {data}")
+        if self.on_event:
+            self.on_event(name, data)
+
+    async def close(self):
+        self._stop_scrcpy()
+        if self._terminations:
+            await asyncio.gather(*self._terminations, return_exceptions=True)
+
+    def _scrcpy_running(self):
+        return self.scrcpy_process is not None and self.scrcpy_process.poll() is None
 
-        self.commands.terminate_process(process, "scrcpy", timeout=1.0)
+    def _schedule_start(self):
+        if self.paused:
+            self.log.debug("Session paused; not starting scrcpy.")
+            return
+        if self._scrcpy_running():
+            self.log.debug("scrcpy is already running; ignoring duplicate connection event.")
+            return
+        if self._start_task is not None and not self._start_task.done():
+            return
+        self._drainer.start()
+        self._start_task = self.loop.create_task(self._start_when_ready())
+
+    async def _start_when_ready(self):
+        with span("dex.wait_ready"):
+            try:
+                await asyncio.wait_for(self._sink_ready.wait(), self.RESOLUTION_TIMEOUT)
+            except asyncio.TimeoutError:
+                self.log.debug("No DeX stream resolution reported yet; continuing without it.")
+            if not await self._drainer.stream_started(self.STREAM_TIMEOUT):
+                self.log.debug("No RTP packets received yet; starting scrcpy anyway.")
+            if self._standby_future is not None:
+                try:
+                    await asyncio.wait_for(asyncio.shield(self._standby_future), self.STANDBY_TIMEOUT)
+                except asyncio.TimeoutError:
+                    self.log.debug("scrcpy standby is still running; starting scrcpy anyway.")
+        await self._start_from_sink()
+
+    async def _start_scrcpy(self, use_cache=True):
+        display_id = await self._resolve_display_id(use_cache)
+        if self._scrcpy_running():
+            self.log.debug("scrcpy is already running; ignoring duplicate connection event.")
+            return
+
+        profile = self._select_profile(display_id)
+        if profile is None:
+            self.log.info("Starting scrcpy for %s.", self.device)
+        else:
+            self.log.info("Starting scrcpy for %s with the %s profile (%s).", self.device, profile.name, profile.reason)
+        on_fps = None
+        if self.adaptive is not None:
+            self.adaptive.restart()
+            on_fps = functools.partial(self._on_fps, self.sessions + 1)
+        telemetry = ScrcpyTelemetry(profile, on_fps=on_fps)
+        process = await self.commands.run_scrcpy(
+            self.device,
+            display_id=display_id,
+            fullscreen=self.fullscreen,
+            profile=profile,
+            telemetry=telemetry,
+        )
+        self.scrcpy_process = process
+        self.scrcpy_profile = profile
+        self.telemetry = telemetry
+        self._schedule_stats()
+        self.sessions += 1
+        self._emit("scrcpy_started", pid=process.pid, display_id=display_id, profile=profile.name if profile else None)
+        self._scrcpy_exit = process_exited(process)
+        self._scrcpy_exit.add_done_callback(lambda exited: self._on_scrcpy_exit(process, exited))
+
+    def _select_profile(self, display_id):
+        if self.tuning is None:
+            return None
+        display = next((display for display in self._displays or () if display.display_id == display_id), None)
+        profile = self.tuning.select(self.sink_size, display)
+        return self.adaptive.apply(profile) if self.adaptive else profile
+
+    def _on_fps(self, launch, rendered, skipped):
+        # Reports from a scrcpy that is already being replaced still arrive until its stdout closes.
+        if launch != self.sessions or not self._scrcpy_running() or self._grace_timer is not None:
+            return
+        previous = self.adaptive.level
+        level = self.adaptive.observe(rendered, skipped)
+        if level is None:
+            return
+        if level > previous:
+            self.log.info("scrcpy is skipping frames (%d fps, %d skipped); relaunching with lighter settings.", rendered, skipped)
+        else:
+            self.log.info("scrcpy has kept up for a while; relaunching with the previous settings.")
+        mark("scrcpy.retune", level=level)
+        self._emit("scrcpy_retuned", level=level, fps=rendered, skipped=skipped)
+        self._stop_scrcpy(keep_stream=True)
+        self._schedule_start()
+
+    def _schedule_stats(self):
+        if self.stats_interval > 0 and self._stats_timer is None:
+            self._stats_timer = self.loop.call_later(self.stats_interval, self._log_stats)
+
+    def _log_stats(self):
+        self._stats_timer = None
+        if not self._scrcpy_running() or self.telemetry is None:
+            return
+        self.log.info("scrcpy %s", self.telemetry.status_line())
+        self._schedule_stats()
+
+    def _stop_scrcpy(self, keep_stream=False):
+        self._cancel_grace()
+        if self._stats_timer is not None:
+            self._stats_timer.cancel()
+            self._stats_timer = None
+        if self._start_task is not None and not self._start_task.done():
+            self._start_task.cancel()
+        self._start_task = None
+        if not keep_stream:
+            self._drainer.stop()
 
-    def _monitor_scrcpy(self):
         process = self.scrcpy_process
+        self.scrcpy_process = None
+        if self._scrcpy_exit is not None and not self._scrcpy_exit.done():
+            self._scrcpy_exit.cancel()
+        self._scrcpy_exit = None
         if process is None:
             return
-        process.wait()
-        if self._stop_drain.is_set():
+        self._emit("scrcpy_stopped", pid=process.pid)
+        if self.loop.is_closed():
+            self.commands.terminate_process(process, "scrcpy", timeout=1.0)
             return
-        logger.warning("scrcpy closed; ending DexOnLinux session.")
-        self._stop_drain.set()
+        termination = self.loop.create_task(terminate_process(process, "scrcpy", timeout=1.0))
+        self._terminations.add(termination)
+        termination.add_done_callback(self._terminations.discard)
+
+    def _on_scrcpy_exit(self, process, exited):
+        if exited.cancelled() or process is not self.scrcpy_process:
+            return
+        if exited.result() != 0:
+            # A clean window close exits with 0; anything else is worth keeping the recent output for.
+            path = get_recorder().dump(f"scrcpy for {self.device} exited with {exited.result()}")
+            if path:
+                self.log.warning("scrcpy exited with %s; recent output saved to %s.", exited.result(), path)
+        if self._grace_timer is not None:
+            # The phone tore its DeX display down; a reconnect inside the grace window starts scrcpy afresh.
+            self.log.debug("scrcpy exited while DeX was disconnected.")
+            self.scrcpy_process = None
+            self._scrcpy_exit = None
+            self._emit("scrcpy_closed", returncode=exited.result())
+            return
+        if self.on_scrcpy_closed:
+            self.log.warning("scrcpy closed; ending DexOnLinux session.")
+        else:
+            self.log.info("scrcpy closed; waiting for the next DeX connection.")
+        self.scrcpy_process = None
+        self._scrcpy_exit = None
+        self._emit("scrcpy_closed", returncode=exited.result())
         if self.on_scrcpy_closed:
             self.on_scrcpy_closed()
 
-    def _resolve_display_id(self):
+    def prepare(self):
+        # Called once the device is chosen, while DeX is not connected yet.
+        if not self.standby:
+            self.prefetch_displays()
+            return
+        self._standby_future = run_blocking(self._warm_standby)
+        self._standby_future.add_done_callback(lambda _: self.prefetch_displays())
+
+    def _warm_standby(self):
+        try:
+            self.commands.prepare_scrcpy_standby(self.device)
+        except (CommandError, OSError) as exc:
+            self.log.warning("Could not prepare scrcpy on %s ahead of time: %s", self.device, exc)
+
+    def prefetch_displays(self):
+        # A newer request supersedes one still in flight; only the latest result is kept.
+        if self.display_id is not None:
+            return
+        future = run_blocking(self._query_displays)
+        self._displays_future = future
+
+        def store(done):
+            if done is self._displays_future and not done.cancelled() and done.exception() is None:
+                self._displays = done.result()
+
+        future.add_done_callback(store)
+
+    def _query_displays(self):
+        displays = []
+        try:
+            displays = self.commands.list_adb_displays(self.device)
+        except (CommandError, OSError) as exc:
+            self.log.debug("dumpsys display failed: %s", exc)
+        if not displays:
+            try:
+                displays = self.commands.list_scrcpy_displays(self.device)
+            except (CommandError, OSError) as exc:
+                self.log.debug("scrcpy --list-displays failed: %s", exc)
+        return displays
+
+    async def _current_displays(self):
+        future = self._displays_future
+        if future is not None and not future.done():
+            try:
+                await asyncio.wait_for(asyncio.shield(future), self.DISPLAY_REFRESH_TIMEOUT)
+            except asyncio.TimeoutError:
+                self.log.debug("Display list refresh still running; using the previous list.")
+        if self._displays is None:
+            return await run_blocking(self.commands.list_scrcpy_displays, self.device)
+        return self._displays
+
+    def _match_display(self, displays):
+        width, height = self.sink_size or (None, None)
+        ranked = sorted(displays, key=lambda display: display.score(width, height), reverse=True)
+        best = ranked[0].score(width, height)
+        if best < self.DISPLAY_MATCH_MIN_SCORE:
+            return None
+        if len(ranked) > 1 and ranked[1].score(width, height) >= best:
+            return None
+        return ranked[0]
+
+    async def _resolve_display_id(self, use_cache=True):
         if self.display_id is not None:
             return self.display_id
 
-        displays = self.commands.list_scrcpy_displays(self.device)
+        self._display_from_cache = False
+        if self.cache and use_cache:
+            display_id = self.cache.cached_display_id(self.device, self.sink_resolution)
+            if display_id is not None:
+                # Display ids are reassigned when DeX is recreated, so the id must still be on the phone's list.
+                displays = await self._current_displays()
+                if not displays or any(display.display_id == display_id for display in displays):
+                    self.log.info("Using display %s from the profile cache.", display_id)
+                    self._display_from_cache = True
+                    return display_id
+                self.log.info("Cached display %s is gone from %s; choosing the display again.", display_id, self.device)
+                self.cache.forget_display(self.device)
+
+        with span("display.resolve"):
+            display_id = await self._choose_display_id()
+        if self.cache and display_id is not None:
+            self.cache.remember_device(self.device, display_id=display_id, sink_resolution=self.sink_resolution)
+        return display_id
+
+    async def _choose_display_id(self):
+        displays = await self._current_displays()
         if not displays:
-            logger.warning("No scrcpy display id found; scrcpy will use its default display.")
+            self.log.warning("No scrcpy display id found; scrcpy will use its default display.")
             return None
 
+        matched = self._match_display(displays)
+        if matched is not None:
+            self.log.info("Matched DeX to %s.", matched.label())
+            return matched.display_id
+
+        if self.prompt_lock is None:
+            selected = await run_blocking(self._prompt_display, displays)
+        else:
+            async with self.prompt_lock:
+                selected = await run_blocking(self._prompt_display, displays)
+        if selected is None:
+            raise CommandError("No scrcpy display selected.")
+        return selected.display_id
+
+    def _prompt_display(self, displays):
+        flush_logs()
         print()
+        if self.label:
+            print(f"Session {self.label}:")
         print("Hint: DeX is usually the landscape 16:9 display; the phone screen is usually portrait 9:16.")
         if self.sink_resolution:
             print(f"Miraclecast reported DeX stream resolution: {self.sink_resolution}.")
-        selected = select_from_list(
+        return select_from_list(
             displays,
             "Select the display to open with scrcpy:",
             formatter=lambda display: display.label(),
         )
-        if selected is None:
-            raise CommandError("No scrcpy display selected.")
-        return selected.display_id
-
-    def _drain_stream(self):
-        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
-            s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            try:
-                s.bind(("0.0.0.0", self.port))
-                s.settimeout(1.0)
-                logger.debug("RTP drainer started on UDP port %s.", self.port)
-
-                while not self._stop_drain.is_set():
-                    try:
-                        s.recv(4096)
-                    except socket.timeout:
-                        continue
-                    except OSError:
-                        break
-            except OSError as exc:
-                logger.error("RTP drainer bind failed on UDP port %s: %s", self.port, exc)
-        logger.debug("RTP drainer stopped.")
 
     def _set_device_name(self, changed):
         friendly_name = changed.get("FriendlyName")
@@ -130,40 +437,89 @@ class ConnectionHandler:
             self.device_name = friendly_name
 
     def handle_sinkctl_event(self, event):
+        mark(f"dex.{event.name}", **event.data)
+        self._emit(event.name, **event.data)
         if event.name == "peer_connected":
-            logger.debug("DeX peer connected; waiting for sink stream.")
+            self.log.debug("DeX peer connected; waiting for sink stream.")
+            # Bind the stream port before the source starts sending to it.
+            self._drainer.start()
             return
 
         if event.name == "resolution":
-            self.sink_resolution = event.data.get("resolution")
-            logger.info("DeX stream resolution is %s.", self.sink_resolution)
-            if self._delayed_start_timer:
-                self._delayed_start_timer.cancel()
-                self._delayed_start_timer = None
-            self._start_from_sink()
+            resolution = event.data.get("resolution")
+            changed = resolution != self.sink_resolution
+            self.sink_resolution = resolution
+            self.sink_size = (event.data.get("width"), event.data.get("height"))
+            self.log.info("DeX stream resolution is %s.", self.sink_resolution)
+            self._sink_ready.set()
+            if self._resume_from_grace() and not changed:
+                return
+            if changed and self._scrcpy_running():
+                self.log.info("DeX came back at a new resolution; restarting scrcpy.")
+                self._stop_scrcpy(keep_stream=True)
+            # The DeX display is created for this resolution, so refresh the list that was fetched while waiting.
+            self.prefetch_displays()
+            self._schedule_start()
             return
 
         if event.name == "connected":
-            logger.info("DeX stream connected.")
-            if not self._delayed_start_timer:
-                self._delayed_start_timer = threading.Timer(2.0, self._start_from_sink)
-                self._delayed_start_timer.daemon = True
-                self._delayed_start_timer.start()
+            self.log.info("DeX stream connected.")
+            self._resume_from_grace()
+            self._schedule_start()
             return
 
         if event.name == "disconnected":
-            logger.info("DeX stream disconnected.")
+            self._sink_ready.clear()
+            if self._grace_timer is not None:
+                return
+            starting = self._start_task is not None and not self._start_task.done()
+            if self.reconnect_grace > 0 and (self._scrcpy_running() or starting):
+                self.log.info("DeX stream disconnected; keeping scrcpy for %.1f s in case it reconnects.", self.reconnect_grace)
+                self._grace_timer = self.loop.call_later(self.reconnect_grace, self._grace_expired)
+                self._emit("grace_started", seconds=self.reconnect_grace)
+                return
+            self.log.info("DeX stream disconnected.")
             self._stop_scrcpy()
 
-    def _start_from_sink(self):
-        self._delayed_start_timer = None
-        if self.scrcpy_process and self.scrcpy_process.poll() is None:
+    def _resume_from_grace(self):
+        # A reconnect inside the grace window keeps the running scrcpy; flapping links never restart it.
+        if self._grace_timer is None:
+            return False
+        self._cancel_grace()
+        mark("dex.resumed")
+        self._emit("resumed_from_grace", scrcpy_running=self._scrcpy_running())
+        if self._scrcpy_running():
+            self.log.info("DeX reconnected within the grace window; kept scrcpy running.")
+            return True
+        return False
+
+    def _cancel_grace(self):
+        if self._grace_timer is not None:
+            self._grace_timer.cancel()
+            self._grace_timer = None
+
+    def _grace_expired(self):
+        self._grace_timer = None
+        self.log.info("DeX did not reconnect within %.1f s; closing scrcpy.", self.reconnect_grace)
+        self._emit("grace_expired")
+        self._stop_scrcpy()
+
+    async def _start_from_sink(self):
+        if self._scrcpy_running():
             return
         try:
-            time.sleep(1.0)
-            self._start_scrcpy()
+            try:
+                await self._start_scrcpy()
+            except Exception as exc:
+                if not self._display_from_cache:
+                    raise
+                # A stale cached display should cost one failed launch, not the session.
+                self.log.warning("scrcpy failed on the cached display (%s); choosing the display again.", exc)
+                self.cache.forget_display(self.device)
+                await self._start_scrcpy(use_cache=False)
         except Exception as exc:
-            logger.error("Unable to start scrcpy: %s", exc)
+            self.log.error("Unable to start scrcpy: %s", exc)
+            self._start_task = None
             self._stop_scrcpy()
             if self.on_scrcpy_closed:
                 self.on_scrcpy_closed()
@@ -0,0 +1,177 @@
+import asyncio
+import json
+import os
+import socket
+import stat
+import time
+from pathlib import Path
+
+from dexonlinux.utils import get_logger
+
+logger = get_logger()
+
+CONTROL_COMMANDS = ("status", "start", "stop", "events", "shutdown")
+# Events kept for clients that subscribe after they happened, e.g. to see why the last session ended.
+EVENT_BACKLOG = 32
+# A subscriber that falls this far behind is dropped instead of growing the daemon's memory.
+SUBSCRIBER_QUEUE_SIZE = 256
+MAX_REQUEST_SIZE = 4096
+
+
+def default_socket_path():
+    runtime_dir = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime_dir:
+        return Path(runtime_dir) / "dexonlinux.sock"
+    return Path(f"/tmp/dexonlinux-{os.getuid()}.sock")
+
+
+class ControlServer:
+    # JSON lines over a UNIX socket: each request is {"command": ...}, answered by one JSON object,
+    # except "events", which keeps the connection open and streams one object per event.
+    def __init__(self, handler, path=None, info=None, on_shutdown=None):
+        self.handler = handler
+        self.path = Path(path) if path else default_socket_path()
+        self.info = info or {}
+        self.on_shutdown = on_shutdown
+        self.started_at = time.time()
+        self._server = None
+        self._subscribers = set()
+        self._backlog = []
+
+    async def start(self):
+        self._remove_stale_socket()
+        old_umask = os.umask(0o177)
+        try:
+            # The limit makes readline give up on an oversized request instead of buffering up to 64 KiB of it.
+            self._server = await asyncio.start_unix_server(self._serve_client, path=str(self.path), limit=MAX_REQUEST_SIZE + 1)
+        finally:
+            os.umask(old_umask)
+        logger.info("Control socket listening on %s.", self.path)
+
+    async def close(self):
+        for queue in list(self._subscribers):
+            queue.put_nowait(None)
+        if self._server is None:
+            # start() refused or never ran, so the path belongs to someone else.
+            return
+        self._server.close()
+        await self._server.wait_closed()
+        self._server = None
+        try:
+            self.path.unlink()
+        except FileNotFoundError:
+            pass
+
+    def _remove_stale_socket(self):
+        try:
+            mode = self.path.lstat().st_mode
+        except FileNotFoundError:
+            return
+        # Only a socket nobody answers on is ours to replace; a mistyped --socket must not delete a file.
+        if not stat.S_ISSOCK(mode):
+            raise OSError(f"{self.path} exists and is not a socket; refusing to replace it.")
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(str(self.path))
+        except OSError:
+            self.path.unlink()
+        else:
+            raise OSError(f"Another DexOnLinux daemon is already listening on {self.path}.")
+        finally:
+            probe.close()
+
+    def publish(self, name, data):
+        event = {"event": name, "time": time.time(), **data}
+        self._backlog.append(event)
+        del self._backlog[:-EVENT_BACKLOG]
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                logger.debug("Dropping a control client that stopped reading events.")
+                self._subscribers.discard(queue)
+                queue.get_nowait()
+                queue.put_nowait(None)
+
+    def status(self):
+        return {**self.info, **self.handler.status(), "uptime": round(time.time() - self.started_at, 1)}
+
+    async def _serve_client(self, reader, writer):
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, asyncio.LimitOverrunError):
+                    line = None
+                if line == b"":
+                    break
+                if line is None or len(line) > MAX_REQUEST_SIZE:
+                    await self._reply(writer, {"ok": False, "error": "request too large"})
+                    break
+                try:
+                    request = json.loads(line)
+                    command = request["command"]
+                except (ValueError, KeyError, TypeError):
+                    await self._reply(writer, {"ok": False, "error": "expected {\"command\": ...}"})
+                    continue
+                if command == "events":
+                    await self._stream_events(writer, request.get("backlog", False))
+                    break
+                await self._reply(writer, self._dispatch(command))
+                if command == "shutdown":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    def _dispatch(self, command):
+        if command == "status":
+            return {"ok": True, **self.status()}
+        if command == "start":
+            self.handler.resume()
+            return {"ok": True, **self.status()}
+        if command == "stop":
+            self.handler.pause()
+            return {"ok": True, **self.status()}
+        if command == "shutdown":
+            if self.on_shutdown:
+                self.on_shutdown()
+            return {"ok": True}
+        return {"ok": False, "error": f"unknown command {command!r}; expected one of {', '.join(CONTROL_COMMANDS)}"}
+
+    async def _reply(self, writer, response):
+        writer.write(json.dumps(response).encode() + b"\n")
+        await writer.drain()
+
+    async def _stream_events(self, writer, backlog):
+        queue = asyncio.Queue(SUBSCRIBER_QUEUE_SIZE)
+        if backlog:
+            for event in self._backlog:
+                queue.put_nowait(event)
+        self._subscribers.add(queue)
+        try:
+            await self._reply(writer, {"ok": True, **self.status()})
+            while True:
+                event = await queue.get()
+                if event is None:
+                    break
+                await self._reply(writer, event)
+        finally:
+            self._subscribers.discard(queue)
+
+
+def send_command(command, path=None, backlog=False):
+    # Yields each JSON object the daemon sends back: one for most commands, a stream for "events".
+    path = Path(path) if path else default_socket_path()
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(str(path))
+        request = {"command": command}
+        if backlog:
+            request["backlog"] = True
+        sock.sendall(json.dumps(request).encode() + b"\n")
+        with sock.makefile("rb") as stream:
+            for line in stream:
+                yield json.loads(line)
+                if command != "events":
+                    return
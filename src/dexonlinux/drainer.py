@@ -0,0 +1,211 @@
+import asyncio
+import ctypes
+import socket
+import struct
+import time
+
+from dexonlinux.mpegts import TsAnalyzer
+from dexonlinux.rtp import RtpStats
+from dexonlinux.utils import get_logger
+
+logger = get_logger()
+
+DRAIN_MODES = ("discard", "recv", "stats", "analyze")
+SO_ATTACH_FILTER = getattr(socket, "SO_ATTACH_FILTER", 26)
+# A single classic BPF instruction, BPF_RET | BPF_K with k=0: keep zero bytes of every datagram.
+DROP_ALL_FILTER = struct.pack("HBBI", 0x06, 0, 0, 0)
+# The kernel clamps this up to its minimum receive buffer.
+DISCARD_RCVBUF = 1
+# Large enough that a Wi-Fi burst is not misreported as packet loss.
+STATS_RCVBUF = 4 * 1024 * 1024
+MAX_DATAGRAM_SIZE = 65535
+# getsockopt(SO_MEMINFO) returns SK_MEMINFO_VARS u32 values; SK_MEMINFO_DROPS is the last of them (Linux 4.12+).
+SO_MEMINFO = getattr(socket, "SO_MEMINFO", 55)
+SK_MEMINFO = struct.Struct("9I")
+SK_MEMINFO_DROPS = 8
+# Datagrams read per loop wakeup. The reader stays ready while more are queued, so a flood is read in
+# slices that take turns with the rest of the loop instead of one pass that runs until EAGAIN.
+MAX_DATAGRAMS_PER_WAKEUP = 256
+
+
+class RtpDrainer:
+    # The socket is a reader on the given event loop; no thread is ever started for the stream.
+    def __init__(self, port, mode="discard", *, loop):
+        if mode not in DRAIN_MODES:
+            raise ValueError(f"Unknown drain mode: {mode}")
+        self.port = port
+        self.mode = mode
+        self.loop = loop
+        self._stream_waiter = None
+        self._socket = None
+        self._first_packet = False
+        self.stats = RtpStats() if mode in ("stats", "analyze") else None
+        self.analyzer = TsAnalyzer() if mode == "analyze" else None
+        # Lifetime totals across every bind; only the loop readers update them, once per wakeup.
+        self.received_packets = 0
+        self.received_bytes = 0
+        self._kernel_dropped = 0
+
+    @property
+    def running(self):
+        return self._socket is not None
+
+    def start(self):
+        if self.running:
+            return
+        try:
+            sock = self._bind()
+        except OSError as exc:
+            logger.error("RTP drainer bind failed on UDP port %s: %s", self.port, exc)
+            return
+
+        self._first_packet = False
+        self._socket = sock
+        sock.setblocking(False)
+        self._stream_waiter = self.loop.create_future()
+        if self.mode == "discard":
+            # The drop-all filter is attached once the first datagram arrives;
+            # until then the minimal receive buffer keeps the queue tiny.
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, DISCARD_RCVBUF)
+            except OSError as exc:
+                logger.debug("Could not shrink the RTP receive buffer: %s", exc)
+            self.loop.add_reader(sock, self._on_first_datagram, sock)
+            logger.debug("RTP drainer bound UDP port %s.", self.port)
+            return
+        if self.stats:
+            self.stats.reset()
+            if self.analyzer:
+                self.analyzer.reset()
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, STATS_RCVBUF)
+            except OSError as exc:
+                logger.debug("Could not enlarge the RTP receive buffer: %s", exc)
+            self._buffer = bytearray(MAX_DATAGRAM_SIZE)
+            self.loop.add_reader(sock, self._drain_stats, sock)
+        else:
+            self.loop.add_reader(sock, self._drain_recv, sock)
+        logger.debug("RTP drainer reading UDP port %s on the event loop.", self.port)
+
+    def _stream_started(self):
+        if not self._first_packet:
+            self._first_packet = True
+            if self._stream_waiter is not None and not self._stream_waiter.done():
+                self._stream_waiter.set_result(True)
+
+    def _on_first_datagram(self, sock):
+        self._stream_started()
+        if self._attach_discard_filter(sock):
+            self.loop.remove_reader(sock)
+            self._flush(sock)
+            logger.debug("RTP stream on UDP port %s is now discarded by the kernel.", self.port)
+        else:
+            self.loop.remove_reader(sock)
+            self.loop.add_reader(sock, self._drain_recv, sock)
+            self._drain_recv(sock)
+
+    def _drain_recv(self, sock):
+        self._stream_started()
+        packets = size = 0
+        try:
+            while packets < MAX_DATAGRAMS_PER_WAKEUP:
+                size += len(sock.recv(MAX_DATAGRAM_SIZE))
+                packets += 1
+        except OSError:
+            pass
+        self.received_packets += packets
+        self.received_bytes += size
+
+    def _drain_stats(self, sock):
+        self._stream_started()
+        buffer = self._buffer
+        add_packet = self.stats.add_packet
+        analyze = self.analyzer.feed if self.analyzer else None
+        clock = time.monotonic_ns
+        packets = total = 0
+        while packets < MAX_DATAGRAMS_PER_WAKEUP:
+            try:
+                size = sock.recv_into(buffer)
+            except OSError:
+                break
+            packets += 1
+            total += size
+            arrival = clock()
+            payload = add_packet(buffer, size, arrival)
+            if analyze and payload >= 0:
+                analyze(buffer, payload, size, arrival)
+        self.received_packets += packets
+        self.received_bytes += total
+
+    def kernel_dropped(self):
+        # Datagrams the kernel threw away on this port, mostly the discard filter at work. Read from the
+        # socket on demand, so the discard path stays free of any per-packet work.
+        return self._kernel_dropped + self._socket_drops(self._socket)
+
+    @staticmethod
+    def _socket_drops(sock):
+        if sock is None:
+            return 0
+        try:
+            return SK_MEMINFO.unpack(sock.getsockopt(socket.SOL_SOCKET, SO_MEMINFO, SK_MEMINFO.size))[SK_MEMINFO_DROPS]
+        except (OSError, struct.error):
+            return 0
+
+    async def stream_started(self, timeout):
+        if self._first_packet:
+            return True
+        if self._stream_waiter is None:
+            return False
+        try:
+            return await asyncio.wait_for(asyncio.shield(self._stream_waiter), timeout)
+        except asyncio.TimeoutError:
+            return False
+
+    def stop(self):
+        sock = self._socket
+        self._socket = None
+        if sock is not None:
+            self._kernel_dropped += self._socket_drops(sock)
+            if not self.loop.is_closed():
+                self.loop.remove_reader(sock)
+                if self._stream_waiter is not None and not self._stream_waiter.done():
+                    self._stream_waiter.cancel()
+            self._stream_waiter = None
+            sock.close()
+            if self.stats and self.stats.packets:
+                logger.info("RTP stream: %s.", self.stats.summary())
+            if self.analyzer and self.analyzer.packets:
+                logger.info("WFD stream: %s.", self.analyzer.summary())
+            logger.debug("RTP drainer stopped.")
+
+    def _bind(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            sock.bind(("0.0.0.0", self.port))
+        except OSError:
+            sock.close()
+            raise
+        return sock
+
+    @staticmethod
+    def _attach_discard_filter(sock):
+        # The port stays bound, so the phone never sees ICMP port unreachable,
+        # but nothing is queued and no thread ever wakes up for the stream.
+        try:
+            program = ctypes.create_string_buffer(DROP_ALL_FILTER, len(DROP_ALL_FILTER))
+            sock_fprog = struct.pack("HL", 1, ctypes.addressof(program))
+            sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, sock_fprog)
+        except OSError as exc:
+            logger.debug("Kernel-side RTP discard unavailable (%s); falling back to recv mode.", exc)
+            return False
+        return True
+
+    @staticmethod
+    def _flush(sock):
+        sock.setblocking(False)
+        try:
+            while True:
+                sock.recv(MAX_DATAGRAM_SIZE)
+        except OSError:
+            pass
@@ -0,0 +1,121 @@
+import asyncio
+import os
+import threading
+
+from dexonlinux.recorder import record
+from dexonlinux.utils import get_logger
+
+logger = get_logger()
+
+# Only used where pidfd_open is missing (Linux older than 5.3).
+CHILD_POLL_INTERVAL = 0.25
+
+
+def process_exited(process):
+    # Resolves with the return code as soon as the child exits: a pidfd becomes readable on exit,
+    # so the loop wakes up exactly once instead of polling.
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+    if process.poll() is not None:
+        future.set_result(process.returncode)
+        return future
+
+    watch_exit = getattr(process, "watch_exit", None)
+    if watch_exit is not None:
+        # Processes the privileged helper spawned are its children; it reports their exit instead.
+        def deliver(returncode):
+            if not future.done():
+                record("process", f"pid {process.pid} exited with {returncode}")
+                future.set_result(returncode)
+
+        def on_helper_exit(returncode):
+            try:
+                loop.call_soon_threadsafe(deliver, returncode)
+            except RuntimeError:
+                pass
+
+        watch_exit(on_helper_exit)
+        return future
+
+    try:
+        pidfd = os.pidfd_open(process.pid)
+    except (AttributeError, OSError) as exc:
+        logger.debug("pidfd unavailable for pid %s (%s); polling for its exit.", process.pid, exc)
+        _poll_exit(loop, process, future)
+        return future
+
+    def on_exit():
+        if process.poll() is None:
+            return
+        loop.remove_reader(pidfd)
+        os.close(pidfd)
+        if not future.done():
+            record("process", f"pid {process.pid} exited with {process.returncode}")
+            future.set_result(process.returncode)
+
+    def on_cancel(done):
+        if done.cancelled() and loop.remove_reader(pidfd):
+            os.close(pidfd)
+
+    loop.add_reader(pidfd, on_exit)
+    future.add_done_callback(on_cancel)
+    return future
+
+
+def _poll_exit(loop, process, future):
+    if future.done():
+        return
+    if process.poll() is not None:
+        record("process", f"pid {process.pid} exited with {process.returncode}")
+        future.set_result(process.returncode)
+        return
+    loop.call_later(CHILD_POLL_INTERVAL, _poll_exit, loop, process, future)
+
+
+def run_blocking(function, *args):
+    # Runs function on a daemon thread and returns a future for the loop. Unlike run_in_executor,
+    # a prompt still waiting for input cannot hold up interpreter shutdown after CTRL+C.
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def deliver(result, exc):
+        if future.done():
+            return
+        if exc is not None:
+            future.set_exception(exc)
+        else:
+            future.set_result(result)
+
+    def target():
+        try:
+            result = function(*args)
+        except BaseException as exc:
+            result, error = None, exc
+        else:
+            error = None
+        try:
+            loop.call_soon_threadsafe(deliver, result, error)
+        except RuntimeError:
+            pass
+
+    threading.Thread(target=target, name=getattr(function, "__name__", "blocking"), daemon=True).start()
+    return future
+
+
+async def terminate_process(process, name, timeout=2.0):
+    if process is None or process.poll() is not None:
+        return
+    logger.debug("Stopping %s.", name)
+    record("process", f"stopping {name}, pid {process.pid}")
+    exited = process_exited(process)
+    process.terminate()
+    try:
+        await asyncio.wait_for(asyncio.shield(exited), timeout)
+        return
+    except asyncio.TimeoutError:
+        logger.debug("%s did not exit after terminate; killing.", name)
+    process.kill()
+    try:
+        await asyncio.wait_for(exited, timeout)
+    except asyncio.TimeoutError:
+        pass
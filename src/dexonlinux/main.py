@@ -1,16 +1,33 @@
 import argparse
+import asyncio
+import functools
 import getpass
+import json
+import os
 import signal
 import sys
 import threading
 import time
+from pathlib import Path
 
+from dexonlinux.cache import ProfileCache
 from dexonlinux.commands import CommandError, Commands
+from dexonlinux.config import default_config_path, load_config
 from dexonlinux.connection_handler import ConnectionHandler
+from dexonlinux.sessions import SessionManager, SessionSpec, assign_ports, parse_session_spec, validate_specs
+from dexonlinux.daemon import CONTROL_COMMANDS, ControlServer, default_socket_path, send_command
+from dexonlinux.drainer import DRAIN_MODES
+from dexonlinux.eventloop import process_exited
+from dexonlinux.metrics import DexMetrics, MetricsServer, TextfileWriter
+from dexonlinux.recorder import default_dump_dir, get_recorder
+from dexonlinux.scrcpy_profiles import AUTO_PROFILE, PROFILES, ScrcpyTuning, parse_option
+from dexonlinux.startup import StartupGraph
+from dexonlinux.timeline import TRACE_FORMATS, enable_tracing, mark, span
 from dexonlinux.utils import (
     colored,
     configure_logger,
     confirm,
+    flush_logs,
     get_logger,
     print_adb_instructions,
     print_ascii_art,
@@ -21,14 +38,16 @@ from colorama import Fore
 
 logger = get_logger()
 
+INTERFACE_HOTPLUG_TIMEOUT = 30.0
+
 
 class DexRuntime:
     def __init__(self, commands):
         self.commands = commands
         self.network_disabled = False
+        self.released_interfaces = []
         self.miracle_wifi = None
-        self.miracle_sinkctl = None
-        self.connection_handler = None
+        self.sessions = None
 
     def __enter__(self):
         return self
@@ -37,180 +56,578 @@ class DexRuntime:
         self.cleanup()
         return False
 
-    def disable_network(self):
+    def disable_network(self, mode="services", interfaces=()):
+        if mode == "interface":
+            for interface in interfaces:
+                self.released_interfaces.append(self.commands.release_interface(interface))
+            return
         self.commands.disable_network_services()
         self.network_disabled = True
 
     def cleanup(self):
-        if self.connection_handler:
-            self.connection_handler.stop()
-        self.commands.terminate_process(self.miracle_sinkctl, "miracle-sinkctl")
-        self.commands.close_sinkctl()
-        self.commands.terminate_process(self.miracle_wifi, "miracle-wifid")
-        if self.network_disabled:
-            try:
-                self.commands.enable_network_services()
-            except Exception as exc:
-                logger.error("Network services could not be restored automatically: %s", exc)
-
-
-def build_parser():
-    parser = argparse.ArgumentParser(description="Stream Samsung DeX to Linux with Miraclecast and scrcpy.")
+        with span("cleanup"):
+            if self.sessions:
+                self.sessions.stop()
+            self.commands.close_sinkctl()
+            self.commands.terminate_process(self.miracle_wifi, "miracle-wifid")
+            for released in reversed(self.released_interfaces):
+                try:
+                    self.commands.restore_interface(released)
+                except Exception as exc:
+                    logger.error("%s could not be handed back to NetworkManager: %s", released["interface"], exc)
+            if self.network_disabled:
+                try:
+                    self.commands.enable_network_services()
+                except Exception as exc:
+                    logger.error("Network services could not be restored automatically: %s", exc)
+
+
+def build_parser(daemon=False):
+    if daemon:
+        parser = argparse.ArgumentParser(
+            prog="dexonlinux daemon",
+            description="Keep Miraclecast and adb running across DeX sessions, controlled through a UNIX socket.",
+        )
+        parser.add_argument("--socket", help=f"Control socket path (default: {default_socket_path()}).")
+    else:
+        parser = argparse.ArgumentParser(
+            description="Stream Samsung DeX to Linux with Miraclecast and scrcpy.",
+            epilog="Run 'dexonlinux daemon --help' or 'dexonlinux ctl --help' for the resident mode.",
+        )
     parser.add_argument("--interface", help="P2P-capable Wi-Fi interface to use.")
     parser.add_argument("--device", help="ADB device serial to use.")
     parser.add_argument("--port", type=int, help="UDP port used by miracle-sinkctl external player.")
+    parser.add_argument(
+        "--session",
+        action="append",
+        type=session_spec,
+        metavar="IFACE:SERIAL[:DISPLAY_ID]",
+        help="Run a DeX session on this interface for this phone; repeat for several phones at once.",
+    )
     parser.add_argument("--display-id", type=int, help="scrcpy display id to open.")
+    parser.add_argument(
+        "--drain-mode",
+        choices=DRAIN_MODES,
+        default="discard",
+        help="How to drain the Miraclecast RTP stream: discard (default, dropped in the kernel), recv, stats, analyze.",
+    )
+    parser.add_argument(
+        "--reconnect-grace",
+        type=float,
+        default=ConnectionHandler.RECONNECT_GRACE,
+        metavar="SECONDS",
+        help="Keep scrcpy open this long after DeX disconnects so a quick reconnect resumes at once (0 disables).",
+    )
     parser.add_argument("--fullscreen", action="store_true", help="Start scrcpy in fullscreen mode.")
+    parser.add_argument(
+        "--scrcpy-profile",
+        metavar="NAME",
+        help=f"scrcpy performance profile: {AUTO_PROFILE} (default, from the DeX resolution), {', '.join(PROFILES)}, "
+        "or one defined in the config file.",
+    )
+    parser.add_argument(
+        "--scrcpy-option",
+        action="append",
+        type=scrcpy_option,
+        default=[],
+        metavar="KEY=VALUE",
+        help="Override one profile setting, e.g. max_fps=30 or audio=off; repeatable.",
+    )
+    parser.add_argument(
+        "--no-adaptive",
+        action="store_true",
+        help="Keep the scrcpy profile fixed instead of relaunching scrcpy with lighter settings when it skips frames.",
+    )
+    parser.add_argument(
+        "--stats-interval",
+        type=float,
+        default=ConnectionHandler.STATS_INTERVAL,
+        metavar="SECONDS",
+        help="Log a scrcpy frame rate and skipped-frame line this often while streaming (0 disables).",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        metavar="PORT",
+        help="Serve Prometheus metrics over HTTP on this port (e.g. 9477).",
+    )
+    parser.add_argument(
+        "--metrics-address",
+        default="127.0.0.1",
+        metavar="ADDRESS",
+        help="Address for --metrics-port (default: 127.0.0.1, local scrapes only).",
+    )
+    parser.add_argument(
+        "--metrics-textfile",
+        metavar="PATH",
+        help="Write Prometheus metrics to this file for node_exporter's textfile collector.",
+    )
+    parser.add_argument("--config", metavar="PATH", help=f"Settings file (default: {default_config_path()}).")
     parser.add_argument("--debug", action="store_true", help="Show debug logs.")
     parser.add_argument("--no-color", action="store_true", help="Disable colored terminal output.")
     parser.add_argument("--no-banner", action="store_true", help="Do not print the ASCII banner.")
     parser.add_argument("--yes", action="store_true", help="Do not ask before temporarily disabling network services.")
+    parser.add_argument(
+        "--network-mode",
+        choices=Commands.NETWORK_MODES,
+        default="services",
+        help="services (default): stop NetworkManager and wpa_supplicant; "
+        "interface: only take the selected interface away from them, keeping other connections up.",
+    )
     parser.add_argument("--log-file", help="Write debug logs to a file.")
+    parser.add_argument(
+        "--log-json",
+        metavar="PATH",
+        help="Also write debug logs as JSON lines with timestamps, source and session.",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Do not reuse or remember the interface, ADB device and display chosen in earlier sessions.",
+    )
+    parser.add_argument(
+        "--no-standby",
+        action="store_true",
+        help="Do not prepare adb and the scrcpy server on the phone while waiting for DeX.",
+    )
+    parser.add_argument(
+        "--flight-dir",
+        metavar="DIR",
+        help=f"Where to save the recent sinkctl and scrcpy output after a failure (default: {default_dump_dir()}).",
+    )
+    parser.add_argument(
+        "--no-flight-recorder",
+        action="store_true",
+        help="Do not save recent output after a failure.",
+    )
+    parser.add_argument("--trace", metavar="PATH", help="Write a timeline of the session phases to a file.")
+    parser.add_argument(
+        "--trace-format",
+        choices=TRACE_FORMATS,
+        default="chrome",
+        help="Timeline format: chrome (chrome://tracing, Perfetto) or plain json.",
+    )
     return parser
 
 
-def choose_interface(commands, requested):
-    interfaces = commands.get_p2p_interfaces()
+def session_spec(text):
+    try:
+        return parse_session_spec(text)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(str(exc)) from exc
+
+
+def scrcpy_option(text):
+    try:
+        return parse_option(text)
+    except ValueError as exc:
+        raise argparse.ArgumentTypeError(str(exc)) from exc
+
+
+def build_tuning(args):
+    try:
+        config = load_config(args.config)
+        return ScrcpyTuning(args.scrcpy_profile, dict(args.scrcpy_option), config.get("scrcpy"))
+    except ValueError as exc:
+        raise CommandError(f"Invalid scrcpy settings: {exc}") from exc
+
+
+def build_ctl_parser():
+    parser = argparse.ArgumentParser(prog="dexonlinux ctl", description="Control a running DexOnLinux daemon.")
+    parser.add_argument(
+        "command",
+        choices=CONTROL_COMMANDS,
+        help="status; start or stop streaming (Miraclecast stays up); events to follow the daemon; shutdown.",
+    )
+    parser.add_argument("--socket", help=f"Control socket path (default: {default_socket_path()}).")
+    parser.add_argument("--json", action="store_true", help="Print the daemon's raw JSON replies.")
+    parser.add_argument("--backlog", action="store_true", help="With events, first print the most recent past events.")
+    return parser
+
+
+def prefetched_or(prefetched, fetch):
+    # prefetched returns what a startup step already fetched, so it is only waited for once a cache miss needs it.
+    return prefetched() if prefetched is not None else fetch()
+
+
+def choose_interface(commands, requested, cache=None, interfaces=None):
+    selected = cache.cached_interface(commands.interface_fingerprint, requested) if cache else None
+    if selected:
+        logger.info("Using P2P-capable interface %s from the profile cache.", selected)
+        return selected
+
+    selected = probe_interface(commands, requested, interfaces)
+    if cache:
+        cache.remember_interface(selected, commands.interface_fingerprint(selected))
+    return selected
+
+
+def probe_interface(commands, requested, interfaces=None):
+    interfaces = prefetched_or(interfaces, commands.get_p2p_interfaces)
     if requested:
         if requested not in interfaces:
             available = ", ".join(interfaces) if interfaces else "none"
             raise CommandError(f"Interface '{requested}' is not available or not P2P-capable. Available: {available}")
         return requested
 
-    if not interfaces:
-        raise CommandError("No P2P-capable Wi-Fi interfaces found.")
+    changed = threading.Event()
+
+    def on_change(updated):
+        nonlocal interfaces
+        if updated != interfaces:
+            interfaces = updated
+            changed.set()
+
+    monitor = commands.watch_p2p_interfaces(on_change)
+    try:
+        while True:
+            changed.clear()
+            if not interfaces:
+                if monitor is None:
+                    raise CommandError("No P2P-capable Wi-Fi interfaces found.")
+                logger.warning(
+                    "No P2P-capable Wi-Fi interfaces found. Plug in an adapter within %.0f s or press CTRL+C.",
+                    INTERFACE_HOTPLUG_TIMEOUT,
+                )
+                if not changed.wait(INTERFACE_HOTPLUG_TIMEOUT):
+                    raise CommandError("No P2P-capable Wi-Fi interfaces found.")
+                continue
+
+            selected = select_from_list(interfaces, "Select a P2P-capable interface:", allow_refresh=monitor is not None)
+            if selected == "refresh":
+                continue
+            if selected is None:
+                raise CommandError("No interface selected.")
+            return selected
+    finally:
+        if monitor:
+            monitor.stop()
+
+
+def choose_adb_device(commands, requested, cache=None, devices=None):
+    cached_serial = None if requested or not cache else cache.last_device()
+    if cached_serial:
+        # Waiting on the prefetched listing is no slower than confirming the cached phone is attached afresh.
+        listed = prefetched_or(devices, commands.list_adb_devices)
+        match = next((device for device in listed if device.serial == cached_serial), None)
+        if match and match.is_authorized:
+            logger.info("Using ADB device %s from the profile cache.", match.serial)
+            cache.remember_device(match.serial)
+            return match
 
-    selected = select_from_list(interfaces, "Select a P2P-capable interface:")
-    if selected is None:
-        raise CommandError("No interface selected.")
+    selected = probe_adb_device(commands, requested, devices)
+    if cache:
+        cache.remember_device(selected.serial)
     return selected
 
 
-def choose_adb_device(commands, requested):
+def probe_adb_device(commands, requested, devices=None):
     if not requested:
         print_adb_instructions()
-    while True:
-        devices = commands.list_adb_devices()
-        if requested:
-            match = next((device for device in devices if device.serial == requested), None)
-            if match is None:
-                raise CommandError(f"ADB device '{requested}' was not found.")
-            if not match.is_authorized:
-                raise CommandError(f"ADB device '{requested}' is {match.state}. Authorize it and retry.")
-            return match
+    devices = prefetched_or(devices, commands.list_adb_devices)
+    if requested:
+        match = next((device for device in devices if device.serial == requested), None)
+        if match is None:
+            raise CommandError(f"ADB device '{requested}' was not found.")
+        if not match.is_authorized:
+            raise CommandError(f"ADB device '{requested}' is {match.state}. Authorize it and retry.")
+        return match
 
-        authorized = [device for device in devices if device.is_authorized]
-        blocked = [device for device in devices if not device.is_authorized]
-        for device in blocked:
-            logger.warning("ADB device %s is %s.", device.serial, device.state)
-
-        if authorized:
-            if len(authorized) == 1:
-                logger.info("Using ADB device %s.", authorized[0].serial)
-                return authorized[0]
-            selected = select_from_list(
-                authorized,
-                "Select an ADB device:",
-                formatter=lambda device: device.label(),
-                allow_refresh=True,
-            )
-            if selected == "refresh":
-                continue
-            if selected is not None:
-                return selected
-            raise CommandError("No ADB device selected.")
-        else:
-            logger.error("No authorized ADB devices found.")
+    changed = threading.Event()
 
-        choice = input(colored("Press Enter to refresh ADB devices or type q to quit: ", Fore.LIGHTYELLOW_EX))
-        if choice.strip().lower() == "q":
-            raise CommandError("No ADB device selected.")
+    def on_change(updated):
+        nonlocal devices
+        devices = updated
+        changed.set()
 
+    tracker = commands.watch_adb_devices(on_change)
+    try:
+        while True:
+            changed.clear()
+            authorized = [device for device in devices if device.is_authorized]
+            blocked = [device for device in devices if not device.is_authorized]
+            for device in blocked:
+                logger.warning("ADB device %s is %s.", device.serial, device.state)
+
+            if authorized:
+                if len(authorized) == 1:
+                    logger.info("Using ADB device %s.", authorized[0].serial)
+                    return authorized[0]
+                selected = select_from_list(
+                    authorized,
+                    "Select an ADB device:",
+                    formatter=lambda device: device.label(),
+                    allow_refresh=True,
+                )
+                if selected == "refresh":
+                    devices = commands.list_adb_devices()
+                    continue
+                if selected is not None:
+                    return selected
+                raise CommandError("No ADB device selected.")
+
+            if tracker is not None and tracker.running:
+                # The adb server pushes arrivals and authorization changes, so there is nothing to poll.
+                logger.error("No authorized ADB devices found. Waiting for one; press CTRL+C to quit.")
+                while not changed.wait(1.0) and tracker.running:
+                    pass
+                continue
 
-def prepare_commands():
-    probe = Commands("", validate=False)
-    missing = probe.missing_dependencies()
+            logger.error("No authorized ADB devices found.")
+            choice = input(colored("Press Enter to refresh ADB devices or type q to quit: ", Fore.LIGHTYELLOW_EX))
+            if choice.strip().lower() == "q":
+                raise CommandError("No ADB device selected.")
+            devices = commands.list_adb_devices()
+    finally:
+        if tracker:
+            tracker.stop()
+
+
+def prepare_commands(args, startup):
+    commands = Commands("", validate=False)
+    # None of this needs root, so it runs on the startup pool while the password is typed.
+    startup.add("dependencies", commands.missing_dependencies)
+    startup.add("cache", lambda: None if args.no_cache else ProfileCache())
+    startup.add("interfaces", commands.get_p2p_interfaces)
+    # Also starts the adb server when it is not running yet.
+    startup.add("adb_devices", commands.list_adb_devices)
+
+    missing = startup.result("dependencies")
     if missing:
         raise CommandError("Missing dependencies: " + ", ".join(missing))
 
-    sudo_password = getpass.getpass(f"[sudo] password for {getpass.getuser()}: ")
-    return Commands(sudo_password, validate=True)
+    flush_logs()
+    with span("sudo.prompt"):
+        sudo_password = startup.prompt("password", getpass.getpass, f"[sudo] password for {getpass.getuser()}: ")
+    commands.set_sudo_password(sudo_password)
+    startup.add("helper", lambda password: commands.start_privileged_helper(), after=("password",))
+    return commands
+
+
+def settle_specs(commands, specs):
+    for spec in specs:
+        spec.interface_index = commands.get_interface_index(spec.interface)
+    assign_ports(commands, specs)
 
 
 def run(args):
     if not args.no_banner:
         print_ascii_art()
 
-    commands = prepare_commands()
-    selected_interface = choose_interface(commands, args.interface)
-    selected_device = choose_adb_device(commands, args.device)
-
-    if not args.yes:
-        ok = confirm("DexOnLinux will temporarily disable NetworkManager and wpa_supplicant. Continue?", default=False)
-        if not ok:
-            raise CommandError("Aborted before disabling network services.")
-
-    with DexRuntime(commands) as runtime:
-        runtime.disable_network()
-        runtime.miracle_wifi = commands.start_miracle_wifi(selected_interface)
-
-        interface_index = commands.get_interface_index(selected_interface)
-        port = args.port or commands.get_available_udp_port()
-        stop_requested = threading.Event()
-
-        handler = ConnectionHandler(
-            commands,
-            selected_device.serial,
-            port,
-            display_id=args.display_id,
-            fullscreen=args.fullscreen,
-            on_scrcpy_closed=stop_requested.set,
-        )
-        runtime.connection_handler = handler
-        runtime.miracle_sinkctl = commands.start_miracle_sinkctl(
-            interface_index,
-            port,
-            event_callback=handler.handle_sinkctl_event,
-        )
-
+    tuning = build_tuning(args)
+    startup = StartupGraph(started=getattr(args, "launched", None))
+    commands = None
+    try:
+        commands = prepare_commands(args, startup)
+        cache = startup.result("cache")
+        if args.session:
+            if args.interface or args.device or args.display_id is not None or args.port:
+                raise CommandError("--session cannot be combined with --interface, --device, --display-id or --port.")
+            specs = args.session
+            validate_specs(commands, specs, startup.result("interfaces"), startup.result("adb_devices"))
+        else:
+            selected_interface = startup.waiting(choose_interface, commands, args.interface, cache, functools.partial(startup.result, "interfaces"))
+            selected_device = startup.waiting(choose_adb_device, commands, args.device, cache, functools.partial(startup.result, "adb_devices"))
+            specs = [SessionSpec(selected_interface, selected_device.serial, args.display_id, args.port)]
+        interfaces = [spec.interface for spec in specs]
+
+        # The privileged helper has been starting, which checks the password, while interfaces and devices were picked.
+        if not startup.result("helper"):
+            raise CommandError("Incorrect sudo password.")
+
+        if not args.yes:
+            if args.network_mode == "interface":
+                prompt = f"DexOnLinux will take {', '.join(interfaces)} away from NetworkManager and wpa_supplicant until it exits. Continue?"
+            else:
+                prompt = "DexOnLinux will temporarily disable NetworkManager and wpa_supplicant. Continue?"
+            ok = startup.waiting(confirm, prompt, False)
+            if not ok:
+                raise CommandError("Aborted before disabling network services.")
+
+        with DexRuntime(commands) as runtime:
+            # Interface indexes and RTP ports need no root, so they are settled while the network stops.
+            startup.add("specs", lambda: settle_specs(commands, specs))
+            runtime.disable_network(args.network_mode, interfaces)
+            runtime.miracle_wifi = commands.start_miracle_wifi(interfaces)
+            startup.result("specs")
+            startup.close()
+            return asyncio.run(serve(args, commands, runtime, specs, cache, tuning, startup))
+    finally:
+        startup.close()
+        if commands:
+            # After DexRuntime has used it to restore the network; anything it still runs is stopped with it.
+            commands.close_privileged_helper()
+
+
+async def serve(args, commands, runtime, specs, cache, tuning=None, startup=None):
+    # One event loop supervises every session: child exits arrive through pidfds and the PTYs, scrcpy output
+    # and RTP sockets are loop readers, so nothing polls while waiting for DeX.
+    loop = asyncio.get_running_loop()
+    stop_requested = asyncio.Event()
+    control = None
+    if args.daemon:
+        # The daemon outlives scrcpy: closing the window only ends that DeX session.
+        info = {"pid": os.getpid()}
+        if len(specs) == 1:
+            info["interface_index"] = specs[0].interface_index
+        control = ControlServer(None, args.socket, info=info, on_shutdown=stop_requested.set)
+    metrics = DexMetrics() if args.metrics_port is not None or args.metrics_textfile else None
+    listeners = [listener for listener in (control.publish if control else None, metrics.observe_event if metrics else None) if listener]
+
+    def publish(name, data):
+        for listener in listeners:
+            listener(name, data)
+
+    sessions = SessionManager(
+        commands,
+        specs,
+        on_event=publish if listeners else None,
+        fullscreen=args.fullscreen,
+        drain_mode=args.drain_mode,
+        cache=cache,
+        standby=not args.no_standby,
+        # With several sessions, closing one window must not end the others.
+        on_scrcpy_closed=None if control or len(specs) > 1 else stop_requested.set,
+        reconnect_grace=args.reconnect_grace,
+        tuning=tuning,
+        adaptive=not args.no_adaptive,
+        stats_interval=args.stats_interval,
+    )
+    runtime.sessions = sessions
+    sessions.create_handlers()
+    await sessions.start(runtime.miracle_wifi)
+
+    exporters = []
+    if metrics:
+        metrics.watch_process("miracle-wifid", runtime.miracle_wifi)
+        metrics.watch_sessions(sessions)
+        if args.metrics_port is not None:
+            server = MetricsServer(metrics, args.metrics_address, args.metrics_port)
+            try:
+                await server.start()
+            except OSError as exc:
+                raise CommandError(f"Could not serve metrics on {args.metrics_address}:{args.metrics_port}: {exc}") from exc
+            exporters.append(server)
+        if args.metrics_textfile:
+            writer = TextfileWriter(metrics, args.metrics_textfile)
+            writer.start()
+            exporters.append(writer)
+
+    if control:
+        control.handler = sessions
+        try:
+            await control.start()
+        except OSError as exc:
+            raise CommandError(f"Could not open the control socket: {exc}") from exc
+    else:
         print_dex_instructions()
 
-        interrupted = False
+    interrupted = False
 
-        def request_stop(signum, frame):
-            nonlocal interrupted
-            interrupted = True
-            stop_requested.set()
+    def request_stop():
+        nonlocal interrupted
+        interrupted = True
+        stop_requested.set()
 
-        previous_sigint = signal.signal(signal.SIGINT, request_stop)
-        previous_sigterm = signal.signal(signal.SIGTERM, request_stop)
-        try:
-            logger.info("Waiting for DeX connection. Press CTRL+C to exit.")
-            while not stop_requested.is_set():
-                if runtime.miracle_wifi.poll() is not None:
-                    raise CommandError("miracle-wifid stopped unexpectedly.")
-                if runtime.miracle_sinkctl.poll() is not None:
-                    raise CommandError("miracle-sinkctl stopped unexpectedly.")
-                time.sleep(0.25)
-        finally:
-            signal.signal(signal.SIGINT, previous_sigint)
-            signal.signal(signal.SIGTERM, previous_sigterm)
-
-        return 130 if interrupted else 0
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(signum, request_stop)
+    wifi_exited = process_exited(runtime.miracle_wifi)
+    sinkctl_exits = sessions.sinkctl_exits()
+    stop_waiter = loop.create_task(stop_requested.wait())
+    try:
+        mark("dex.waiting", sessions=len(specs))
+        logger.info("Waiting for DeX connection. Press CTRL+C to exit.")
+        if startup:
+            mark("startup.ready", elapsed_s=round(startup.elapsed(), 3), prompts_s=round(startup.prompt_time, 3))
+            logger.info("%s", startup.summary())
+        await asyncio.wait({stop_waiter, wifi_exited, *sinkctl_exits}, return_when=asyncio.FIRST_COMPLETED)
+        if not stop_requested.is_set():
+            name = "miracle-wifid" if wifi_exited.done() else "miracle-sinkctl"
+            mark(f"{name}.exit")
+            raise CommandError(f"{name} stopped unexpectedly.")
+    finally:
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.remove_signal_handler(signum)
+        for waiter in (stop_waiter, wifi_exited, *sinkctl_exits):
+            waiter.cancel()
+        await sessions.close()
+        for exporter in exporters:
+            await exporter.close()
+        if control:
+            await control.close()
+
+    return 130 if interrupted else 0
+
+
+def run_ctl(args):
+    try:
+        for reply in send_command(args.command, args.socket, backlog=args.backlog):
+            if args.json:
+                print(json.dumps(reply), flush=True)
+            elif "event" in reply:
+                details = " ".join(f"{key}={value}" for key, value in reply.items() if key not in ("event", "time"))
+                print(f"{time.strftime('%H:%M:%S', time.localtime(reply['time']))} {reply['event']} {details}".rstrip(), flush=True)
+            elif not reply.get("ok"):
+                logger.error("%s", reply.get("error", "Request failed."))
+                return 1
+            else:
+                for key, value in reply.items():
+                    if key != "ok":
+                        print(f"{key}: {value}")
+    except (FileNotFoundError, ConnectionRefusedError):
+        logger.error("No DexOnLinux daemon is listening on %s.", args.socket or default_socket_path())
+        return 1
+    except KeyboardInterrupt:
+        return 130
+    return 0
 
 
 def main(argv=None):
-    parser = build_parser()
-    args = parser.parse_args(argv)
-    configure_logger(debug=args.debug, no_color=args.no_color, log_file=args.log_file)
+    launched = time.monotonic()
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if argv[:1] == ["ctl"]:
+        return run_ctl(build_ctl_parser().parse_args(argv[1:]))
+    daemon = argv[:1] == ["daemon"]
+    parser = build_parser(daemon=daemon)
+    args = parser.parse_args(argv[1:] if daemon else argv)
+    args.daemon = daemon
+    args.launched = launched
+    configure_logger(debug=args.debug, no_color=args.no_color, log_file=args.log_file, json_file=args.log_json)
+    timeline = enable_tracing() if args.trace else None
+    recorder = get_recorder()
+    recorder.enabled = not args.no_flight_recorder
+    if args.flight_dir:
+        recorder.dump_dir = Path(args.flight_dir)
     try:
         return run(args)
     except CommandError as exc:
         logger.error("%s", exc)
+        save_flight_record(recorder, str(exc))
         return 1
     except Exception as exc:
         logger.exception("Unexpected error: %s", exc)
+        save_flight_record(recorder, f"unexpected error: {exc!r}")
         return 1
+    finally:
+        if timeline:
+            write_trace(timeline, args.trace, args.trace_format)
+
+
+def save_flight_record(recorder, reason):
+    path = recorder.dump(reason, force=True)
+    if path:
+        logger.info("Recent sinkctl and scrcpy output saved to %s; attach it when reporting the problem.", path)
+
+
+def write_trace(timeline, path, trace_format):
+    try:
+        timeline.write(path, trace_format)
+    except OSError as exc:
+        logger.error("Could not write trace to %s: %s", path, exc)
+        return
+    for metric, values in timeline.summary().items():
+        logger.info("%s: %s", metric, ", ".join(f"{value:.0f}" for value in values))
+    logger.info("Session timeline written to %s.", path)
 
 
 if __name__ == "__main__":
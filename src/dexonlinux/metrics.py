@@ -0,0 +1,297 @@
+import asyncio
+import math
+import os
+import time
+from pathlib import Path
+
+from dexonlinux.sinkctl import EVENT_FACTORIES
+from dexonlinux.utils import dropped_log_records, get_logger
+
+logger = get_logger()
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# Seconds; spans a warm reconnect (tens of ms) up to a cold start with a display prompt.
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Seconds; from a blip-length session to a working day.
+DURATION_BUCKETS = (10, 60, 300, 900, 1800, 3600, 7200, 14400, 28800)
+TEXTFILE_INTERVAL = 15.0
+MAX_REQUEST_HEADER = 8192
+
+
+def _escape(value, quote=True):
+    value = str(value).replace("\\", "\\\\").replace("\n", "\\n")
+    return value.replace('"', '\\"') if quote else value
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _labels(names, values, extra=()):
+    pairs = [*zip(names, values), *extra]
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, help_text, labelnames=()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {_escape(self.help, quote=False)}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def set_total(self, value, **labels):
+        # For totals another object already keeps, copied in at render time.
+        self.values[self._key(labels)] = value
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        self.values[self._key(labels)] = value
+
+    def clear(self):
+        self.values.clear()
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labelnames)
+        self.buckets = (*sorted(buckets), math.inf)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        state = self.values.get(key)
+        if state is None:
+            state = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+        counts = state[0]
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[index] += 1
+                break
+        state[1] += value
+        state[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {_escape(self.help, quote=False)}", f"# TYPE {self.name} {self.kind}"]
+        for key, (counts, total, count) in sorted(self.values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, [('le', _format_value(bound))])} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class DexMetrics:
+    # Everything is updated and rendered on the event loop thread, so plain ints need no locks. Event-driven
+    # metrics come from the handlers' on_event stream; liveness and drainer totals are read at render time,
+    # so the sinkctl and RTP paths do no extra work for them.
+    def __init__(self):
+        self.started_at = time.time()
+        self._processes = {}
+        self._sessions = None
+        self._timing = {}
+        self.up = Gauge("dexonlinux_process_up", "Whether a child process DexOnLinux started is running.", ("process", "session"))
+        self.sinkctl_events = Counter("dexonlinux_sinkctl_events_total", "miracle-sinkctl events seen.", ("session", "event"))
+        self.connect_latency = Histogram(
+            "dexonlinux_connect_latency_seconds",
+            "Time from DeX reporting its stream until scrcpy shows it; reconnect follows a disconnect.",
+            ("session", "kind"),
+        )
+        self.session_duration = Histogram(
+            "dexonlinux_scrcpy_session_duration_seconds",
+            "How long each scrcpy window stayed open.",
+            ("session",),
+            buckets=DURATION_BUCKETS,
+        )
+        self.scrcpy_starts = Counter("dexonlinux_scrcpy_starts_total", "scrcpy launches, including adaptive relaunches.", ("session",))
+        self.rtp_packets = Counter("dexonlinux_rtp_received_packets_total", "RTP datagrams read by the drainer.", ("session",))
+        self.rtp_bytes = Counter("dexonlinux_rtp_received_bytes_total", "RTP bytes read by the drainer.", ("session",))
+        self.rtp_dropped = Counter(
+            "dexonlinux_rtp_kernel_dropped_packets_total",
+            "RTP datagrams dropped by the kernel, including the discard filter.",
+            ("session",),
+        )
+        self.log_dropped = Counter("dexonlinux_log_records_dropped_total", "Log records dropped because the log writer fell behind.")
+        self.start_time = Gauge("dexonlinux_start_time_seconds", "Unix time DexOnLinux started.")
+        self.start_time.set(self.started_at)
+
+    def watch_process(self, name, process):
+        self._processes[name] = process
+
+    def watch_sessions(self, sessions):
+        self._sessions = sessions
+
+    def observe_event(self, name, data):
+        session = data.get("session", "")
+        now = time.monotonic()
+        timing = self._timing.setdefault(session, {"stream_at": None, "reconnect": False, "scrcpy_at": None})
+        if name in EVENT_FACTORIES:
+            self.sinkctl_events.inc(session=session, event=name)
+        if name in ("resolution", "connected"):
+            if timing["stream_at"] is None:
+                timing["stream_at"] = now
+        elif name == "disconnected":
+            timing["stream_at"] = None
+            timing["reconnect"] = True
+        elif name == "resumed_from_grace" and data.get("scrcpy_running"):
+            self._observe_connect(session, timing, now)
+        elif name == "scrcpy_started":
+            self.scrcpy_starts.inc(session=session)
+            self._observe_connect(session, timing, now)
+            timing["scrcpy_at"] = now
+        elif name in ("scrcpy_closed", "scrcpy_stopped"):
+            if timing["scrcpy_at"] is not None:
+                self.session_duration.observe(now - timing["scrcpy_at"], session=session)
+                timing["scrcpy_at"] = None
+
+    def _observe_connect(self, session, timing, now):
+        if timing["stream_at"] is None:
+            return
+        kind = "reconnect" if timing["reconnect"] else "connect"
+        self.connect_latency.observe(now - timing["stream_at"], session=session, kind=kind)
+        timing["stream_at"] = None
+        timing["reconnect"] = False
+
+    def _collect(self):
+        self.log_dropped.set_total(dropped_log_records())
+        self.up.clear()
+        for name, process in self._processes.items():
+            self.up.set(int(process is not None and process.poll() is None), process=name, session="")
+        if self._sessions is None:
+            return
+        for spec, handler, sinkctl in self._sessions.session_processes():
+            session = spec.label if self._sessions.multiple else ""
+            self.up.set(int(sinkctl is not None and sinkctl.poll() is None), process="miracle-sinkctl", session=session)
+            scrcpy = handler.scrcpy_process
+            self.up.set(int(scrcpy is not None and scrcpy.poll() is None), process="scrcpy", session=session)
+            counters = handler.rtp_counters()
+            self.rtp_packets.set_total(counters["packets"], session=session)
+            self.rtp_bytes.set_total(counters["bytes"], session=session)
+            self.rtp_dropped.set_total(counters["kernel_dropped"], session=session)
+
+    def render(self):
+        self._collect()
+        lines = []
+        for metric in (
+            self.up,
+            self.start_time,
+            self.sinkctl_events,
+            self.connect_latency,
+            self.session_duration,
+            self.scrcpy_starts,
+            self.rtp_packets,
+            self.rtp_bytes,
+            self.rtp_dropped,
+            self.log_dropped,
+        ):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    # Answers GET /metrics over HTTP/1.0 on the event loop; one short response per connection.
+    def __init__(self, metrics, host="127.0.0.1", port=9477):
+        self.metrics = metrics
+        self.host = host
+        self.port = port
+        self._server = None
+
+    async def start(self):
+        # The limit bounds what readuntil buffers per scrape connection before giving up on the header.
+        self._server = await asyncio.start_server(self._serve_client, self.host, self.port, limit=MAX_REQUEST_HEADER)
+        logger.info("Metrics available at http://%s:%s/metrics.", self.host, self.port)
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _serve_client(self, reader, writer):
+        try:
+            header = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), 5.0)
+            request = header.split(b"\r\n", 1)[0].decode("latin-1").split()
+            if len(request) < 2 or request[0] not in ("GET", "HEAD"):
+                self._respond(writer, "405 Method Not Allowed", "only GET is supported\n")
+            elif request[1].split("?", 1)[0] not in ("/metrics", "/"):
+                self._respond(writer, "404 Not Found", "try /metrics\n")
+            else:
+                self._respond(writer, "200 OK", self.metrics.render(), head=request[0] == "HEAD")
+            await writer.drain()
+        except asyncio.LimitOverrunError:
+            self._respond(writer, "431 Request Header Fields Too Large", "request header too large\n")
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    def _respond(writer, status, body, head=False):
+        payload = body.encode()
+        writer.write(
+            f"HTTP/1.0 {status}\r\nContent-Type: {CONTENT_TYPE}\r\nContent-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode()
+        )
+        if not head:
+            writer.write(payload)
+
+
+class TextfileWriter:
+    # For node_exporter's textfile collector: rewrites PATH every interval and once more on close.
+    def __init__(self, metrics, path, interval=TEXTFILE_INTERVAL):
+        self.metrics = metrics
+        self.path = Path(path)
+        self.interval = interval
+        self._timer = None
+
+    def start(self):
+        self.write()
+        self._timer = asyncio.get_running_loop().call_later(self.interval, self._tick)
+
+    def _tick(self):
+        self.write()
+        self._timer = asyncio.get_running_loop().call_later(self.interval, self._tick)
+
+    def write(self):
+        # Written next to the target and renamed, so the collector never reads half a file.
+        temporary = self.path.with_name(f".{self.path.name}.{os.getpid()}.tmp")
+        try:
+            temporary.write_text(self.metrics.render())
+            os.replace(temporary, self.path)
+        except OSError as exc:
+            logger.debug("Could not write metrics to %s: %s", self.path, exc)
+
+    async def close(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        self.write()
@@ -0,0 +1,223 @@
+TS_PACKET_SIZE = 188
+SYNC_BYTE = 0x47
+PAT_PID = 0x0000
+NULL_PID = 0x1FFF
+PID_COUNT = 0x2000
+NO_CONTINUITY = 0xFF
+PTS_CLOCK_RATE = 90000
+PTS_WRAP = 1 << 33
+RATE_WINDOW_NS = 1_000_000_000
+
+VIDEO_STREAM_TYPES = {0x01: "mpeg1", 0x02: "mpeg2", 0x1B: "h264", 0x24: "hevc"}
+AUDIO_STREAM_TYPES = {0x03: "mp1", 0x04: "mp2", 0x0F: "aac", 0x11: "aac-latm", 0x81: "ac3", 0x83: "lpcm"}
+# NAL unit types that start a GOP: H.264 IDR, HEVC IDR_W_RADL, IDR_N_LP and CRA.
+H264_KEYFRAME_NALS = frozenset((5,))
+HEVC_KEYFRAME_NALS = frozenset((19, 20, 21))
+NAL_START_CODE = b"\x00\x00\x01"
+
+
+class TsAnalyzer:
+    # Incremental MPEG-TS demuxer for the WFD payload. All state lives in fixed-size
+    # tables and counters, so a session can run for hours without growing memory.
+    def __init__(self):
+        self._continuity = bytearray(PID_COUNT)
+        self.reset()
+
+    def reset(self):
+        self._continuity[:] = bytes([NO_CONTINUITY]) * PID_COUNT
+        self.packets = 0
+        self.sync_errors = 0
+        self.transport_errors = 0
+        self.continuity_errors = 0
+        self.pmt_pid = None
+        self.video_pid = None
+        self.audio_pid = None
+        self.video_codec = None
+        self.audio_codec = None
+        self.video_frames = 0
+        self.keyframes = 0
+        self.gop_length = 0
+        self.frame_rate = 0.0
+        self.video_bitrate = 0.0
+        self.audio_bitrate = 0.0
+        self.last_video_pts = None
+        self._frames_since_keyframe = 0
+        self._rate_window_pts = None
+        self._rate_window_frames = 0
+        self._bitrate_window_start = None
+        self._video_window_bytes = 0
+        self._audio_window_bytes = 0
+
+    def feed(self, buffer, start, end, arrival_ns):
+        offset = start
+        while offset + TS_PACKET_SIZE <= end:
+            if buffer[offset] != SYNC_BYTE:
+                # WFD aligns TS packets to the RTP payload; if not, drop the rest of the datagram.
+                self.sync_errors += 1
+                break
+            self._packet(buffer, offset)
+            offset += TS_PACKET_SIZE
+        self._update_bitrates(arrival_ns)
+
+    def _packet(self, buffer, offset):
+        self.packets += 1
+        flags = buffer[offset + 1]
+        pid = ((flags & 0x1F) << 8) | buffer[offset + 2]
+        control = buffer[offset + 3]
+        packet_end = offset + TS_PACKET_SIZE
+        if flags & 0x80:
+            self.transport_errors += 1
+            return
+        if pid == NULL_PID:
+            return
+
+        payload = offset + 4
+        random_access = False
+        discontinuity = False
+        if control & 0x20:
+            adaptation_length = buffer[payload]
+            if adaptation_length:
+                adaptation_flags = buffer[payload + 1]
+                discontinuity = bool(adaptation_flags & 0x80)
+                random_access = bool(adaptation_flags & 0x40)
+            payload += 1 + adaptation_length
+        if not control & 0x10 or payload >= packet_end:
+            return
+
+        counter = control & 0x0F
+        previous = self._continuity[pid]
+        if previous != NO_CONTINUITY and not discontinuity and counter != previous:
+            if counter != (previous + 1) & 0x0F:
+                self.continuity_errors += 1
+        self._continuity[pid] = counter
+
+        unit_start = flags & 0x40
+        if pid == self.video_pid:
+            self._video_window_bytes += packet_end - payload
+            if unit_start:
+                self._video_pes(buffer, payload, packet_end, random_access)
+        elif pid == self.audio_pid:
+            self._audio_window_bytes += packet_end - payload
+        elif not unit_start:
+            return
+        elif pid == PAT_PID:
+            self._pat(buffer, payload + 1 + buffer[payload], packet_end)
+        elif pid == self.pmt_pid:
+            self._pmt(buffer, payload + 1 + buffer[payload], packet_end)
+
+    def _pat(self, buffer, section, packet_end):
+        if section + 8 > packet_end or buffer[section] != 0x00:
+            return
+        section_end = min(section + 3 + (((buffer[section + 1] & 0x0F) << 8) | buffer[section + 2]) - 4, packet_end)
+        entry = section + 8
+        while entry + 4 <= section_end:
+            program_number = (buffer[entry] << 8) | buffer[entry + 1]
+            if program_number:
+                self.pmt_pid = ((buffer[entry + 2] & 0x1F) << 8) | buffer[entry + 3]
+                return
+            entry += 4
+
+    def _pmt(self, buffer, section, packet_end):
+        if section + 12 > packet_end or buffer[section] != 0x02:
+            return
+        section_end = min(section + 3 + (((buffer[section + 1] & 0x0F) << 8) | buffer[section + 2]) - 4, packet_end)
+        entry = section + 12 + (((buffer[section + 10] & 0x0F) << 8) | buffer[section + 11])
+        video_pid = audio_pid = None
+        while entry + 5 <= section_end:
+            stream_type = buffer[entry]
+            pid = ((buffer[entry + 1] & 0x1F) << 8) | buffer[entry + 2]
+            if video_pid is None and stream_type in VIDEO_STREAM_TYPES:
+                video_pid = pid
+                self.video_codec = VIDEO_STREAM_TYPES[stream_type]
+            elif audio_pid is None and stream_type in AUDIO_STREAM_TYPES:
+                audio_pid = pid
+                self.audio_codec = AUDIO_STREAM_TYPES[stream_type]
+            entry += 5 + (((buffer[entry + 3] & 0x0F) << 8) | buffer[entry + 4])
+        self.video_pid = video_pid
+        self.audio_pid = audio_pid
+
+    def _video_pes(self, buffer, pes, packet_end, random_access):
+        if pes + 9 > packet_end or buffer[pes] or buffer[pes + 1] or buffer[pes + 2] != 0x01:
+            return
+        header_end = pes + 9 + buffer[pes + 8]
+        if buffer[pes + 7] & 0x80 and pes + 14 <= packet_end:
+            self._frame_pts(
+                ((buffer[pes + 9] & 0x0E) << 29)
+                | (buffer[pes + 10] << 22)
+                | ((buffer[pes + 11] & 0xFE) << 14)
+                | (buffer[pes + 12] << 7)
+                | (buffer[pes + 13] >> 1)
+            )
+
+        self.video_frames += 1
+        if random_access or self._starts_with_keyframe(buffer, header_end, packet_end):
+            if self.keyframes:
+                self.gop_length = self._frames_since_keyframe
+            self.keyframes += 1
+            self._frames_since_keyframe = 0
+        self._frames_since_keyframe += 1
+
+    def _starts_with_keyframe(self, buffer, start, end):
+        if self.video_codec == "h264":
+            keyframe_nals, hevc = H264_KEYFRAME_NALS, False
+        elif self.video_codec == "hevc":
+            keyframe_nals, hevc = HEVC_KEYFRAME_NALS, True
+        else:
+            return False
+        position = buffer.find(NAL_START_CODE, start, end)
+        while 0 <= position < end - 3:
+            header = buffer[position + 3]
+            nal_type = (header >> 1) & 0x3F if hevc else header & 0x1F
+            if nal_type in keyframe_nals:
+                return True
+            position = buffer.find(NAL_START_CODE, position + 3, end)
+        return False
+
+    def _frame_pts(self, pts):
+        if self._rate_window_pts is None:
+            self._rate_window_pts = pts
+            self._rate_window_frames = 0
+        else:
+            self._rate_window_frames += 1
+            span = (pts - self._rate_window_pts) % PTS_WRAP
+            if span >= PTS_CLOCK_RATE:
+                if span < 10 * PTS_CLOCK_RATE:
+                    self.frame_rate = self._rate_window_frames * PTS_CLOCK_RATE / span
+                self._rate_window_pts = pts
+                self._rate_window_frames = 0
+        self.last_video_pts = pts
+
+    def _update_bitrates(self, arrival_ns):
+        if self._bitrate_window_start is None:
+            self._bitrate_window_start = arrival_ns
+            return
+        elapsed = arrival_ns - self._bitrate_window_start
+        if elapsed >= RATE_WINDOW_NS:
+            self.video_bitrate = self._video_window_bytes * 8 * 1_000_000_000 / elapsed
+            self.audio_bitrate = self._audio_window_bytes * 8 * 1_000_000_000 / elapsed
+            self._bitrate_window_start = arrival_ns
+            self._video_window_bytes = 0
+            self._audio_window_bytes = 0
+
+    def snapshot(self):
+        return {
+            "packets": self.packets,
+            "video_codec": self.video_codec,
+            "audio_codec": self.audio_codec,
+            "video_frames": self.video_frames,
+            "keyframes": self.keyframes,
+            "frame_rate": self.frame_rate,
+            "gop_length": self.gop_length,
+            "video_bitrate_bps": self.video_bitrate,
+            "audio_bitrate_bps": self.audio_bitrate,
+            "continuity_errors": self.continuity_errors,
+            "sync_errors": self.sync_errors,
+            "transport_errors": self.transport_errors,
+        }
+
+    def summary(self):
+        return (
+            f"{self.video_codec or 'unknown'} video {self.frame_rate:.1f} fps, GOP {self.gop_length}, "
+            f"{self.video_bitrate / 1e6:.1f} Mbit/s; {self.audio_codec or 'no'} audio "
+            f"{self.audio_bitrate / 1e3:.0f} kbit/s; {self.continuity_errors} continuity errors"
+        )
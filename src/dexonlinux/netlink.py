@@ -0,0 +1,260 @@
+import os
+import socket
+import struct
+import threading
+
+from dexonlinux.utils import get_logger
+
+logger = get_logger()
+
+NETLINK_ROUTE = 0
+NETLINK_GENERIC = 16
+NLMSG_HEADER = struct.Struct("=IHHII")
+GENL_HEADER = struct.Struct("=BBH")
+NLA_HEADER = struct.Struct("=HH")
+IFINFO_HEADER = struct.Struct("=BxHiII")
+NLM_F_REQUEST = 0x01
+NLM_F_MULTI = 0x02
+NLM_F_ACK = 0x04
+NLM_F_DUMP = 0x300
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLA_TYPE_MASK = 0x3FFF
+
+GENL_ID_CTRL = 0x10
+CTRL_CMD_GETFAMILY = 3
+CTRL_ATTR_FAMILY_ID = 1
+CTRL_ATTR_FAMILY_NAME = 2
+
+NL80211_CMD_GET_WIPHY = 1
+NL80211_CMD_GET_INTERFACE = 5
+NL80211_ATTR_WIPHY = 1
+NL80211_ATTR_IFINDEX = 3
+NL80211_ATTR_IFNAME = 4
+NL80211_ATTR_IFTYPE = 5
+NL80211_ATTR_MAC = 6
+NL80211_ATTR_SUPPORTED_IFTYPES = 32
+NL80211_ATTR_SPLIT_WIPHY_DUMP = 174
+NL80211_IFTYPE_P2P_CLIENT = 8
+NL80211_IFTYPE_P2P_GO = 9
+NL80211_IFTYPE_P2P_DEVICE = 10
+P2P_IFTYPES = frozenset((NL80211_IFTYPE_P2P_CLIENT, NL80211_IFTYPE_P2P_GO))
+
+RTMGRP_LINK = 0x1
+RTM_NEWLINK = 16
+RTM_DELLINK = 17
+
+RECV_BUFFER_SIZE = 65536
+
+
+class NetlinkError(OSError):
+    pass
+
+
+class WirelessInterface:
+    def __init__(self, ifindex, name, wiphy, iftype=None, mac=None):
+        self.ifindex = ifindex
+        self.name = name
+        self.wiphy = wiphy
+        self.iftype = iftype
+        self.mac = mac
+
+
+def _align(length):
+    return (length + 3) & ~3
+
+
+def pack_attribute(attr_type, value):
+    return NLA_HEADER.pack(NLA_HEADER.size + len(value), attr_type) + value + b"\0" * (_align(len(value)) - len(value))
+
+
+def parse_messages(data):
+    messages = []
+    offset = 0
+    while offset + NLMSG_HEADER.size <= len(data):
+        length, msg_type, flags, seq, _ = NLMSG_HEADER.unpack_from(data, offset)
+        if length < NLMSG_HEADER.size or offset + length > len(data):
+            break
+        messages.append((msg_type, flags, seq, data[offset + NLMSG_HEADER.size : offset + length]))
+        offset += _align(length)
+    return messages
+
+
+def parse_attributes(data, offset=0):
+    attributes = {}
+    while offset + NLA_HEADER.size <= len(data):
+        length, attr_type = NLA_HEADER.unpack_from(data, offset)
+        if length < NLA_HEADER.size:
+            break
+        attributes[attr_type & NLA_TYPE_MASK] = data[offset + NLA_HEADER.size : offset + length]
+        offset += _align(length)
+    return attributes
+
+
+def _u32(value):
+    return struct.unpack_from("=I", value)[0]
+
+
+def parse_interfaces(messages):
+    interfaces = []
+    for _, _, _, payload in messages:
+        attributes = parse_attributes(payload, GENL_HEADER.size)
+        # P2P-device wdevs have no netdev, so no ifindex, and cannot be handed to Miraclecast.
+        if NL80211_ATTR_IFINDEX not in attributes or NL80211_ATTR_WIPHY not in attributes:
+            continue
+        mac = attributes.get(NL80211_ATTR_MAC)
+        interfaces.append(
+            WirelessInterface(
+                ifindex=_u32(attributes[NL80211_ATTR_IFINDEX]),
+                name=bytes(attributes.get(NL80211_ATTR_IFNAME, b"")).rstrip(b"\0").decode(errors="replace"),
+                wiphy=_u32(attributes[NL80211_ATTR_WIPHY]),
+                iftype=_u32(attributes[NL80211_ATTR_IFTYPE]) if NL80211_ATTR_IFTYPE in attributes else None,
+                mac=":".join(f"{byte:02x}" for byte in mac) if mac else None,
+            )
+        )
+    return sorted(interfaces, key=lambda interface: interface.ifindex)
+
+
+def parse_wiphy_iftypes(messages):
+    # A split wiphy dump spreads one phy over several messages; merge them per wiphy index.
+    iftypes = {}
+    for _, _, _, payload in messages:
+        attributes = parse_attributes(payload, GENL_HEADER.size)
+        if NL80211_ATTR_WIPHY not in attributes:
+            continue
+        supported = iftypes.setdefault(_u32(attributes[NL80211_ATTR_WIPHY]), set())
+        if NL80211_ATTR_SUPPORTED_IFTYPES in attributes:
+            supported.update(parse_attributes(attributes[NL80211_ATTR_SUPPORTED_IFTYPES]))
+    return iftypes
+
+
+def select_p2p_interfaces(interfaces, wiphy_iftypes):
+    return [interface for interface in interfaces if wiphy_iftypes.get(interface.wiphy, set()) & P2P_IFTYPES]
+
+
+class GenericNetlink:
+    def __init__(self):
+        self._socket = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_GENERIC)
+        self._socket.bind((0, 0))
+        self._seq = 0
+
+    def close(self):
+        self._socket.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        self.close()
+        return False
+
+    def request(self, family, command, attributes=b"", flags=NLM_F_ACK):
+        self._seq += 1
+        seq = self._seq
+        payload = GENL_HEADER.pack(command, 1, 0) + attributes
+        header = NLMSG_HEADER.pack(NLMSG_HEADER.size + len(payload), family, NLM_F_REQUEST | flags, seq, 0)
+        self._socket.send(header + payload)
+
+        replies = []
+        while True:
+            data = self._socket.recv(RECV_BUFFER_SIZE)
+            for msg_type, msg_flags, msg_seq, body in parse_messages(data):
+                if msg_seq != seq:
+                    continue
+                if msg_type == NLMSG_DONE:
+                    return replies
+                if msg_type == NLMSG_ERROR:
+                    error = struct.unpack_from("=i", body)[0]
+                    if error:
+                        raise NetlinkError(-error, os.strerror(-error))
+                    return replies
+                replies.append((msg_type, msg_flags, msg_seq, body))
+                if not msg_flags & NLM_F_MULTI and not flags & NLM_F_DUMP:
+                    return replies
+
+    def family_id(self, name):
+        replies = self.request(
+            GENL_ID_CTRL,
+            CTRL_CMD_GETFAMILY,
+            pack_attribute(CTRL_ATTR_FAMILY_NAME, name.encode() + b"\0"),
+        )
+        for _, _, _, payload in replies:
+            attributes = parse_attributes(payload, GENL_HEADER.size)
+            if CTRL_ATTR_FAMILY_ID in attributes:
+                return struct.unpack_from("=H", attributes[CTRL_ATTR_FAMILY_ID])[0]
+        raise NetlinkError(f"Generic netlink family {name} not found.")
+
+
+def query_p2p_interfaces():
+    with GenericNetlink() as genl:
+        nl80211 = genl.family_id("nl80211")
+        interfaces = parse_interfaces(genl.request(nl80211, NL80211_CMD_GET_INTERFACE, flags=NLM_F_DUMP))
+        wiphys = parse_wiphy_iftypes(
+            genl.request(
+                nl80211,
+                NL80211_CMD_GET_WIPHY,
+                pack_attribute(NL80211_ATTR_SPLIT_WIPHY_DUMP, b""),
+                flags=NLM_F_DUMP,
+            )
+        )
+    return select_p2p_interfaces(interfaces, wiphys)
+
+
+def parse_link_events(data):
+    events = []
+    for msg_type, _, _, payload in parse_messages(data):
+        if msg_type in (RTM_NEWLINK, RTM_DELLINK) and len(payload) >= IFINFO_HEADER.size:
+            events.append((msg_type, IFINFO_HEADER.unpack_from(payload)[2]))
+    return events
+
+
+class LinkMonitor:
+    # Calls on_change once per batch of rtnetlink link messages, e.g. when an adapter is plugged in or removed.
+    def __init__(self, on_change):
+        self.on_change = on_change
+        self._socket = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    def start(self):
+        sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+        try:
+            sock.bind((0, RTMGRP_LINK))
+        except OSError:
+            sock.close()
+            raise
+        sock.settimeout(1.0)
+        self._socket = sock
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread and self._thread.is_alive():
+            self._thread.join(timeout=2.0)
+        if self._socket:
+            self._socket.close()
+            self._socket = None
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                events = parse_link_events(self._socket.recv(RECV_BUFFER_SIZE))
+                self._socket.setblocking(False)
+                try:
+                    while True:
+                        events.extend(parse_link_events(self._socket.recv(RECV_BUFFER_SIZE)))
+                except BlockingIOError:
+                    pass
+                finally:
+                    self._socket.settimeout(1.0)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            if events:
+                try:
+                    self.on_change(events)
+                except Exception as exc:
+                    logger.debug("Link change handler failed: %s", exc)
@@ -0,0 +1,257 @@
+import itertools
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+
+from dexonlinux.utils import get_logger
+
+logger = get_logger()
+
+HELPER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "root_helper.py")
+# sudo with a wrong password gives up after PAM's delay; this only guards against a hung sudo.
+HELPER_START_TIMEOUT = 30.0
+# Stopping NetworkManager is the slowest request.
+REQUEST_TIMEOUT = 60.0
+MAX_MESSAGE = 65536
+
+
+class HelperError(RuntimeError):
+    pass
+
+
+def decode(data):
+    if not data:
+        return {}
+    message = json.loads(data)
+    if not isinstance(message, dict):
+        raise ValueError(f"expected an object, got {type(message).__name__}")
+    return message
+
+
+class HelperProcess:
+    # Stands in for the Popen of a process the helper spawned. It is the helper's child, not ours, so it
+    # cannot be waited on here; the helper reaps it and reports the return code over the socket.
+    def __init__(self, helper, pid, name):
+        self.helper = helper
+        self.pid = pid
+        self.name = name
+        self.returncode = None
+        self._exited = threading.Event()
+        self._watchers = []
+        self._lock = threading.Lock()
+
+    def _set_exited(self, returncode):
+        with self._lock:
+            if self._exited.is_set():
+                return
+            self.returncode = returncode
+            self._exited.set()
+            watchers, self._watchers = self._watchers, []
+        for watcher in watchers:
+            watcher(returncode)
+
+    def watch_exit(self, callback):
+        # callback(returncode) runs once, on the helper's reader thread, or right away if the process is gone.
+        with self._lock:
+            if not self._exited.is_set():
+                self._watchers.append(callback)
+                return
+        callback(self.returncode)
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self, timeout=None):
+        if not self._exited.wait(timeout):
+            raise subprocess.TimeoutExpired(self.name, timeout)
+        return self.returncode
+
+    def terminate(self):
+        self._signal("SIGTERM")
+
+    def kill(self):
+        self._signal("SIGKILL")
+
+    def _signal(self, name):
+        if self.returncode is not None:
+            return
+        try:
+            self.helper.request("signal", pid=self.pid, signal=name)
+        except HelperError as exc:
+            # It may have been reaped between the check and the request.
+            if self.returncode is None:
+                logger.debug("Could not send %s to %s: %s", name, self.name, exc)
+
+
+class PrivilegedHelper:
+    # Client for root_helper.py: sudo runs once to start it, and every privileged operation afterwards is a
+    # request on a socketpair instead of another sudo process, so no password or sudo timestamp is needed
+    # later on. A reader thread matches replies to requests and delivers the exits of spawned processes.
+    def __init__(self):
+        self._channel = None
+        self._sudo = None
+        self._reader = None
+        self._closing = False
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._processes = {}
+        self._early_exits = {}
+        self._lock = threading.Lock()
+
+    @property
+    def running(self):
+        return self._channel is not None and not self._closing
+
+    def start(self, sudo_prefix, password, timeout=HELPER_START_TIMEOUT):
+        # Returns False when sudo refuses the password. -k makes sudo check it even with a cached timestamp.
+        parent, child = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        try:
+            process = subprocess.Popen(
+                [*sudo_prefix, "-k", sys.executable, "-I", HELPER_PATH],
+                stdin=subprocess.PIPE,
+                stdout=child,
+                stderr=subprocess.DEVNULL,
+                text=True,
+            )
+        except OSError:
+            parent.close()
+            raise
+        finally:
+            child.close()
+        try:
+            process.stdin.write(password)
+            process.stdin.close()
+        except BrokenPipeError:
+            pass
+
+        parent.settimeout(timeout)
+        try:
+            ready = decode(parent.recv(MAX_MESSAGE))
+        except (OSError, ValueError):
+            ready = {}
+        if ready.get("event") != "ready":
+            parent.close()
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+            return False
+        parent.settimeout(None)
+        self._channel = parent
+        self._sudo = process
+        self._reader = threading.Thread(target=self._read, name="privileged-helper", daemon=True)
+        self._reader.start()
+        logger.debug("Privileged helper started, pid %s.", ready.get("pid"))
+        return True
+
+    def request(self, operation, fds=(), **params):
+        slot = [threading.Event(), None]
+        with self._lock:
+            if not self.running:
+                raise HelperError("The privileged helper is not running.")
+            request_id = next(self._ids)
+            self._pending[request_id] = slot
+            message = json.dumps({"id": request_id, "op": operation, **params}).encode()
+            try:
+                if fds:
+                    socket.send_fds(self._channel, [message], list(fds))
+                else:
+                    self._channel.send(message)
+            except OSError as exc:
+                self._pending.pop(request_id, None)
+                raise HelperError(f"The privileged helper is not reachable: {exc}") from exc
+        if not slot[0].wait(REQUEST_TIMEOUT):
+            with self._lock:
+                self._pending.pop(request_id, None)
+            raise HelperError(f"The privileged helper did not answer {operation} within {REQUEST_TIMEOUT:.0f} s.")
+        reply = slot[1]
+        if reply is None:
+            raise HelperError("The privileged helper exited.")
+        if "error" in reply:
+            raise HelperError(reply["error"])
+        return reply
+
+    def spawn(self, program, fds=(), **params):
+        reply = self.request("spawn", fds, program=program, **params)
+        process = HelperProcess(self, reply["pid"], program)
+        with self._lock:
+            returncode = self._early_exits.pop(process.pid, None)
+            if returncode is None:
+                self._processes[process.pid] = process
+        if returncode is not None:
+            process._set_exited(returncode)
+        return process
+
+    def _read(self):
+        while True:
+            try:
+                data = self._channel.recv(MAX_MESSAGE)
+            except OSError:
+                data = b""
+            if not data:
+                break
+            try:
+                message = decode(data)
+            except ValueError as exc:
+                # A truncated or garbled message leaves the channel out of step; treat it as the helper dying.
+                logger.error("Unreadable message from the privileged helper (%s); disconnecting it.", exc)
+                with self._lock:
+                    self._closing = True
+                try:
+                    self._channel.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+                break
+            if "id" in message:
+                with self._lock:
+                    slot = self._pending.pop(message["id"], None)
+                if slot is not None:
+                    slot[1] = message
+                    slot[0].set()
+            elif message.get("event") == "exited":
+                with self._lock:
+                    process = self._processes.pop(message["pid"], None)
+                    if process is None:
+                        # The exit overtook the reply to the spawn request.
+                        self._early_exits[message["pid"]] = message["returncode"]
+                if process is not None:
+                    process._set_exited(message["returncode"])
+
+        with self._lock:
+            closing = self._closing
+            self._closing = True
+            pending, self._pending = list(self._pending.values()), {}
+            processes, self._processes = list(self._processes.values()), {}
+        if not closing:
+            logger.error("The privileged helper exited unexpectedly.")
+        for slot in pending:
+            slot[0].set()
+        # The helper stops what it spawned when it goes away.
+        for process in processes:
+            process._set_exited(-1)
+
+    def close(self, timeout=5.0):
+        # The helper stops anything still running once its socket closes, then exits.
+        with self._lock:
+            if self._channel is None or self._closing:
+                channel = None
+            else:
+                channel = self._channel
+            self._closing = True
+        if channel is not None:
+            try:
+                channel.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        if self._reader is not None:
+            self._reader.join(timeout)
+        if self._sudo is not None:
+            try:
+                self._sudo.wait(timeout)
+            except subprocess.TimeoutExpired:
+                logger.debug("The privileged helper did not exit within %.0f s.", timeout)
+        if self._channel is not None:
+            self._channel.close()
+            self._channel = None
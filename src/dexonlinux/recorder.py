@@ -0,0 +1,94 @@
+import logging
+import os
+import threading
+import time
+from collections import deque
+from pathlib import Path
+
+# Records kept; at MAX_TEXT characters each this bounds the buffer to a few megabytes.
+CAPACITY = 4096
+# Longer texts (a 4 KB PTY chunk) keep their head and tail.
+MAX_TEXT = 512
+# Automatic dumps closer together than this are skipped, so a crash loop cannot fill the disk.
+DUMP_INTERVAL = 60.0
+
+
+def default_dump_dir():
+    base = os.environ.get("XDG_STATE_HOME") or os.path.join(os.path.expanduser("~"), ".local", "state")
+    return Path(base) / "dexonlinux"
+
+
+class FlightRecorder:
+    # Always on: each record is a (monotonic ns, kind, text) tuple appended to a bounded deque, which is
+    # atomic under the GIL, so the PTY, scrcpy and adb threads record without locks or formatting.
+    def __init__(self, capacity=CAPACITY):
+        self._records = deque(maxlen=capacity)
+        self._wall_offset = time.time() - time.monotonic()
+        self._dump_lock = threading.Lock()
+        self._last_dump = None
+        self.dump_dir = default_dump_dir()
+        self.enabled = True
+
+    def record(self, kind, text):
+        if len(text) > MAX_TEXT:
+            text = f"{text[: MAX_TEXT // 2]} [...] {text[-MAX_TEXT // 2 :]}"
+        self._records.append((time.monotonic_ns(), kind, text))
+
+    def snapshot(self):
+        # list() of a deque can race an append from another thread; retry rather than lock the writers.
+        for _ in range(3):
+            try:
+                return list(self._records)
+            except RuntimeError:
+                continue
+        return []
+
+    def dump(self, reason, force=False):
+        # Returns the file written, or None when disabled, throttled or unwritable.
+        if not self.enabled:
+            return None
+        with self._dump_lock:
+            now = time.monotonic()
+            if not force and self._last_dump is not None and now - self._last_dump < DUMP_INTERVAL:
+                return None
+            self._last_dump = now
+        records = self.snapshot()
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        path = self.dump_dir / f"flight-{stamp}-{os.getpid()}.log"
+        try:
+            self.dump_dir.mkdir(parents=True, exist_ok=True)
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w", errors="replace") as dump_file:
+                dump_file.write(f"# DexOnLinux flight recorder, pid {os.getpid()}: {reason}\n")
+                dump_file.write(f"# {len(records)} records, oldest first\n")
+                for stamp_ns, kind, text in records:
+                    wall = self._wall_offset + stamp_ns / 1e9
+                    clock = time.strftime("%H:%M:%S", time.localtime(wall)) + f".{int(wall * 1000) % 1000:03d}"
+                    body = text.replace("\r\n", "\n").replace("\r", "\n").rstrip().replace("\n", "\n" + " " * 22)
+                    dump_file.write(f"{clock} {kind:<8} {body}\n")
+        except OSError:
+            return None
+        return path
+
+
+class RecorderHandler(logging.Handler):
+    # Keeps the application's own INFO and louder messages next to the raw output they explain.
+    def __init__(self, recorder, level=logging.INFO):
+        super().__init__(level)
+        self.recorder = recorder
+
+    def handle(self, record):
+        if record.levelno >= self.level:
+            self.recorder.record("log", f"{record.levelname} {record.getMessage()}")
+        return True
+
+
+_recorder = FlightRecorder()
+
+
+def get_recorder():
+    return _recorder
+
+
+def record(kind, text):
+    _recorder.record(kind, text)
@@ -0,0 +1,239 @@
+# The privileged half of DexOnLinux, started once through sudo and reached over the SOCK_SEQPACKET
+# socketpair it gets as stdout. It only imports the standard library and only accepts the requests below,
+# each rebuilt into a fixed command line here, never taken from the client as argv:
+#
+#   services       systemctl start/stop of NetworkManager, wpa_supplicant or wpa_supplicant@IFACE.service
+#   nm_managed     nmcli device set IFACE managed yes/no
+#   supplicant     busctl GetInterface/RemoveInterface/CreateInterface on wpa_supplicant's D-Bus API
+#   spawn          miracle-wifid or miracle-sinkctl, the latter on a PTY slave passed with SCM_RIGHTS
+#   signal         SIGTERM/SIGKILL to a process this helper spawned
+#
+# Requests are JSON objects with an "id"; each reply carries the same id. Spawned processes are reaped here
+# and reported with an "exited" event. When the client goes away, every spawned process is stopped.
+import json
+import os
+import re
+import signal
+import socket
+import subprocess
+import sys
+import threading
+
+MAX_MESSAGE = 65536
+MAX_OUTPUT = 16384
+STOP_TIMEOUT = 2.0
+INTERFACE_PATTERN = re.compile(r"^[A-Za-z0-9_.:-]{1,15}$")
+OBJECT_PATH_PATTERN = re.compile(r"^/fi/w1/wpa_supplicant1/Interfaces/\d+$")
+NETWORK_SERVICES = ("NetworkManager", "wpa_supplicant")
+WPA_SUPPLICANT_BUS = ["fi.w1.wpa_supplicant1", "/fi/w1/wpa_supplicant1", "fi.w1.wpa_supplicant1"]
+SIGNALS = {"SIGTERM": signal.SIGTERM, "SIGKILL": signal.SIGKILL}
+
+
+class RequestError(Exception):
+    pass
+
+
+def interface_name(value):
+    if not isinstance(value, str) or not INTERFACE_PATTERN.match(value):
+        raise RequestError(f"invalid interface name: {value!r}")
+    return value
+
+
+def service_unit(value):
+    if value in NETWORK_SERVICES:
+        return value
+    if isinstance(value, str) and value.startswith("wpa_supplicant@") and value.endswith(".service"):
+        interface_name(value[len("wpa_supplicant@") : -len(".service")])
+        return value
+    raise RequestError(f"service not allowed: {value!r}")
+
+
+def wifid_command(request, fds):
+    command = ["miracle-wifid"]
+    if request.get("interface") is not None:
+        command += ["--interface", interface_name(request["interface"])]
+    return command, None
+
+
+def sinkctl_command(request, fds):
+    port = request.get("port")
+    if not isinstance(port, int) or not 0 < port < 65536:
+        raise RequestError(f"invalid port: {port!r}")
+    if len(fds) != 1:
+        raise RequestError("miracle-sinkctl needs its PTY")
+    return ["miracle-sinkctl", "--external-player", "true", "--port", str(port), "--audio", "1"], fds[0]
+
+
+PROGRAMS = {"miracle-wifid": wifid_command, "miracle-sinkctl": sinkctl_command}
+
+
+def encode(message):
+    # The client reads at most MAX_MESSAGE bytes per datagram, and JSON escapes can make a character take
+    # six, so command output is cut down (keeping its end) until the encoded reply fits.
+    data = json.dumps(message).encode()
+    while len(data) > MAX_MESSAGE and message.get("output"):
+        output = message["output"]
+        message = {**message, "output": output[len(output) // 2 + 1 :]}
+        data = json.dumps(message).encode()
+    return data
+
+
+class Helper:
+    def __init__(self, channel):
+        self.channel = channel
+        self.children = {}
+        self._send_lock = threading.Lock()
+        self._children_lock = threading.Lock()
+
+    def send(self, message):
+        data = encode(message)
+        with self._send_lock:
+            self.channel.send(data)
+
+    def serve(self):
+        # Whatever ends this loop, even a bug, the spawned processes must not outlive the helper.
+        try:
+            self.send({"event": "ready", "pid": os.getpid()})
+            while True:
+                try:
+                    data, fds, _, _ = socket.recv_fds(self.channel, MAX_MESSAGE, 1)
+                except OSError:
+                    break
+                if not data:
+                    break
+                try:
+                    request = json.loads(data)
+                except ValueError:
+                    request = None
+                if not isinstance(request, dict):
+                    for fd in fds:
+                        os.close(fd)
+                    continue
+                # Services can take seconds to stop; everything else answers at once.
+                if request.get("op") in ("services", "nm_managed", "supplicant"):
+                    threading.Thread(target=self.handle, args=(request, fds), daemon=True).start()
+                else:
+                    self.handle(request, fds)
+        finally:
+            self.stop_children()
+
+    def handle(self, request, fds):
+        reply = {"id": request.get("id")}
+        try:
+            operation = getattr(self, "op_" + str(request.get("op")), None)
+            if operation is None:
+                raise RequestError(f"unknown request: {request.get('op')!r}")
+            reply.update(operation(request, fds))
+        except RequestError as exc:
+            reply["error"] = str(exc)
+        except Exception as exc:
+            # Every request gets its reply; a client waiting on one that never comes blocks for a minute.
+            reply["error"] = f"{type(exc).__name__}: {exc}"
+        finally:
+            for fd in fds:
+                os.close(fd)
+        try:
+            self.send(reply)
+        except OSError:
+            pass
+
+    @staticmethod
+    def run(command):
+        result = subprocess.run(command, stdin=subprocess.DEVNULL, capture_output=True, text=True, check=False)
+        return {"returncode": result.returncode, "output": (result.stdout + result.stderr)[-MAX_OUTPUT:]}
+
+    def op_services(self, request, fds):
+        action = request.get("action")
+        if action not in ("start", "stop"):
+            raise RequestError(f"invalid service action: {action!r}")
+        units = request.get("units")
+        if not isinstance(units, list):
+            raise RequestError(f"services must be a list, got {units!r}")
+        units = [service_unit(unit) for unit in units]
+        if not units:
+            raise RequestError("no services given")
+        return self.run(["systemctl", action, *units])
+
+    def op_nm_managed(self, request, fds):
+        managed = "yes" if request.get("managed") else "no"
+        return self.run(["nmcli", "device", "set", interface_name(request.get("interface")), "managed", managed])
+
+    def op_supplicant(self, request, fds):
+        method = request.get("method")
+        if method == "GetInterface":
+            arguments = ["s", interface_name(request.get("interface"))]
+        elif method == "CreateInterface":
+            arguments = ["a{sv}", "1", "Ifname", "s", interface_name(request.get("interface"))]
+        elif method == "RemoveInterface":
+            path = request.get("path")
+            if not isinstance(path, str) or not OBJECT_PATH_PATTERN.match(path):
+                raise RequestError(f"invalid interface path: {path!r}")
+            arguments = ["o", path]
+        else:
+            raise RequestError(f"method not allowed: {method!r}")
+        return self.run(["busctl", "call", *WPA_SUPPLICANT_BUS, method, *arguments])
+
+    def op_spawn(self, request, fds):
+        build = PROGRAMS.get(request.get("program"))
+        if build is None:
+            raise RequestError(f"program not allowed: {request.get('program')!r}")
+        command, terminal = build(request, fds)
+        stdio = terminal if terminal is not None else subprocess.DEVNULL
+        # A session of its own, so CTRL+C in DexOnLinux's terminal reaches DexOnLinux only; it stops these in order.
+        process = subprocess.Popen(command, stdin=stdio, stdout=stdio, stderr=stdio, close_fds=True, start_new_session=True)
+        with self._children_lock:
+            self.children[process.pid] = process
+        threading.Thread(target=self.reap, args=(process,), daemon=True).start()
+        return {"pid": process.pid}
+
+    def op_signal(self, request, fds):
+        signum = SIGNALS.get(request.get("signal"))
+        if signum is None:
+            raise RequestError(f"signal not allowed: {request.get('signal')!r}")
+        with self._children_lock:
+            process = self.children.get(request.get("pid"))
+        if process is None:
+            raise RequestError(f"not a process of this helper: {request.get('pid')!r}")
+        if process.poll() is None:
+            process.send_signal(signum)
+        return {}
+
+    def reap(self, process):
+        returncode = process.wait()
+        with self._children_lock:
+            self.children.pop(process.pid, None)
+        try:
+            self.send({"event": "exited", "pid": process.pid, "returncode": returncode})
+        except OSError:
+            pass
+
+    def stop_children(self):
+        with self._children_lock:
+            children = list(self.children.values())
+        for process in children:
+            if process.poll() is None:
+                process.terminate()
+        for process in children:
+            try:
+                process.wait(STOP_TIMEOUT)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+
+def main():
+    # The channel arrives as stdout; fd 1 then points at /dev/null so a stray write cannot corrupt it.
+    channel = socket.socket(fileno=os.dup(1))
+    devnull = os.open(os.devnull, os.O_RDWR)
+    os.dup2(devnull, 1)
+    os.close(devnull)
+    # CTRL+C goes to the whole foreground process group; DexOnLinux decides when this helper stops.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    helper = Helper(channel)
+    signal.signal(signal.SIGTERM, lambda signum, frame: channel.shutdown(socket.SHUT_RDWR))
+    helper.serve()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+import struct
+import time
+
+RTP_HEADER = struct.Struct("!BBHII")
+RTP_EXTENSION = struct.Struct("!HH")
+# WFD carries MPEG-TS (payload type 33), which uses a 90 kHz RTP clock.
+RTP_CLOCK_RATE = 90000
+MAX_DROPOUT = 3000
+MAX_MISORDER = 100
+SEQ_MOD = 1 << 16
+BITRATE_WINDOW_NS = 1_000_000_000
+
+
+# Sequence and jitter bookkeeping follow RFC 3550 appendix A.1 and A.8.
+class RtpStats:
+    def __init__(self, clock_rate=RTP_CLOCK_RATE):
+        self.clock_rate = clock_rate
+        self.reset()
+
+    def reset(self, ssrc=None):
+        self.ssrc = ssrc
+        self.packets = 0
+        self.bytes = 0
+        self.invalid_packets = 0
+        self.reordered = 0
+        self.jitter = 0.0
+        self.bitrate = 0.0
+        self.started_at = None
+        self.last_packet_at = None
+        self._base_seq = None
+        self._max_seq = 0
+        self._cycles = 0
+        self._transit = None
+        self._window_start = None
+        self._window_bytes = 0
+
+    @property
+    def expected(self):
+        if self._base_seq is None:
+            return 0
+        return self._cycles + self._max_seq - self._base_seq + 1
+
+    @property
+    def lost(self):
+        return max(0, self.expected - self.packets)
+
+    @property
+    def loss_ratio(self):
+        expected = self.expected
+        return self.lost / expected if expected else 0.0
+
+    @property
+    def jitter_ms(self):
+        return self.jitter * 1000 / self.clock_rate
+
+    def add_packet(self, buffer, size, arrival_ns):
+        # Returns the offset of the RTP payload, or -1 when the datagram is not RTP.
+        if size < RTP_HEADER.size:
+            self.invalid_packets += 1
+            return -1
+        flags, _, seq, timestamp, ssrc = RTP_HEADER.unpack_from(buffer, 0)
+        if flags >> 6 != 2:
+            self.invalid_packets += 1
+            return -1
+
+        offset = RTP_HEADER.size + 4 * (flags & 0x0F)
+        if flags & 0x10 and offset + RTP_EXTENSION.size <= size:
+            offset += RTP_EXTENSION.size + 4 * RTP_EXTENSION.unpack_from(buffer, offset)[1]
+        if offset > size:
+            self.invalid_packets += 1
+            return -1
+
+        if ssrc != self.ssrc:
+            self.reset(ssrc)
+        if self._base_seq is None:
+            self._base_seq = seq
+            self._max_seq = seq
+            self.started_at = arrival_ns
+            self._window_start = arrival_ns
+        else:
+            self._update_seq(seq)
+
+        self.packets += 1
+        self.bytes += size
+        self.last_packet_at = arrival_ns
+        self._update_jitter(timestamp, arrival_ns)
+        self._update_bitrate(size, arrival_ns)
+        return offset
+
+    def _update_seq(self, seq):
+        delta = (seq - self._max_seq) % SEQ_MOD
+        if 0 < delta < MAX_DROPOUT:
+            if seq < self._max_seq:
+                self._cycles += SEQ_MOD
+            self._max_seq = seq
+        elif delta >= SEQ_MOD - MAX_MISORDER:
+            self.reordered += 1
+        elif delta:
+            # A jump this large means the sender restarted its sequence; start counting again.
+            self._base_seq = seq
+            self._max_seq = seq
+            self._cycles = 0
+            self.packets = 0
+
+    def _update_jitter(self, timestamp, arrival_ns):
+        arrival = arrival_ns * self.clock_rate // 1_000_000_000
+        transit = (arrival - timestamp) % (1 << 32)
+        if self._transit is not None:
+            delta = transit - self._transit
+            if delta > 1 << 31:
+                delta -= 1 << 32
+            elif delta < -(1 << 31):
+                delta += 1 << 32
+            self.jitter += (abs(delta) - self.jitter) / 16
+        self._transit = transit
+
+    def _update_bitrate(self, size, arrival_ns):
+        self._window_bytes += size
+        elapsed = arrival_ns - self._window_start
+        if elapsed >= BITRATE_WINDOW_NS:
+            self.bitrate = self._window_bytes * 8 * 1_000_000_000 / elapsed
+            self._window_start = arrival_ns
+            self._window_bytes = 0
+
+    def snapshot(self):
+        now = time.monotonic_ns()
+        idle = self.last_packet_at is None or now - self.last_packet_at >= 2 * BITRATE_WINDOW_NS
+        return {
+            "ssrc": self.ssrc,
+            "packets": self.packets,
+            "bytes": self.bytes,
+            "expected": self.expected,
+            "lost": self.lost,
+            "loss_ratio": self.loss_ratio,
+            "reordered": self.reordered,
+            "invalid_packets": self.invalid_packets,
+            "jitter_ms": self.jitter_ms,
+            "bitrate_bps": 0.0 if idle else self.bitrate,
+        }
+
+    def summary(self):
+        return (
+            f"{self.packets} packets, {self.lost} lost ({self.loss_ratio:.2%}), "
+            f"{self.reordered} reordered, jitter {self.jitter_ms:.1f} ms, {self.bitrate / 1e6:.1f} Mbit/s"
+        )
@@ -0,0 +1,180 @@
+import os
+
+AUTO_PROFILE = "auto"
+PROFILE_OPTIONS = ("video_codec", "video_encoder", "max_size", "max_fps", "video_bit_rate", "video_buffer", "audio", "audio_codec", "audio_bit_rate", "audio_buffer")
+INT_OPTIONS = ("max_size", "max_fps", "video_buffer", "audio_buffer")
+BOOL_OPTIONS = ("audio",)
+BIT_RATE_OPTIONS = ("video_bit_rate", "audio_bit_rate")
+BIT_RATE_SUFFIXES = {"K": 1_000, "M": 1_000_000, "G": 1_000_000_000}
+
+# Values use scrcpy's own units: sizes in pixels, bit rates as scrcpy parses them (8M, 64K), buffers in ms.
+# None leaves the option to scrcpy's default. All three use H.264, the cheapest codec to decode in software.
+PROFILES = {
+    # Native size and no buffering, for hosts that decode the DeX stream with headroom to spare.
+    "low-latency": {
+        "video_codec": "h264",
+        "max_size": None,
+        "max_fps": 60,
+        "video_bit_rate": "12M",
+        "video_buffer": 0,
+        # Profiles tune latency and bandwidth, not what is forwarded; turning audio off takes an explicit option.
+        "audio": True,
+    },
+    # Scales 1440p and larger DeX displays down to 1920 and smooths jitter with a short buffer.
+    "balanced": {
+        "video_codec": "h264",
+        "max_size": 1920,
+        "max_fps": 60,
+        "video_bit_rate": "8M",
+        "video_buffer": 50,
+        "audio": True,
+        "audio_buffer": 50,
+    },
+    # A quarter of the pixels per second of 1080p60, for weak decoders and crowded Wi-Fi.
+    "low-bandwidth": {
+        "video_codec": "h264",
+        "max_size": 1280,
+        "max_fps": 30,
+        "video_bit_rate": "2M",
+        "video_buffer": 100,
+        "audio": True,
+        "audio_codec": "opus",
+        "audio_bit_rate": "64K",
+        "audio_buffer": 100,
+    },
+}
+# Hosts with fewer logical CPUs than this have little headroom decoding 1080p60 in software.
+WEAK_HOST_CPUS = 4
+# Longest display side that low-latency streams at native size.
+NATIVE_MAX_SIDE = 1920
+SMALL_MAX_SIDE = 1280
+
+
+def auto_profile(sink_size=None, display=None, cpu_count=None):
+    # Returns (name, reason). The larger of the negotiated stream and the phone's DeX display decides,
+    # since scrcpy mirrors the display at its own size regardless of what Miraclecast negotiated.
+    sides = [side for side in (*(sink_size or ()), *((display.width, display.height) if display else ())) if side]
+    if not sides:
+        return "balanced", "resolution unknown"
+    long_side = max(sides)
+    cpus = cpu_count or os.cpu_count() or 1
+    if long_side <= SMALL_MAX_SIDE:
+        return "low-latency", f"{long_side} px display"
+    if cpus < WEAK_HOST_CPUS:
+        return "low-bandwidth", f"{long_side} px display on a {cpus}-CPU host"
+    if long_side <= NATIVE_MAX_SIDE:
+        return "low-latency", f"{long_side} px display"
+    return "balanced", f"{long_side} px display"
+
+
+def parse_bit_rate(value):
+    # Bits per second from scrcpy's notation (8M, 64K, 1G), also taking fractions such as 1.5M.
+    text = str(value).strip().upper()
+    scale = BIT_RATE_SUFFIXES.get(text[-1:], 1)
+    if scale != 1:
+        text = text[:-1]
+    bits = int(float(text) * scale)
+    if bits <= 0:
+        raise ValueError(f"bit rate must be positive, got {value!r}")
+    return bits
+
+
+def format_bit_rate(bits):
+    # scrcpy only takes whole numbers before the suffix.
+    if bits % 1_000_000 == 0:
+        return f"{bits // 1_000_000}M"
+    return f"{max(1, round(bits / 1_000))}K"
+
+
+def parse_option(text):
+    # KEY=VALUE as given to --scrcpy-option; keys accept dashes like scrcpy's flags.
+    key, separator, value = text.partition("=")
+    key = key.strip().replace("-", "_")
+    if not separator:
+        raise ValueError(f"expected KEY=VALUE, got {text!r}")
+    return key, coerce_option(key, value.strip())
+
+
+def coerce_option(key, value):
+    if key not in PROFILE_OPTIONS:
+        raise ValueError(f"unknown scrcpy option {key!r}; expected one of {', '.join(PROFILE_OPTIONS)}")
+    if value is None or (isinstance(value, str) and value.lower() in ("", "none", "default")):
+        return None
+    if key in BOOL_OPTIONS:
+        if isinstance(value, bool):
+            return value
+        if str(value).lower() in ("1", "true", "yes", "on"):
+            return True
+        if str(value).lower() in ("0", "false", "no", "off"):
+            return False
+        raise ValueError(f"{key} expects on or off, got {value!r}")
+    if key in INT_OPTIONS:
+        try:
+            number = int(value)
+        except (TypeError, ValueError):
+            raise ValueError(f"{key} expects a whole number, got {value!r}") from None
+        if number < 0:
+            raise ValueError(f"{key} cannot be negative")
+        return number
+    if key in BIT_RATE_OPTIONS:
+        try:
+            return format_bit_rate(parse_bit_rate(value))
+        except (OverflowError, ValueError):
+            raise ValueError(f"{key} expects a bit rate such as 8M, 64K or 1.5G, got {value!r}") from None
+    return str(value)
+
+
+class ScrcpyProfile:
+    def __init__(self, name, options, reason=""):
+        self.name = name
+        self.options = options
+        self.reason = reason
+
+    def args(self):
+        options = self.options
+        args = []
+        for key in ("video_codec", "video_encoder", "max_size", "max_fps", "video_bit_rate"):
+            if options.get(key):
+                args.append(f"--{key.replace('_', '-')}={options[key]}")
+        if options.get("video_buffer"):
+            args.append(f"--video-buffer={options['video_buffer']}")
+        if options.get("audio") is False:
+            args.append("--no-audio")
+            return args
+        for key in ("audio_codec", "audio_bit_rate", "audio_buffer"):
+            if options.get(key):
+                args.append(f"--{key.replace('_', '-')}={options[key]}")
+        return args
+
+    def describe(self):
+        details = [f"{key}={value}" for key, value in self.options.items() if value is not None]
+        return f"{self.name} ({', '.join(details)})"
+
+
+class ScrcpyTuning:
+    # Chooses the profile for each scrcpy launch. Precedence, lowest first: the profile's own values,
+    # the config file's "options", then --scrcpy-option; the profile itself comes from --scrcpy-profile,
+    # else the config file's "profile", else auto_profile for the resolution DeX just reported.
+    def __init__(self, profile=None, overrides=None, config=None):
+        config = config or {}
+        if not isinstance(config, dict):
+            raise ValueError('the "scrcpy" config section must be an object')
+        self.profiles = {name: dict(options) for name, options in PROFILES.items()}
+        for name, options in (config.get("profiles") or {}).items():
+            options = dict(options)
+            base = options.pop("base", "balanced")
+            if base not in self.profiles:
+                raise ValueError(f"profile {name!r} is based on unknown profile {base!r}")
+            self.profiles[name] = {**self.profiles[base], **{key: coerce_option(key, value) for key, value in options.items()}}
+        self.requested = profile or config.get("profile") or AUTO_PROFILE
+        if self.requested != AUTO_PROFILE and self.requested not in self.profiles:
+            raise ValueError(f"unknown scrcpy profile {self.requested!r}; expected {AUTO_PROFILE} or one of {', '.join(self.profiles)}")
+        self.overrides = {key: coerce_option(key, value) for key, value in (config.get("options") or {}).items()}
+        self.overrides.update(overrides or {})
+
+    def select(self, sink_size=None, display=None):
+        if self.requested == AUTO_PROFILE:
+            name, reason = auto_profile(sink_size, display)
+        else:
+            name, reason = self.requested, "requested"
+        return ScrcpyProfile(name, {**self.profiles[name], **self.overrides}, reason)
@@ -0,0 +1,176 @@
+import asyncio
+
+from dexonlinux.commands import CommandError
+from dexonlinux.connection_handler import ConnectionHandler
+from dexonlinux.eventloop import process_exited
+from dexonlinux.utils import get_logger
+
+logger = get_logger()
+
+
+class SessionSpec:
+    def __init__(self, interface, device, display_id=None, port=None):
+        self.interface = interface
+        self.device = device
+        self.display_id = display_id
+        self.port = port
+        self.interface_index = None
+
+    @property
+    def label(self):
+        return f"{self.interface}/{self.device}"
+
+
+def parse_session_spec(text):
+    # IFACE:SERIAL[:DISPLAY_ID]; the serial itself may contain colons (adb over TCP uses host:port).
+    interface, separator, rest = text.partition(":")
+    if not interface or not separator or not rest:
+        raise ValueError(f"expected IFACE:SERIAL[:DISPLAY_ID], got {text!r}")
+    device, separator, display = rest.rpartition(":")
+    if separator and display.isdigit():
+        return SessionSpec(interface, device, int(display))
+    return SessionSpec(interface, rest)
+
+
+class SessionManager:
+    # Runs one ConnectionHandler and one miracle-sinkctl per spec on the current event loop. Sessions share
+    # the sudo context and adb client in commands, the profile cache and the single miracle-wifid; each has
+    # its own interface, PTY, UDP port, scrcpy window and display choice.
+    def __init__(self, commands, specs, *, on_event=None, **handler_options):
+        self.commands = commands
+        self.specs = list(specs)
+        self.on_event = on_event
+        self.handler_options = handler_options
+        self.handlers = []
+        self.sinkctl_processes = []
+        self._prompt_lock = asyncio.Lock()
+
+    @property
+    def multiple(self):
+        return len(self.specs) > 1
+
+    def create_handlers(self):
+        for spec in self.specs:
+            options = dict(self.handler_options)
+            if spec.display_id is not None:
+                options["display_id"] = spec.display_id
+            handler = ConnectionHandler(
+                self.commands,
+                spec.device,
+                spec.port,
+                label=spec.label if self.multiple else None,
+                prompt_lock=self._prompt_lock,
+                on_event=self._event_forwarder(spec),
+                **options,
+            )
+            self.handlers.append(handler)
+            handler.prepare()
+        return self.handlers
+
+    def _event_forwarder(self, spec):
+        if self.on_event is None:
+            return None
+        if not self.multiple:
+            return self.on_event
+
+        def forward(name, data):
+            self.on_event(name, {"session": spec.label, **data})
+
+        return forward
+
+    async def start(self, wifi_process):
+        if not self.handlers:
+            self.create_handlers()
+        # Started side by side: each sinkctl waits on its own link, so N sessions cost one startup, not N.
+        results = await asyncio.gather(
+            *(
+                self.commands.start_miracle_sinkctl(
+                    spec.interface_index,
+                    spec.port,
+                    event_callback=self._event_callback(spec, handler),
+                    wifi_process=wifi_process,
+                )
+                for spec, handler in zip(self.specs, self.handlers)
+            ),
+            return_exceptions=True,
+        )
+        errors = [result for result in results if isinstance(result, BaseException)]
+        self.sinkctl_processes = [result for result in results if not isinstance(result, BaseException)]
+        if errors:
+            raise errors[0]
+
+    def _event_callback(self, spec, handler):
+        if not self.multiple:
+            return handler.handle_sinkctl_event
+
+        def on_event(event):
+            logger.debug("[%s] sinkctl event %s", spec.label, event.name)
+            handler.handle_sinkctl_event(event)
+
+        return on_event
+
+    def session_processes(self):
+        # (spec, handler, sinkctl process or None) for each session, for liveness checks.
+        for index, (spec, handler) in enumerate(zip(self.specs, self.handlers)):
+            sinkctl = self.sinkctl_processes[index] if index < len(self.sinkctl_processes) else None
+            yield spec, handler, sinkctl
+
+    def sinkctl_exits(self):
+        return [process_exited(process) for process in self.sinkctl_processes]
+
+    def status(self):
+        if not self.multiple and self.handlers:
+            return self.handlers[0].status()
+        return {"sessions": [{"session": spec.label, **handler.status()} for spec, handler in zip(self.specs, self.handlers)]}
+
+    def pause(self):
+        for handler in self.handlers:
+            handler.pause()
+
+    def resume(self):
+        for handler in self.handlers:
+            handler.resume()
+
+    async def close(self):
+        await asyncio.gather(*(handler.close() for handler in self.handlers), return_exceptions=True)
+
+    def stop(self):
+        for handler in self.handlers:
+            handler.stop()
+        for process in self.sinkctl_processes:
+            self.commands.terminate_process(process, "miracle-sinkctl")
+        self.commands.close_sinkctl()
+
+
+def assign_ports(commands, specs, requested_port=None):
+    used = set()
+    for spec in specs:
+        port = spec.port or requested_port
+        while port is None or port in used:
+            port = commands.get_available_udp_port()
+        spec.port = port
+        used.add(port)
+        requested_port = None
+
+
+def validate_specs(commands, specs, available=None, adb_devices=None):
+    interfaces = [spec.interface for spec in specs]
+    duplicated = {name for name in interfaces if interfaces.count(name) > 1}
+    if duplicated:
+        raise CommandError(f"Each session needs its own interface; repeated: {', '.join(sorted(duplicated))}")
+    devices = [spec.device for spec in specs]
+    duplicated = {serial for serial in devices if devices.count(serial) > 1}
+    if duplicated:
+        raise CommandError(f"Each session needs its own ADB device; repeated: {', '.join(sorted(duplicated))}")
+
+    if available is None:
+        available = commands.get_p2p_interfaces()
+    missing = [name for name in interfaces if name not in available]
+    if missing:
+        raise CommandError(f"Not P2P-capable or not present: {', '.join(missing)}. Available: {', '.join(available) or 'none'}")
+    if adb_devices is None:
+        adb_devices = commands.list_adb_devices()
+    authorized = {device.serial for device in adb_devices if device.is_authorized}
+    missing = [serial for serial in devices if serial not in authorized]
+    if missing:
+        raise CommandError(f"ADB devices not connected or not authorized: {', '.join(missing)}")
@@ -0,0 +1,65 @@
+import re
+
+# Longest unterminated line kept between reads; sinkctl lines are far shorter.
+MAX_PENDING_LINE = 4096
+
+SINKCTL_EVENT_PATTERN = re.compile(
+    r"(?P<resolution>SINK set resolution\s+(?P<width>\d{3,5})x(?P<height>\d{3,5}))"
+    r"|(?P<peer_connected>\[CONNECT\] Peer:|now running on peer)"
+    r"|(?P<connected>NOTICE: SINK connected)"
+    r"|(?P<disconnected>no longer running on (?:peer|link)|Transport endpoint is not connected|SINK disconnected)"
+    r"|(?P<link_added>\[ADD\]\s+Link:\s+(?P<link>\S+))"
+)
+LINE_SPLIT_PATTERN = re.compile(r"\r\n|\r|\n")
+# sinkctl colors its [ADD]/[CONNECT] tags when attached to a terminal, which our PTY is.
+ANSI_ESCAPE_PATTERN = re.compile(r"\x1b\[[0-9;?]*[A-Za-z]")
+
+
+class SinkctlEvent:
+    def __init__(self, name, **data):
+        self.name = name
+        self.data = data
+
+
+def _resolution_event(match):
+    width = int(match.group("width"))
+    height = int(match.group("height"))
+    return SinkctlEvent("resolution", width=width, height=height, resolution=f"{width}x{height}")
+
+
+EVENT_FACTORIES = {
+    "resolution": _resolution_event,
+    "peer_connected": lambda match: SinkctlEvent("peer_connected"),
+    "connected": lambda match: SinkctlEvent("connected"),
+    "disconnected": lambda match: SinkctlEvent("disconnected"),
+    "link_added": lambda match: SinkctlEvent("link_added", link=match.group("link")),
+}
+
+
+class SinkctlParser:
+    # Turns raw sinkctl output into events, one line at a time. The unterminated tail
+    # of each read is carried over, so a line split across two PTY reads is seen once, whole.
+    def __init__(self):
+        self._pending = ""
+
+    def feed(self, text):
+        lines = LINE_SPLIT_PATTERN.split(self._pending + text)
+        self._pending = lines.pop()[-MAX_PENDING_LINE:]
+        return self._parse_lines(lines)
+
+    def flush(self):
+        pending = self._pending
+        self._pending = ""
+        return self._parse_lines((pending,))
+
+    @staticmethod
+    def _parse_lines(lines):
+        events = []
+        search = SINKCTL_EVENT_PATTERN.search
+        for line in lines:
+            if "\x1b" in line:
+                line = ANSI_ESCAPE_PATTERN.sub("", line)
+            match = search(line)
+            if match:
+                events.append(EVENT_FACTORIES[match.lastgroup](match))
+        return events
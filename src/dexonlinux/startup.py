@@ -0,0 +1,113 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from dexonlinux.timeline import span
+
+STARTUP_WORKERS = 4
+
+
+class StartupGraph:
+    # Setup steps form a small dependency graph: each one is queued on the worker pool as soon as the steps it
+    # names in `after` are done, so probing the interfaces and the adb server overlaps the sudo prompt. Steps
+    # that need the terminal run on the main thread through prompt(), which also keeps their time apart from
+    # the time DexOnLinux itself spends starting up.
+    def __init__(self, workers=STARTUP_WORKERS, started=None):
+        self.started = time.monotonic() if started is None else started
+        self.prompt_time = 0.0
+        self._steps = {}
+        self._workers = workers
+        self._queue = queue.SimpleQueue()
+        # Daemon workers, like run_blocking: a probe stuck on a slow adb server cannot hold up exit after CTRL+C.
+        for index in range(workers):
+            threading.Thread(target=self._work, name=f"startup-{index}", daemon=True).start()
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            job()
+
+    def add(self, name, function, *, after=()):
+        step = Future()
+        self._steps[name] = step
+        dependencies = [self._steps[dependency] for dependency in after]
+        pending = [len(dependencies)]
+        lock = threading.Lock()
+
+        def execute():
+            if not step.set_running_or_notify_cancel():
+                return
+            try:
+                with span(f"startup.{name}"):
+                    result = function(*(dependency.result() for dependency in dependencies))
+            except BaseException as exc:
+                step.set_exception(exc)
+            else:
+                step.set_result(result)
+
+        def ready(dependency):
+            failed = not dependency.cancelled() and dependency.exception() is not None
+            with lock:
+                if step.done():
+                    return
+                pending[0] -= 1
+                if failed:
+                    # The dependent never runs; asking for it raises what went wrong upstream.
+                    step.set_exception(dependency.exception())
+                    return
+                if pending[0]:
+                    return
+            self._queue.put(execute)
+
+        if not dependencies:
+            self._queue.put(execute)
+        for dependency in dependencies:
+            dependency.add_done_callback(ready)
+        return step
+
+    def prompt(self, name, function, *args):
+        # Runs an interactive step on the calling thread and publishes its result to the steps that need it.
+        step = Future()
+        step.set_running_or_notify_cancel()
+        self._steps[name] = step
+        begin = time.monotonic()
+        try:
+            result = function(*args)
+        except BaseException as exc:
+            step.set_exception(exc)
+            raise
+        finally:
+            self.prompt_time += time.monotonic() - begin
+        step.set_result(result)
+        return result
+
+    def waiting(self, function, *args):
+        # For prompts whose result no step depends on, such as the interface menu.
+        begin = time.monotonic()
+        try:
+            return function(*args)
+        finally:
+            self.prompt_time += time.monotonic() - begin
+
+    def result(self, name):
+        return self._steps[name].result()
+
+    def close(self):
+        # Steps still queued are dropped; the workers exit once their current step returns.
+        for step in self._steps.values():
+            step.cancel()
+        for _ in range(self._workers):
+            self._queue.put(None)
+        self._workers = 0
+
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    def summary(self):
+        elapsed = self.elapsed()
+        if self.prompt_time >= 0.05:
+            return f"Ready in {elapsed:.2f} s ({elapsed - self.prompt_time:.2f} s excluding {self.prompt_time:.2f} s at prompts)."
+        return f"Ready in {elapsed:.2f} s."
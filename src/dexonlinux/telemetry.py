@@ -0,0 +1,150 @@
+import re
+import time
+from collections import deque
+
+# scrcpy --print-fps logs once per second: "INFO: 58 fps" or "INFO: 41 fps (+17 frames skipped)".
+FPS_LINE = re.compile(r"\b(\d+) fps(?: \(\+(\d+) frames? skipped\))?")
+TEXTURE_LINE = re.compile(r"Texture: (\d+)x(\d+)")
+ENCODER_LINE = re.compile(r"Using video encoder: '([^']+)'")
+RENDERER_LINE = re.compile(r"Renderer: (\S+)")
+DEVICE_LINE = re.compile(r"Device: (.+)$")
+# MediaCodec encoder names carry the codec's short name.
+ENCODER_CODECS = (("avc", "h264"), ("h264", "h264"), ("hevc", "h265"), ("h265", "h265"), ("av1", "av1"))
+# Seconds covered by the short and long windows kept for each scrcpy launch.
+SHORT_WINDOW = 10
+LONG_WINDOW = 60
+
+
+def parse_fps_line(text):
+    # Returns (rendered, skipped) for an fps report, None for any other scrcpy line.
+    match = FPS_LINE.search(text)
+    if match is None:
+        return None
+    return int(match.group(1)), int(match.group(2) or 0)
+
+
+class RollingWindow:
+    # Values from the last `seconds`, timestamped with time.monotonic() unless a time is given.
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self._samples = deque()
+
+    def add(self, value, now=None):
+        now = time.monotonic() if now is None else now
+        self._samples.append((now, value))
+        self._trim(now)
+
+    def _trim(self, now):
+        while self._samples and self._samples[0][0] <= now - self.seconds:
+            self._samples.popleft()
+
+    def values(self, now=None):
+        self._trim(time.monotonic() if now is None else now)
+        return [value for _, value in self._samples]
+
+    def __len__(self):
+        return len(self._samples)
+
+
+class ScrcpyTelemetry:
+    # Structured view of one scrcpy launch, built from its --print-fps reports and startup lines.
+    def __init__(self, profile=None, on_fps=None):
+        self.on_fps = on_fps
+        self.profile = profile.name if profile else None
+        options = profile.options if profile else {}
+        self.codec = options.get("video_codec")
+        self.encoder = options.get("video_encoder")
+        self.size = None
+        self.renderer = None
+        self.device = None
+        self.rendered_total = 0
+        self.skipped_total = 0
+        self.started = time.monotonic()
+        self.windows = {seconds: RollingWindow(seconds) for seconds in (SHORT_WINDOW, LONG_WINDOW)}
+
+    def feed_line(self, text):
+        # Returns True for fps reports, which are too frequent to log one by one.
+        sample = parse_fps_line(text)
+        if sample is not None:
+            self.record_fps(*sample)
+            return True
+        match = TEXTURE_LINE.search(text)
+        if match:
+            self.size = (int(match.group(1)), int(match.group(2)))
+            return False
+        match = ENCODER_LINE.search(text)
+        if match:
+            self.encoder = match.group(1)
+            if self.codec is None:
+                name = self.encoder.lower()
+                self.codec = next((codec for marker, codec in ENCODER_CODECS if marker in name), None)
+            return False
+        match = RENDERER_LINE.search(text)
+        if match:
+            self.renderer = match.group(1)
+            return False
+        match = DEVICE_LINE.search(text)
+        if match and self.device is None:
+            self.device = match.group(1).strip()
+        return False
+
+    def record_fps(self, rendered, skipped, now=None):
+        self.rendered_total += rendered
+        self.skipped_total += skipped
+        for window in self.windows.values():
+            window.add((rendered, skipped), now)
+        if self.on_fps is not None:
+            self.on_fps(rendered, skipped)
+
+    def window_stats(self, seconds, now=None):
+        samples = self.windows[seconds].values(now)
+        if not samples:
+            return None
+        rendered = [sample[0] for sample in samples]
+        skipped = sum(sample[1] for sample in samples)
+        frames = sum(rendered) + skipped
+        return {
+            "seconds": len(samples),
+            "fps": round(sum(rendered) / len(samples), 1),
+            "fps_min": min(rendered),
+            "fps_max": max(rendered),
+            "skipped": skipped,
+            "skipped_ratio": round(skipped / frames, 4) if frames else 0.0,
+        }
+
+    def snapshot(self, now=None):
+        return {
+            "profile": self.profile,
+            "codec": self.codec,
+            "encoder": self.encoder,
+            "size": f"{self.size[0]}x{self.size[1]}" if self.size else None,
+            "renderer": self.renderer,
+            "device": self.device,
+            "uptime": round(time.monotonic() - self.started, 1),
+            "rendered": self.rendered_total,
+            "skipped": self.skipped_total,
+            **{f"last_{seconds}s": self.window_stats(seconds, now) for seconds in self.windows},
+        }
+
+    def status_line(self, now=None):
+        # e.g. "balanced 1920x1080 h264 c2.exynos.h264.encoder | 10 s: 58.4 fps (min 51) 0.8% skipped | 60 s: 59.1 fps 0.3% skipped"
+        head = " ".join(
+            part
+            for part in (
+                self.profile,
+                f"{self.size[0]}x{self.size[1]}" if self.size else "size unknown",
+                self.codec or "default codec",
+                self.encoder,
+            )
+            if part
+        )
+        parts = [head]
+        for seconds in self.windows:
+            stats = self.window_stats(seconds, now)
+            if stats is None:
+                continue
+            text = f"{seconds} s: {stats['fps']:.1f} fps"
+            if seconds == SHORT_WINDOW:
+                text += f" (min {stats['fps_min']})"
+            parts.append(f"{text} {stats['skipped_ratio'] * 100:.1f}% skipped")
+        return " | ".join(parts)
@@ -0,0 +1,131 @@
+import json
+import os
+import threading
+import time
+
+TRACE_FORMATS = ("chrome", "json")
+
+# Pairs of phases whose distance is reported per session in the trace summary.
+SESSION_METRICS = {
+    "time_to_first_frame": ("dex.connected", "scrcpy.first_frame"),
+    "time_to_window": ("dex.connected", "scrcpy.window"),
+    "connect_to_scrcpy_spawn": ("dex.connected", "scrcpy.spawn"),
+    "peer_to_connected": ("dex.peer_connected", "dex.connected"),
+}
+
+_timeline = None
+
+
+class _Span:
+    __slots__ = ("timeline", "name", "args", "start")
+
+    def __init__(self, timeline, name, args):
+        self.timeline = timeline
+        self.name = name
+        self.args = args
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.monotonic_ns()
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        if exc_type is not None:
+            self.args["error"] = exc_type.__name__
+        self.timeline.record(self.name, self.start, time.monotonic_ns(), self.args)
+        return False
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, traceback):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Timeline:
+    def __init__(self):
+        self.origin = time.monotonic_ns()
+        self.wall_origin = time.time()
+        self.events = []
+
+    def record(self, name, start, end=None, args=None):
+        # list.append is atomic, so phases can be recorded from any thread without a lock.
+        self.events.append((name, start, end, threading.current_thread().name, args or {}))
+
+    def occurrences(self, name):
+        return [start for event_name, start, _, _, _ in self.events if event_name == name]
+
+    def summary(self):
+        summary = {}
+        for metric, (begin_name, end_name) in SESSION_METRICS.items():
+            ends = sorted(self.occurrences(end_name))
+            values = []
+            for begin in sorted(self.occurrences(begin_name)):
+                end = next((end for end in ends if end >= begin), None)
+                if end is not None:
+                    values.append(round((end - begin) / 1e6, 3))
+            if values:
+                summary[f"{metric}_ms"] = values
+        return summary
+
+    def to_json(self):
+        events = []
+        for name, start, end, thread, args in sorted(self.events, key=lambda event: event[1]):
+            entry = {"name": name, "start_ms": round((start - self.origin) / 1e6, 3), "thread": thread}
+            if end is not None:
+                entry["duration_ms"] = round((end - start) / 1e6, 3)
+            if args:
+                entry["args"] = args
+            events.append(entry)
+        return {"started_at": self.wall_origin, "events": events, "summary": self.summary()}
+
+    def to_chrome_trace(self):
+        pid = os.getpid()
+        threads = {}
+        trace_events = []
+        for name, start, end, thread, args in sorted(self.events, key=lambda event: event[1]):
+            tid = threads.setdefault(thread, len(threads) + 1)
+            entry = {"name": name, "cat": name.split(".", 1)[0], "ts": (start - self.origin) / 1e3, "pid": pid, "tid": tid}
+            if end is None:
+                entry.update(ph="i", s="p")
+            else:
+                entry.update(ph="X", dur=(end - start) / 1e3)
+            if args:
+                entry["args"] = args
+            trace_events.append(entry)
+        for thread, tid in threads.items():
+            trace_events.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": thread}})
+        return {"traceEvents": trace_events, "displayTimeUnit": "ms", "otherData": self.summary()}
+
+    def write(self, path, trace_format="chrome"):
+        data = self.to_chrome_trace() if trace_format == "chrome" else self.to_json()
+        with open(path, "w", encoding="utf-8") as trace_file:
+            json.dump(data, trace_file, indent=1)
+
+
+def enable_tracing():
+    global _timeline
+    _timeline = Timeline()
+    return _timeline
+
+
+def get_timeline():
+    return _timeline
+
+
+def mark(name, **args):
+    if _timeline is not None:
+        _timeline.record(name, time.monotonic_ns(), None, args)
+
+
+def span(name, **args):
+    if _timeline is None:
+        return _NULL_SPAN
+    return _Span(_timeline, name, args)
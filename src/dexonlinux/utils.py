@@ -1,10 +1,19 @@
+import atexit
+import json
 import logging
+import logging.handlers
+import queue
+import time
 from pathlib import Path
 from colorama import Fore, Style
 
+from dexonlinux.recorder import RecorderHandler, get_recorder
+
 COLOR_ENABLED = True
 USER_LOG_FORMAT = "[%(levelname)s] %(message)s"
 DEBUG_LOG_FORMAT = "[%(levelname)s] (%(name)s) - %(message)s (%(filename)s:%(lineno)d)"
+# Records waiting for the writer thread; beyond this, new records are counted and dropped instead of blocking.
+LOG_QUEUE_SIZE = 4096
 
 def colored(text: str, color: str, style: str = "") -> str:
     if not COLOR_ENABLED:
@@ -27,10 +36,68 @@ class CustomFormatter(logging.Formatter):
         logging.CRITICAL: colored(USER_LOG_FORMAT, bold_red)
     }
 
+    def __init__(self):
+        super().__init__(USER_LOG_FORMAT)
+        self._formatters = {level: logging.Formatter(fmt) for level, fmt in self.FORMATS.items()}
+
+    def format(self, record):
+        formatter = self._formatters.get(record.levelno)
+        return formatter.format(record) if formatter else super().format(record)
+
+class JsonFormatter(logging.Formatter):
+    # One JSON object per line; "source" is the component the line came from (sinkctl, scrcpy, ...),
+    # which defaults to the module that logged it.
     def format(self, record):
-        log_fmt = self.FORMATS.get(record.levelno)
-        formatter = logging.Formatter(log_fmt)
-        return formatter.format(record)
+        entry = {
+            "time": round(record.created, 6),
+            "level": record.levelname,
+            "source": getattr(record, "source", record.module),
+            "message": record.getMessage(),
+        }
+        session = getattr(record, "session", None)
+        if session:
+            entry["session"] = session
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    # Never blocks the thread that logs: a full queue drops the record and counts it, and the writer is told
+    # how many were lost as soon as there is room again.
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+        self._unreported = 0
+
+    def handle(self, record):
+        # queue.Queue is thread-safe on its own, so the handler lock the base class takes is skipped. Formatting
+        # happens on the writer thread; the record only crosses threads, never processes, so it is queued as is.
+        allowed = self.filter(record)
+        if allowed:
+            self.enqueue(record)
+        return allowed
+
+    def enqueue(self, record):
+        try:
+            if self._unreported:
+                self.queue.put_nowait(logging.makeLogRecord({
+                    "name": logger.name,
+                    "levelno": logging.WARNING,
+                    "levelname": "WARNING",
+                    "msg": "Dropped %d log records while logging was overloaded.",
+                    "args": (self._unreported,),
+                    "source": "logging",
+                }))
+                self._unreported = 0
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            self._unreported += 1
+
+class LogWriter(logging.handlers.QueueListener):
+    # The writer thread. Stopping waits for room in a full queue rather than failing, so nothing queued is lost.
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
 
 logger = logging.getLogger("dexonlinux")
 logger.setLevel(logging.INFO)
@@ -38,12 +105,18 @@ logger.propagate = False
 _console_handler = logging.StreamHandler()
 _console_handler.setFormatter(CustomFormatter())
 logger.addHandler(_console_handler)
+_recorder_handler = RecorderHandler(get_recorder())
+logger.addHandler(_recorder_handler)
+_queue_handler = None
+_listener = None
 
 def get_logger():
     return logger
 
-def configure_logger(debug=False, no_color=False, log_file=None):
-    global COLOR_ENABLED
+def configure_logger(debug=False, no_color=False, log_file=None, json_file=None):
+    # Console, file and JSON handlers all run on one writer thread behind a bounded queue, so the
+    # threads and event loop that log never wait on a terminal or a disk.
+    global COLOR_ENABLED, _queue_handler, _listener
     COLOR_ENABLED = not no_color
     logger.setLevel(logging.DEBUG if debug else logging.INFO)
     if debug:
@@ -51,11 +124,50 @@ def configure_logger(debug=False, no_color=False, log_file=None):
     else:
         _console_handler.setFormatter(CustomFormatter() if COLOR_ENABLED else logging.Formatter(USER_LOG_FORMAT))
 
+    handlers = [_console_handler]
     if log_file:
         file_handler = logging.FileHandler(log_file)
         file_handler.setFormatter(logging.Formatter(DEBUG_LOG_FORMAT))
         file_handler.setLevel(logging.DEBUG)
-        logger.addHandler(file_handler)
+        handlers.append(file_handler)
+    if json_file:
+        json_handler = logging.FileHandler(json_file)
+        json_handler.setFormatter(JsonFormatter())
+        json_handler.setLevel(logging.DEBUG)
+        handlers.append(json_handler)
+
+    stop_log_writer()
+    _queue_handler = DroppingQueueHandler(queue.Queue(LOG_QUEUE_SIZE))
+    _listener = LogWriter(_queue_handler.queue, *handlers, respect_handler_level=True)
+    _listener.start()
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(_queue_handler)
+    logger.addHandler(_recorder_handler)
+
+def dropped_log_records():
+    return _queue_handler.dropped if _queue_handler else 0
+
+def flush_logs(timeout=1.0):
+    # Lets queued lines reach the terminal before a prompt or banner is printed after them.
+    if _queue_handler is None:
+        return
+    log_queue = _queue_handler.queue
+    deadline = time.monotonic() + timeout
+    with log_queue.all_tasks_done:
+        while log_queue.unfinished_tasks:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+            log_queue.all_tasks_done.wait(remaining)
+
+@atexit.register
+def stop_log_writer():
+    # Writes out whatever is still queued; registered after logging's own atexit hook, so it runs first.
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
 
 def print_ascii_art():
     art = r"""
@@ -65,6 +177,7 @@ def print_ascii_art():
      | |_| |  __/>  <| |_| | | | | |___| | | | | |_| |>  < 
      |____/ \___/_/\_\\___/|_| |_|_____|_|_| |_|\__,_/_/\_\
     """
+    flush_logs()
     border = "═" * 70
     print(colored(f"\n╔{border}╗", Fore.LIGHTYELLOW_EX))
     for line in art.splitlines():
@@ -88,6 +201,7 @@ def select_from_list(
     allow_refresh: bool = False,
 ):
     while True:
+        flush_logs()
         print()
         print(colored(prompt, Fore.LIGHTWHITE_EX))
         for idx, item in enumerate(items):
@@ -110,6 +224,7 @@ def select_from_list(
             logger.error("Please enter a valid number.")
 
 def confirm(prompt, default=False):
+    flush_logs()
     suffix = "Y/n" if default else "y/N"
     choice = input(f"{prompt} [{suffix}] ").strip().lower()
     if not choice:
@@ -117,6 +232,7 @@ def confirm(prompt, default=False):
     return choice in ("y", "yes")
 
 def print_adb_instructions():
+    flush_logs()
     print(colored("ADB Connection Instructions:", Fore.LIGHTWHITE_EX, Style.BRIGHT))
     print()
     print(f"1. Connect your device to your PC via USB and enable USB Debugging in the developer options.")
@@ -126,6 +242,7 @@ def print_adb_instructions():
     input(colored("Press Enter when you are ready to continue...\n", Fore.LIGHTYELLOW_EX))
 
 def print_dex_instructions():
+    flush_logs()
     print(colored("DeX Connection Instructions:", Fore.LIGHTWHITE_EX, Style.BRIGHT))
     print()
     print(f"1. Open DeX on your device.")